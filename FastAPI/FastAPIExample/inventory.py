@@ -1,7 +1,13 @@
-from fastapi import FastAPI, HTTPException, Body
-from pydantic import BaseModel
-from typing import List, Annotated
+from fastapi import FastAPI, HTTPException, Body, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, TypeAdapter
+from typing import Dict, Annotated, List
+from contextlib import asynccontextmanager
+from bisect import bisect_left, bisect_right, insort
+import base64
+import json
 import os
+import threading
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -15,62 +21,251 @@ class Item(BaseModel):
     tax: float | None = 12.5
     amount: int  # Quantity of the item
 
-# Model for inventory
+# Model for inventory; items are keyed by name (dicts keep insertion order) for O(1) lookup
 class Inventory(BaseModel):
     name: str | None = "Shufersal"
-    items: List[Item] = []
+    items: Dict[str, Item] = {}
 
 # Create a global instance of Inventory
 inventory = Inventory()
 
-# Function to load inventory from .env
+# Sorted indexes for the filtered listing: item names, and (price, name) pairs
+name_index = []
+price_index = []
+
+# Items with an amount below this are low on stock
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "10"))
+
+# Files holding the persisted inventory: a snapshot plus an append-only journal of mutations
+DATA_DIR = os.getenv("INVENTORY_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+SNAPSHOT_PATH = os.getenv("INVENTORY_SNAPSHOT", os.path.join(DATA_DIR, "inventory.snapshot"))
+JOURNAL_PATH = os.getenv("INVENTORY_JOURNAL", os.path.join(DATA_DIR, "inventory.journal"))
+
+# Number of journal records after which a fresh snapshot is written in the background
+JOURNAL_COMPACT_EVERY = int(os.getenv("JOURNAL_COMPACT_EVERY", "10000"))
+
+# Records appended since the last snapshot, and the thread writing the current one
+journal_records = 0
+compaction = None
+
+# Function to load the legacy inventory from .env
 def load_inventory_from_env():
     items = os.getenv("INVENTORY_ITEMS")
     if items:
-        inventory.items = [Item.parse_raw(item) for item in items.split(";")]
+        inventory.items = {item.name: item for item in (Item.model_validate_json(raw) for raw in items.split(";"))}
+
+# Function to rebuild the inventory from the snapshot and replay the journal on top of it
+def load_inventory():
+    # A journal set aside for a snapshot that may not have been written yet comes before the current one
+    journals = [JOURNAL_PATH + ".old", JOURNAL_PATH]
+    # Migrate from .env only when nothing was ever persisted, not when the inventory was emptied on purpose
+    migrate = not any(os.path.exists(path) for path in [SNAPSHOT_PATH, *journals])
+    items = {}
+    if os.path.exists(SNAPSHOT_PATH):
+        with open(SNAPSHOT_PATH) as f:
+            items = {data["name"]: data for data in json.load(f)}
+    for path in journals:
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            for line in f:
+                try:
+                    op, payload = json.loads(line)
+                except ValueError:
+                    break  # Torn last line from a crash mid-append
+                if op == "u":
+                    items[payload["name"]] = payload
+                else:
+                    items.pop(payload, None)
+    inventory.items = {name: Item.model_validate(data) for name, data in items.items()}
+    if migrate:
+        load_inventory_from_env()
+    name_index[:] = sorted(inventory.items)
+    price_index[:] = sorted((item.price, item.name) for item in inventory.items.values())
+    compact_journal()
+
+# Function to fold the journals into a fresh snapshot at startup (atomic rename, then truncate the journal)
+def compact_journal():
+    global journal_records
+    for path in (SNAPSHOT_PATH, JOURNAL_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_snapshot([item.model_dump() for item in inventory.items.values()], JOURNAL_PATH + ".old")
+    open(JOURNAL_PATH, "w").close()
+    journal_records = 0
+
+# Function to write a snapshot, then drop the journal it replaces; replaying that journal again is harmless
+def write_snapshot(items, replaced_journal):
+    with open(SNAPSHOT_PATH + ".tmp", "w") as f:
+        json.dump(items, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(SNAPSHOT_PATH + ".tmp", SNAPSHOT_PATH)
+    if os.path.exists(replaced_journal):
+        os.remove(replaced_journal)
+
+# Function to start a snapshot while serving: the journal is set aside and new mutations go to a fresh one,
+# so only copying the items runs on the event loop
+def start_compaction():
+    global journal_records, compaction
+    if compaction is not None and compaction.is_alive():
+        return
+    items = [item.model_dump() for item in inventory.items.values()]
+    os.replace(JOURNAL_PATH, JOURNAL_PATH + ".old")
+    journal_records = 0
+    compaction = threading.Thread(target=write_snapshot, args=(items, JOURNAL_PATH + ".old"), daemon=True)
+    compaction.start()
+
+# Function to append a single mutation to the journal; costs the same whatever the inventory size
+def append_to_journal(op, payload):
+    global journal_records
+    with open(JOURNAL_PATH, "a") as f:
+        f.write(f'["{op}",{payload}]\n')
+    journal_records += 1
+    if journal_records >= JOURNAL_COMPACT_EVERY:
+        start_compaction()
 
-# Function to save inventory to .env
-def save_inventory_to_env():
-    serialized_items = ";".join([item.json() for item in inventory.items])
-    if "INVENTORY_ITEMS" in os.environ:
-        del os.environ["INVENTORY_ITEMS"]
-    with open('.env', 'w') as f:
-        f.write('')
-    os.environ["INVENTORY_ITEMS"] = serialized_items
-    with open('.env', 'a') as f:
-        f.write(f"\nINVENTORY_ITEMS={serialized_items}")
+def save_item(item):
+    append_to_journal("u", item.model_dump_json())
 
-# Load the inventory at startup
-load_inventory_from_env()
+def delete_item(name):
+    append_to_journal("d", json.dumps(name))
 
+# Functions to keep the listing indexes in step with the items
+def index_item(item):
+    insort(name_index, item.name)
+    insort(price_index, (item.price, item.name))
 
-app = FastAPI()
+def unindex_item(item):
+    del name_index[bisect_left(name_index, item.name)]
+    del price_index[bisect_left(price_index, (item.price, item.name))]
+
+# Load the inventory at startup, not on import
+@asynccontextmanager
+async def lifespan(app):
+    load_inventory()
+    yield
+    if compaction is not None:
+        compaction.join()
+
+
+app = FastAPI(lifespan=lifespan)
 
 @app.post("/add_item/")
 async def add_item(item: Item):
-    for existing_item in inventory.items:
-        if existing_item.name == item.name:
-            existing_item.amount += item.amount
-            save_inventory_to_env()
-            return {"message": f"Item '{item.name}' quantity updated to {existing_item.amount}"}
-    
-    inventory.items.append(item)
-    save_inventory_to_env()
+    existing_item = inventory.items.get(item.name)
+    if existing_item is not None:
+        existing_item.amount += item.amount
+        save_item(existing_item)
+        return {"message": f"Item '{item.name}' quantity updated to {existing_item.amount}"}
+
+    inventory.items[item.name] = item
+    index_item(item)
+    save_item(item)
     return {"message": "Item added successfully", "item": item}
 
 @app.post("/buy_item/")
 async def buy_item(name: Annotated[str, Body()], amount: Annotated[int, Body()]):
-    for item in inventory.items:
-        if item.name == name:
-            if item.amount < amount:
-                raise HTTPException(status_code=400, detail="Not enough items in stock")
-            item.amount -= amount
-            if item.amount == 0:
-                inventory.items.remove(item)
-            save_inventory_to_env()
-            return {"message": f"{amount} units of '{item.name}' purchased successfully", "remaining": item.amount}
-    raise HTTPException(status_code=404, detail="Item not found")
-
-@app.get("/items/")
-async def get_items():
-    return inventory.items
+    item = inventory.items.get(name)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    if item.amount < amount:
+        raise HTTPException(status_code=400, detail="Not enough items in stock")
+    item.amount -= amount
+    if item.amount == 0:
+        del inventory.items[name]
+        unindex_item(item)
+        delete_item(name)
+    else:
+        save_item(item)
+    return {"message": f"{amount} units of '{item.name}' purchased successfully", "remaining": item.amount}
+
+items_json = TypeAdapter(List[Item])
+
+# Function to walk the name index (or the price index when a price bound is given) from the first possible match
+def query_items(prefix, min_price, max_price, low_stock, after, limit):
+    by_price = min_price is not None or max_price is not None
+    if by_price:
+        start = 0 if min_price is None else bisect_left(price_index, (min_price,))
+        if after is not None:
+            start = max(start, bisect_right(price_index, tuple(after)))
+    else:
+        start = 0 if prefix is None else bisect_left(name_index, prefix)
+        if after is not None:
+            start = max(start, bisect_right(name_index, after[0]))
+    page = []
+    for position in range(start, len(price_index if by_price else name_index)):
+        if by_price:
+            price, name = price_index[position]
+            if max_price is not None and price > max_price:
+                break
+            if prefix is not None and not name.startswith(prefix):
+                continue
+        else:
+            name = name_index[position]
+            if prefix is not None and not name.startswith(prefix):
+                break
+        item = inventory.items[name]
+        if low_stock and item.amount >= LOW_STOCK_THRESHOLD:
+            continue
+        page.append(item)
+        if len(page) == limit:
+            break
+    return page, (lambda item: [item.price, item.name]) if by_price else (lambda item: [item.name])
+
+def encode_cursor(sort_key):
+    return base64.urlsafe_b64encode(json.dumps(sort_key).encode()).decode()
+
+# Function to decode a cursor, checking it has the shape of the listing's sort keys: [price, name] or [name]
+def decode_cursor(cursor, by_price):
+    try:
+        sort_key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Malformed cursor")
+    if by_price:
+        valid = (
+            isinstance(sort_key, list) and len(sort_key) == 2 and isinstance(sort_key[0], (int, float))
+            and not isinstance(sort_key[0], bool) and isinstance(sort_key[1], str)
+        )
+    else:
+        valid = isinstance(sort_key, list) and len(sort_key) == 1 and isinstance(sort_key[0], str)
+    if not valid:
+        raise HTTPException(status_code=400, detail="Cursor does not match this listing")
+    return sort_key
+
+@app.get("/items/", response_model=List[Item], responses={200: {"content": {"application/x-ndjson": {}}}})
+async def get_items(
+    request: Request,
+    accept: str | None = Header(default=None),
+    prefix: str | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    low_stock: bool = False,
+    cursor: str | None = None,
+    limit: int | None = Query(default=None, ge=1, le=1000),
+):
+    after = decode_cursor(cursor, min_price is not None or max_price is not None) if cursor is not None else None
+    filtered = prefix is not None or min_price is not None or max_price is not None or low_stock
+    if "application/x-ndjson" in (accept or ""):
+        # Stream page by page, writing items as they are read, up to limit items when one is given
+        async def stream(after, remaining):
+            while remaining is None or remaining > 0:
+                chunk = 1000 if remaining is None else min(remaining, 1000)
+                page, sort_key = query_items(prefix, min_price, max_price, low_stock, after, chunk)
+                if page:
+                    yield "".join(item.model_dump_json() + "\n" for item in page)
+                if len(page) < chunk:
+                    return
+                after = sort_key(page[-1])
+                if remaining is not None:
+                    remaining -= len(page)
+        return StreamingResponse(stream(after, limit), media_type="application/x-ndjson")
+    if not filtered and after is None and limit is None:
+        return Response(content=items_json.dump_json(list(inventory.items.values())), media_type="application/json")
+
+    limit = limit or 100
+    page, sort_key = query_items(prefix, min_price, max_price, low_stock, after, limit)
+    headers = {}
+    if len(page) == limit:
+        headers["Link"] = f'<{request.url.include_query_params(cursor=encode_cursor(sort_key(page[-1])))}>; rel="next"'
+    return Response(content=items_json.dump_json(page), media_type="application/json", headers=headers)
@@ -1,5 +1,9 @@
+import json
+
+import pytest
 from fastapi.testclient import TestClient
 from main import app  # Adjust the import if your FastAPI app is in a different module
+import inventory
 
 client = TestClient(app)
 
@@ -213,4 +217,89 @@ def test_read_user_item():
     # Test case 3: num1 provided, num2 not provided (default to None)
     response = client.get("/items/test_item?needy=test&num1=8")
     assert response.status_code == 200
-    assert response.json() == {"item_id": "test_item", "needy": "test", "result": 18}
\ No newline at end of file
+    assert response.json() == {"item_id": "test_item", "needy": "test", "result": 18}
+
+# Inventory-related Tests
+
+@pytest.fixture
+def start_inventory(tmp_path, monkeypatch):
+    """Start the inventory app on a data directory of its own; call again to simulate a restart."""
+    monkeypatch.setattr(inventory, "SNAPSHOT_PATH", str(tmp_path / "inventory.snapshot"))
+    monkeypatch.setattr(inventory, "JOURNAL_PATH", str(tmp_path / "inventory.journal"))
+    clients = []
+
+    def start():
+        if clients:
+            clients.pop().__exit__(None, None, None)
+        clients.append(TestClient(inventory.app).__enter__())
+        return clients[-1]
+    yield start
+    for started in clients:
+        started.__exit__(None, None, None)
+
+def test_inventory_env_is_migrated_only_on_first_start(start_inventory, monkeypatch):
+    monkeypatch.setenv("INVENTORY_ITEMS", '{"name": "milk", "price": 5, "amount": 2}')
+    inventory_client = start_inventory()
+    assert inventory_client.post("/buy_item/", json={"name": "milk", "amount": 2}).status_code == 200
+
+    # Sold out on purpose: the restart keeps the empty inventory instead of the stale .env stock
+    inventory_client = start_inventory()
+    assert inventory_client.get("/items/").json() == []
+
+def test_inventory_journal_is_folded_into_a_snapshot_while_serving(start_inventory, monkeypatch):
+    monkeypatch.setattr(inventory, "JOURNAL_COMPACT_EVERY", 3)
+    inventory_client = start_inventory()
+    for i in range(4):
+        inventory_client.post("/add_item/", json={"name": f"jam{i}", "price": 5, "amount": 2})
+    inventory.compaction.join()
+
+    # The first three records went into the snapshot; only the fourth is left in the journal
+    with open(inventory.SNAPSHOT_PATH) as f:
+        assert [item["name"] for item in json.load(f)] == ["jam0", "jam1", "jam2"]
+    with open(inventory.JOURNAL_PATH) as f:
+        assert len(f.readlines()) == 1
+    inventory_client = start_inventory()
+    assert [item["name"] for item in inventory_client.get("/items/").json()] == ["jam0", "jam1", "jam2", "jam3"]
+
+def add_catalog(inventory_client):
+    for i in range(7):
+        item = {"name": f"page-{i:02}", "price": 100 + i, "amount": 3 if i % 2 else 50}
+        assert inventory_client.post("/add_item/", json=item).status_code == 200
+
+def test_inventory_items_are_paged_and_filtered(start_inventory):
+    inventory_client = start_inventory()
+    add_catalog(inventory_client)
+    names, url = [], "/items/?prefix=page-&limit=3"
+    while url:
+        response = inventory_client.get(url)
+        names += [item["name"] for item in response.json()]
+        link = response.headers.get("link")
+        url = link[link.index("<") + 1:link.index(">")] if link else None
+    assert names == [f"page-{i:02}" for i in range(7)]
+
+    response = inventory_client.get("/items/?min_price=102&max_price=105&low_stock=true")
+    assert [item["name"] for item in response.json()] == ["page-03", "page-05"]
+    response = inventory_client.get("/items/?min_price=102&limit=2")
+    cursor = response.headers["link"].split("cursor=")[1].split(">")[0]
+    response = inventory_client.get(f"/items/?min_price=102&limit=2&cursor={cursor}")
+    assert [item["name"] for item in response.json()] == ["page-04", "page-05"]
+
+def test_inventory_items_refuse_cursors_of_another_listing(start_inventory):
+    inventory_client = start_inventory()
+    add_catalog(inventory_client)
+    assert inventory_client.get("/items/?cursor=not-a-cursor").status_code == 400
+    assert inventory_client.get("/items/?cursor=NQ==").status_code == 400  # JSON 5
+    name_cursor = inventory.encode_cursor(["page-01"])
+    assert inventory_client.get(f"/items/?min_price=100&cursor={name_cursor}").status_code == 400
+    price_cursor = inventory.encode_cursor([101, "page-01"])
+    assert inventory_client.get(f"/items/?cursor={price_cursor}").status_code == 400
+    assert inventory_client.get(f"/items/?min_price=100&cursor={inventory.encode_cursor(['x', 'y'])}").status_code == 400
+
+def test_inventory_items_stream_as_ndjson_up_to_the_limit(start_inventory):
+    inventory_client = start_inventory()
+    add_catalog(inventory_client)
+    response = inventory_client.get("/items/?prefix=page-", headers={"Accept": "application/x-ndjson"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert len(response.text.splitlines()) == 7
+    response = inventory_client.get("/items/?prefix=page-&limit=2", headers={"Accept": "application/x-ndjson"})
+    assert [json.loads(line)["name"] for line in response.text.splitlines()] == ["page-00", "page-01"]
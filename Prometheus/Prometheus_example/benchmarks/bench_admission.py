@@ -0,0 +1,91 @@
+"""
+A purchase spike with and without admission control: many clients buying at
+once while a few others poll GET / every 10 ms. Reports the latency of the polls, and the
+purchases served and shed.
+
+The purchase lane stays at --purchase-limit unless --purchase-max-limit lets it grow. Client
+and server share one event loop here, so every admitted purchase adds to the work the polls
+queue behind: latency rises with the limit and the gradient keeps raising it.
+
+    python -m benchmarks.bench_admission [--buyers 1000] [--readers 4] [--seconds 5] [--purchase-limit 8]
+                                         [--purchase-max-limit 8]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("INVENTORY_DATA_DIR", tempfile.mkdtemp())
+os.environ.setdefault("BUY_ITEM_DELAY_SECONDS", "0")
+
+import httpx  # noqa: E402
+from fastapi import FastAPI, Depends  # noqa: E402
+from prometheus_client import CollectorRegistry  # noqa: E402
+
+from prom.app import admission_lane  # noqa: E402
+from prom.main.instrumentation.admission import AdmissionControl, LaneSettings  # noqa: E402
+from prom.main.routers.items import router  # noqa: E402
+from prom.main.schemas.item import Item  # noqa: E402
+from prom.main.utils.inventory_helper import get_inventory, load_inventory  # noqa: E402
+
+
+def make_app(purchase_limit, purchase_max_limit):
+    app = FastAPI()
+    app.include_router(router, dependencies=[Depends(get_inventory)])
+    if purchase_limit:
+        AdmissionControl({
+            "read": LaneSettings(200, 20, 1000, 1000, 2),
+            "write": LaneSettings(50, 5, 200, 100, 1),
+            "purchase": LaneSettings(purchase_limit, 2, purchase_max_limit, purchase_limit, 0.5),
+        }, admission_lane, registry=CollectorRegistry()).instrument(app)
+    return app
+
+
+async def spike(app, buyers, readers, seconds):
+    deadline = time.monotonic() + seconds
+    read_latencies, statuses = [], []
+    limits = httpx.Limits(max_connections=None)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", limits=limits) as client:
+        async def buyer(i):
+            while time.monotonic() < deadline:
+                response = await client.post("/buy_item/", json={"name": f"sku{i % 100}", "amount": 1})
+                statuses.append(response.status_code)
+                if response.status_code == 503:
+                    await asyncio.sleep(float(response.headers["retry-after"]))
+
+        async def reader():
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                await client.get("/")
+                read_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(buyer(i) for i in range(buyers)), *(reader() for _ in range(readers)))
+    cuts = statistics.quantiles(read_latencies, n=100)
+    return cuts[49] * 1000, cuts[98] * 1000, statuses.count(200), statuses.count(503)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buyers", type=int, default=1000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--purchase-limit", type=int, default=8)
+    parser.add_argument("--purchase-max-limit", type=int)
+    args = parser.parse_args()
+    purchase_max_limit = args.purchase_max_limit or args.purchase_limit
+
+    inventory = load_inventory()
+    inventory.add_many([Item(name=f"sku{i}", price=1, amount=10 ** 9) for i in range(100)])
+
+    print(f"{'admission':>10} {'GET / p50 ms':>13} {'GET / p99 ms':>13} {'bought':>8} {'shed':>8}")
+    for label, limit in (("off", 0), ("on", args.purchase_limit)):
+        app = make_app(limit, purchase_max_limit)
+        p50, p99, bought, shed = asyncio.run(spike(app, args.buyers, args.readers, args.seconds))
+        print(f"{label:>10} {p50:>13.1f} {p99:>13.1f} {bought:>8} {shed:>8}")
+
+
+if __name__ == "__main__":
+    main()
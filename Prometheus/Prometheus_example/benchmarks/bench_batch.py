@@ -0,0 +1,69 @@
+"""
+Restocking and buying N SKUs one request at a time vs. one batch request.
+
+    python -m benchmarks.bench_batch [--skus 500] [--backend memory|columnar|sqlite]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI, Depends
+
+
+def make_app():
+    # Imported once main() has set the environment: the app reads its configuration on import
+    from prom.main.routers.items import router
+    from prom.main.utils.inventory_helper import get_inventory
+
+    app = FastAPI()
+    app.include_router(router, dependencies=[Depends(get_inventory)])
+    return app
+
+
+async def timed(coroutine):
+    start = time.perf_counter()
+    await coroutine
+    return time.perf_counter() - start
+
+
+async def one_at_a_time(client, prefix, skus):
+    for i in range(skus):
+        await client.post("/add_item/", json={"name": f"{prefix}{i}", "price": 10, "amount": 5})
+    for i in range(skus):
+        await client.post("/buy_item/", json={"name": f"{prefix}{i}", "amount": 1})
+
+
+async def batched(client, prefix, skus):
+    await client.post("/add_items/", json=[{"name": f"{prefix}{i}", "price": 10, "amount": 5} for i in range(skus)])
+    response = await client.post("/buy_items/", json=[{"name": f"{prefix}{i}", "amount": 1} for i in range(skus)])
+    assert response.status_code == 200
+
+
+async def compare(app, skus):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        single = await timed(one_at_a_time(client, "single-", skus))
+        batch = await timed(batched(client, "batch-", skus))
+    return single, batch
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skus", type=int, default=500)
+    parser.add_argument("--backend", choices=["memory", "columnar", "sqlite"], default="sqlite")
+    args = parser.parse_args()
+
+    os.environ.setdefault("INVENTORY_DATA_DIR", tempfile.mkdtemp())
+    os.environ["BUY_ITEM_DELAY_SECONDS"] = "0"
+    os.environ["STORAGE_BACKEND"] = args.backend
+
+    single, batch = asyncio.run(compare(make_app(), args.skus))
+    print(f"{args.skus} SKUs, add + buy, {args.backend} backend")
+    print(f"  one at a time: {single:8.3f}s ({2 * args.skus} requests)")
+    print(f"  batched:       {batch:8.3f}s (2 requests)")
+
+
+if __name__ == "__main__":
+    main()
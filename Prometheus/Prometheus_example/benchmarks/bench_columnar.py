@@ -0,0 +1,105 @@
+"""
+Memory per SKU and scan speed of the columnar inventory against a plain list
+of Item models (the original inventory) and the dict-backed InventoryStore.
+
+Scans: counting the low-stock items, the low-stock metric recount at startup,
+a page of 100 low-stock items past the first half of the catalog, and
+materializing every item as a full listing does.
+
+    python -m benchmarks.bench_columnar [--skus 100000 1000000] [--runs 5]
+"""
+import argparse
+import gc
+import statistics
+import time
+import tracemalloc
+
+from prom.main.custom_metrics.lowStockPercent import LowStockPercentage
+from prom.main.schemas.item import Item
+from prom.main.utils.columnar_store import ColumnarInventory
+from prom.main.utils.inventory_store import InventoryStore
+from prom.main.utils.storage import ItemQuery
+
+CATEGORIES = ["dairy", "bakery", "produce", "frozen", "drinks", None]
+
+
+def catalog(skus):
+    for i in range(skus):
+        yield Item(
+            name=f"sku{i:07d}", description=f"Item number {i}" if i % 4 == 0 else None, price=1 + i % 500,
+            amount=1 + i % 40, category=CATEGORIES[i % len(CATEGORIES)],
+        )
+
+
+BUILDERS = {
+    "list of Items": lambda skus: list(catalog(skus)),
+    "InventoryStore": lambda skus: InventoryStore(items=catalog(skus)),
+    "ColumnarInventory": lambda skus: ColumnarInventory(items=catalog(skus)),
+}
+
+
+def build_measured(kind, skus):
+    """The inventory and the bytes it holds, traced while building it."""
+    gc.collect()
+    tracemalloc.start()
+    inventory = BUILDERS[kind](skus)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return inventory, size
+
+
+def count_low(inventory):
+    if isinstance(inventory, list):
+        return sum(1 for item in inventory if item.amount < 10)
+    return sum(1 for amount, _ in inventory.stock_levels() if amount < 10)
+
+
+def recount(inventory):
+    LowStockPercentage(10, thresholds=(5, 20), category_thresholds={"dairy": 15}).update_inventory(inventory)
+
+
+def low_page(inventory):
+    after = (f"sku{len(inventory) // 2:07d}",)
+    if isinstance(inventory, list):
+        return [item for item in inventory if item.name > after[0] and item.amount < 10][:100]
+    return inventory.query(ItemQuery(below_amount=10), after=after, limit=100)
+
+
+def materialize(inventory):
+    return inventory if isinstance(inventory, list) else inventory.items()
+
+
+SCANS = {"count low": count_low, "recount": recount, "low page": low_page, "items()": materialize}
+
+
+def median_time(runs, scan, inventory):
+    if scan is recount and isinstance(inventory, list):
+        return None  # The metric recounts a backend, not a bare list
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        scan(inventory)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skus", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'skus':>8} {'inventory':>18} {'bytes/SKU':>10} " + " ".join(f"{name:>11}" for name in SCANS) + "  (ms)")
+    for skus in args.skus:
+        for kind in BUILDERS:
+            inventory, size = build_measured(kind, skus)
+            timings = [median_time(args.runs, scan, inventory) for scan in SCANS.values()]
+            print(f"{skus:>8} {kind:>18} {size / skus:>10.0f} " + " ".join(
+                f"{'-':>11}" if seconds is None else f"{seconds * 1000:>11.2f}" for seconds in timings
+            ))
+            del inventory
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+N parallel purchases against the in-process app.
+
+With the event loop no longer blocked, N purchases finish in about the time of one
+(storage calls are bounded by DB_POOL_SIZE).
+
+    python -m benchmarks.bench_concurrency [--parallel 1 10 50] [--delay 0.5] [--backend memory|columnar|sqlite]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI, Depends
+
+
+def make_app():
+    # Imported once main() has set the environment: the app reads its configuration on import
+    from prom.main.routers.items import router
+    from prom.main.utils.inventory_helper import get_inventory
+
+    app = FastAPI()
+    app.include_router(router, dependencies=[Depends(get_inventory)])
+    return app
+
+
+async def run(app, parallel):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/add_item/", json={"name": "bench", "price": 10, "amount": 10 ** 9})
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(
+            client.post("/buy_item/", json={"name": "bench", "amount": 1}) for _ in range(parallel)
+        ))
+        elapsed = time.perf_counter() - start
+        assert all(response.status_code == 200 for response in responses)
+        # A GET issued while purchases are in flight must not wait for them
+        pending = [asyncio.create_task(client.post("/buy_item/", json={"name": "bench", "amount": 1}))]
+        await asyncio.sleep(0.05)
+        get_start = time.perf_counter()
+        await client.get("/")
+        get_latency = time.perf_counter() - get_start
+        await asyncio.gather(*pending)
+    return elapsed, get_latency
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--parallel", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--delay", type=float, default=0.5, help="simulated purchase delay in seconds")
+    parser.add_argument("--backend", choices=["memory", "columnar", "sqlite"], default="memory")
+    args = parser.parse_args()
+
+    os.environ.setdefault("INVENTORY_DATA_DIR", tempfile.mkdtemp())
+    os.environ["BUY_ITEM_DELAY_SECONDS"] = str(args.delay)
+    os.environ["STORAGE_BACKEND"] = args.backend
+    os.environ.setdefault("DB_POOL_SIZE", str(max(args.parallel)))
+    app = make_app()
+
+    one_purchase = args.delay
+    print(f"{'parallel':>8} {'wall time':>10} {'serial would be':>16} {'GET during buys':>16}")
+    for parallel in args.parallel:
+        elapsed, get_latency = asyncio.run(run(app, parallel))
+        print(f"{parallel:>8} {elapsed:9.2f}s {parallel * one_purchase:15.2f}s {get_latency * 1000:13.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Cost of attaching trace exemplars to histogram observations: a plain observe()
+vs. observe() with trace_exemplar outside a span, in an unsampled span and in a
+sampled one.
+
+    python -m benchmarks.bench_exemplars [--observations 200000]
+"""
+import argparse
+import time
+
+from opentelemetry.sdk.trace import TracerProvider
+from prometheus_client import CollectorRegistry, Histogram
+
+from prom.main.utils.tracing import trace_exemplar
+from prom.main.utils.tracing_sdk import make_sampler
+
+
+def run(observe, observations):
+    start = time.perf_counter()
+    for _ in range(observations):
+        observe(0.05)
+    return (time.perf_counter() - start) / observations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--observations", type=int, default=200000)
+    args = parser.parse_args()
+
+    histogram = Histogram("bench_seconds", "Benchmark histogram", registry=CollectorRegistry(),
+                          buckets=[0.1, 0.5, 1, 2, 5, 10])
+
+    def with_exemplar(duration):
+        histogram.observe(duration, trace_exemplar(duration))
+
+    plain = run(histogram.observe, args.observations)
+    print(f"{'plain observe':>24}: {plain * 1e6:6.2f} us")
+    print(f"{'exemplar, no span':>24}: {run(with_exemplar, args.observations) * 1e6:6.2f} us")
+    for name, ratio in (("exemplar, unsampled span", 0.0), ("exemplar, sampled span", 1.0)):
+        tracer = TracerProvider(sampler=make_sampler(ratio)).get_tracer(__name__)
+        with tracer.start_as_current_span("request"):
+            print(f"{name:>24}: {run(with_exemplar, args.observations) * 1e6:6.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Write cost of one inventory mutation as the catalog grows.
+
+Compares the former whole-file .env rewrite with an append to the inventory journal.
+
+    python -m benchmarks.bench_journal [--sizes 10 1000 100000 1000000] [--legacy-max 100000]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from prom.main.schemas.item import Item
+from prom.main.utils.journal import InventoryJournal
+
+
+def legacy_env_rewrite(items, env_path):
+    # Same work the former save_inventory_to_env did: serialize every item and rewrite the file
+    serialized_items = ";".join([item.model_dump_json() for item in items])
+    with open(env_path, 'w') as f:
+        f.write(f"INVENTORY_ITEMS={serialized_items}\n")
+
+
+def time_per_call(func, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        func(i)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000, 1000000])
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--legacy-max", type=int, default=100000, help="largest catalog to time the legacy rewrite on")
+    args = parser.parse_args()
+
+    print(f"{'items':>10} {'journal append':>16} {'.env rewrite':>16}")
+    for size in args.sizes:
+        items = [Item(name=f"sku-{i}", price=i % 500 + 1, amount=i % 50) for i in range(size)]
+        with tempfile.TemporaryDirectory() as directory:
+            journal = InventoryJournal(directory, compact_every=10 ** 9)
+            journal.replay()
+            journal.seed(items)
+            item = items[-1]
+            append = time_per_call(lambda _: journal.record_upsert(item), args.writes)
+            journal.close()
+
+            legacy = "skipped"
+            if size <= args.legacy_max:
+                env_path = os.path.join(directory, ".env")
+                repeat = max(1, min(args.writes, 2000000 // size))
+                legacy = f"{time_per_call(lambda _: legacy_env_rewrite(items, env_path), repeat) * 1e6:13.1f} us"
+        print(f"{size:>10} {append * 1e6:13.1f} us {legacy:>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Throughput of GET / for a cold listing (serialized on every request), a warm one
+(served from the listing cache), a conditional poll answered with 304, and
+one filtered page of 100 items walked from the name index.
+
+    python -m benchmarks.bench_listing [--skus 1000 10000] [--requests 500]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("INVENTORY_DATA_DIR", tempfile.mkdtemp())
+
+import httpx  # noqa: E402
+from fastapi import FastAPI, Depends  # noqa: E402
+
+from prom.main.routers.items import router  # noqa: E402
+from prom.main.schemas.item import Item  # noqa: E402
+from prom.main.utils.functions import listing_cache  # noqa: E402
+from prom.main.utils.inventory_helper import get_inventory, load_inventory  # noqa: E402
+
+app = FastAPI()
+app.include_router(router, dependencies=[Depends(get_inventory)])
+
+
+async def measure(client, requests, headers=None, cold=False, url="/"):
+    start = time.perf_counter()
+    for _ in range(requests):
+        if cold:
+            listing_cache.clear()
+        await client.get(url, headers=headers)
+    return requests / (time.perf_counter() - start)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skus", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'SKUs':>8} {'cold':>10} {'warm':>10} {'304':>10} {'page':>10}  (requests/s)")
+    inventory = load_inventory()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for skus in args.skus:
+            inventory.add_many([Item(name=f"sku{i}", price=10, amount=5) for i in range(len(inventory), skus)])
+            etag = (await client.get("/")).headers["etag"]
+            cold = await measure(client, args.requests, cold=True)
+            warm = await measure(client, args.requests)
+            not_modified = await measure(client, args.requests, headers={"If-None-Match": etag})
+            page = await measure(client, args.requests, url="/?prefix=sku5&limit=100")
+            print(f"{skus:>8} {cold:>10.0f} {warm:>10.0f} {not_modified:>10.0f} {page:>10.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,295 @@
+"""
+Load test of both FastAPI apps: prom.app (GET /, /add_item/, /buy_item/, /metrics)
+and FastAPI/FastAPIExample/main.py (/user/, /events/{id}, /items/{id}).
+
+Every endpoint is driven by N concurrent clients, either in-process through the
+ASGI transport or over HTTP against a uvicorn server spawned for the run. The
+prom inventory is seeded with each catalog size in turn. Reports p50/p95/p99
+latency and req/s per endpoint, and writes them as JSON (with the commit they
+were measured on) so that runs can be compared across commits.
+
+    python -m benchmarks.bench_load [--apps prom example] [--modes asgi server]
+        [--concurrency 1 16 64] [--skus 100 10000] [--requests 1000]
+        [--no-stub-sleeps] [--output load.json] [--compare previous.json]
+
+Sleeps are stubbed by default: the simulated purchase delay is set to zero, so
+the numbers measure the app rather than the sleep.
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+PROM_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+EXAMPLE_DIR = os.path.abspath(os.path.join(PROM_DIR, "..", "..", "FastAPI", "FastAPIExample"))
+
+# Endpoints driven per app; the requests themselves come from make_request
+PROM_ENDPOINTS = ["GET /", "POST /add_item/", "POST /buy_item/", "GET /metrics"]
+EXAMPLE_ENDPOINTS = ["POST /user/", "PUT /events/{id}", "GET /items/{id}", "PUT /items/{id}"]
+
+USER = {"username": "ada", "email": "ada@example.com", "full_name": "Ada Lovelace"}
+EVENT = {
+    "name": "Annual Tech Conference",
+    "tags": ["technology", "conference"],
+    "videos": [{"url": "https://www.example.com/video1", "name": "Keynote Presentation"}],
+}
+
+
+def make_request(endpoint, i, skus):
+    """Method, URL and keyword arguments of the i-th request to an endpoint."""
+    sku = f"sku{random.randrange(skus)}" if skus else "sku0"
+    if endpoint == "GET /":
+        return "GET", "/", {}
+    if endpoint == "POST /add_item/":
+        return "POST", "/add_item/", {"json": {"name": sku, "price": 10, "amount": 1}}
+    if endpoint == "POST /buy_item/":
+        return "POST", "/buy_item/", {"json": {"name": sku, "amount": 1}}
+    if endpoint == "GET /metrics":
+        return "GET", "/metrics", {}
+    if endpoint == "POST /user/":
+        return "POST", "/user/", {"json": {**USER, "password": "secret"}}
+    if endpoint == "PUT /events/{id}":
+        return "PUT", f"/events/{i}", {"json": EVENT}
+    if endpoint == "GET /items/{id}":
+        return "GET", f"/items/{i}", {"params": {"needy": "yes", "num1": i}}
+    if endpoint == "PUT /items/{id}":
+        return "PUT", f"/items/{i}", {"json": {"item": {"name": sku, "price": 10}, "user": USER, "importance": 1}}
+    raise ValueError(endpoint)
+
+
+def summary(latencies, errors, elapsed):
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": cuts[49] * 1000,
+        "p95_ms": cuts[94] * 1000,
+        "p99_ms": cuts[98] * 1000,
+    }
+
+
+async def drive(client, endpoint, concurrency, requests, skus, warmup):
+    """Send ``requests`` requests to an endpoint from ``concurrency`` clients; a response >= 400 is an error."""
+    for i in range(warmup):
+        method, url, kwargs = make_request(endpoint, i, skus)
+        await client.request(method, url, **kwargs)
+
+    latencies, errors = [], 0
+    sent = 0
+
+    async def client_loop():
+        nonlocal sent, errors
+        while sent < requests:
+            i = sent
+            sent += 1
+            method, url, kwargs = make_request(endpoint, i, skus)
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            await response.aread()
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return summary(latencies, errors, time.perf_counter() - start)
+
+
+async def seed(client, skus):
+    """Stock the prom inventory with ``skus`` items, enough that purchases never run out."""
+    for start in range(0, skus, 1000):
+        response = await client.post("/add_items/", json=[
+            {"name": f"sku{i}", "price": 1 + i % 500, "amount": 10 ** 9} for i in range(start, min(start + 1000, skus))
+        ])
+        response.raise_for_status()
+
+
+# ---- targets -----------------------------------------------------------
+
+def app_environment(args, data_dir):
+    return {
+        "INVENTORY_DATA_DIR": data_dir,
+        "STORAGE_BACKEND": args.backend,
+        "BUY_ITEM_DELAY_SECONDS": "0" if args.stub_sleeps else os.getenv("BUY_ITEM_DELAY_SECONDS", "10"),
+        "TRACE_SAMPLE_RATIO": os.getenv("TRACE_SAMPLE_RATIO", "0"),
+    }
+
+
+def asgi_app(name):
+    """The app imported into this process."""
+    if name == "prom":
+        from prom.app import app
+        return app
+    spec = importlib.util.spec_from_file_location("fastapi_example_main", os.path.join(EXAMPLE_DIR, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.app
+
+
+def reset_prom_inventory():
+    from prom.main.utils.inventory_helper import load_inventory
+    inventory = load_inventory()
+    for item in inventory.items():
+        inventory.delete(item.name)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn_server(name, args, data_dir):
+    """Start the app under uvicorn in a child process and wait until it answers."""
+    port = free_port()
+    app, app_dir = ("prom.app:app", PROM_DIR) if name == "prom" else ("main:app", EXAMPLE_DIR)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--app-dir", app_dir, "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=app_dir,
+        env={**os.environ, **app_environment(args, data_dir)},
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{app} exited with status {process.returncode}")
+        try:
+            httpx.get(f"{base_url}/openapi.json", timeout=1)
+            return process, base_url
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"{app} did not start within 30 s")
+
+
+async def run_target(name, mode, args, skus, base_url=None):
+    endpoints = PROM_ENDPOINTS if name == "prom" else EXAMPLE_ENDPOINTS
+    if mode == "asgi":
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi_app(name)), base_url="http://bench")
+    else:
+        limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+        client = httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60)
+    results = []
+    async with client:
+        if name == "prom":
+            await seed(client, skus)
+        for endpoint in endpoints:
+            for concurrency in args.concurrency:
+                result = await drive(client, endpoint, concurrency, args.requests, skus, args.warmup)
+                results.append({
+                    "app": name, "mode": mode, "endpoint": endpoint, "concurrency": concurrency,
+                    "skus": skus if name == "prom" else None, **result,
+                })
+                print(format_row(results[-1]), flush=True)
+    return results
+
+
+def run(args):
+    results = []
+    for mode in args.modes:
+        for name in args.apps:
+            # The catalog size only matters for the inventory app
+            for skus in args.skus if name == "prom" else [0]:
+                if mode == "asgi":
+                    if name == "prom":
+                        reset_prom_inventory()
+                    results += asyncio.run(run_target(name, mode, args, skus))
+                    continue
+                process, base_url = spawn_server(name, args, tempfile.mkdtemp())
+                try:
+                    results += asyncio.run(run_target(name, mode, args, skus, base_url))
+                finally:
+                    process.terminate()
+                    process.wait()
+    return results
+
+
+# ---- reporting -----------------------------------------------------------
+
+HEADER = (f"{'app':>7} {'mode':>6} {'endpoint':>18} {'conc':>5} {'skus':>6} "
+          f"{'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+
+
+def format_row(result):
+    return (f"{result['app']:>7} {result['mode']:>6} {result['endpoint']:>18} {result['concurrency']:>5} "
+            f"{result['skus'] if result['skus'] is not None else '-':>6} {result['rps']:>9.0f} "
+            f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['errors']:>6}")
+
+
+def result_key(result):
+    return result["app"], result["mode"], result["endpoint"], result["concurrency"], result["skus"]
+
+
+def compare(results, previous):
+    """Print the change in req/s and p99 against an earlier run, for the cases both runs measured."""
+    earlier = {result_key(result): result for result in previous["results"]}
+    print(f"\nagainst {previous.get('commit') or 'previous run'}:")
+    for result in results:
+        before = earlier.get(result_key(result))
+        if before is None:
+            continue
+        print(f"{' '.join(str(part) for part in result_key(result) if part is not None):>48} "
+              f"req/s {(result['rps'] / before['rps'] - 1) * 100:+7.1f}%  "
+              f"p99 {(result['p99_ms'] / before['p99_ms'] - 1) * 100:+7.1f}%")
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROM_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--apps", nargs="+", choices=["prom", "example"], default=["prom", "example"])
+    parser.add_argument("--modes", nargs="+", choices=["asgi", "server"], default=["asgi"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--skus", type=int, nargs="+", default=[100, 10000], help="catalog sizes of the prom inventory")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per endpoint and concurrency")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--backend", choices=["memory", "columnar", "sqlite"], default="memory")
+    parser.add_argument("--stub-sleeps", action=argparse.BooleanOptionalAction, default=True,
+                        help="set the simulated purchase delay to zero")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    # The in-process app reads its configuration on import
+    os.environ.update(app_environment(args, tempfile.mkdtemp()))
+    print(HEADER, flush=True)
+    results = run(args)
+
+    report = {
+        "commit": current_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+/metrics scrape latency vs. registry size, rendering every scrape vs. the cached exposition.
+
+    python -m benchmarks.bench_metrics [--series 100 1000 10000] [--scrapes 200]
+"""
+import argparse
+import time
+
+from prometheus_client import CollectorRegistry, Counter, generate_latest
+
+from prom.main.utils.exposition import CachedExposition
+
+
+def build_registry(series):
+    registry = CollectorRegistry()
+    counter = Counter("bench_requests", "Benchmark counter", ["route", "status"], registry=registry)
+    for i in range(series):
+        counter.labels(route=f"/route/{i // 5}", status=str(200 + i % 5)).inc(i)
+    return registry
+
+
+def per_scrape(func, scrapes):
+    start = time.perf_counter()
+    for _ in range(scrapes):
+        func()
+    return (time.perf_counter() - start) / scrapes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--series", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--scrapes", type=int, default=200)
+    parser.add_argument("--ttl", type=float, default=1.0)
+    args = parser.parse_args()
+
+    print(f"{'series':>8} {'render':>12} {'cached':>12} {'cached gzip':>12} {'plain/gzip bytes':>18}")
+    for series in args.series:
+        registry = build_registry(series)
+        exposition = CachedExposition(registry=registry, ttl=args.ttl)
+        render = per_scrape(lambda: generate_latest(registry), args.scrapes)
+        exposition.get(accept_gzip=True)  # Warm the cache
+        cached = per_scrape(lambda: exposition.get(), args.scrapes)
+        cached_gzip = per_scrape(lambda: exposition.get(accept_gzip=True), args.scrapes)
+        sizes = f"{len(exposition.get()[0])}/{len(exposition.get(accept_gzip=True)[0])}"
+        print(f"{series:>8} {render * 1e6:9.1f} us {cached * 1e6:9.1f} us {cached_gzip * 1e6:9.1f} us {sizes:>18}")
+
+
+if __name__ == "__main__":
+    main()
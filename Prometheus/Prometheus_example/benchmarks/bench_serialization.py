@@ -0,0 +1,85 @@
+"""
+Per-response serialization cost of the hot endpoints: the handler returning
+models or dicts that FastAPI validates against the response model and encodes
+again (the previous path), against serializing the models once with
+pydantic-core and returning the bytes (``model_response`` / ``items_json``).
+
+    python -m benchmarks.bench_serialization [--skus 100 1000] [--repeat 2000]
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from prom.main.schemas.item import Item, ItemAddedResponse
+from prom.main.schemas.purchase import PurchaseResponse
+from prom.main.utils.listing import items_json
+from prom.main.utils.responses import model_response
+
+
+def previous_path(response_model, content):
+    field = create_model_field(name="response", type_=response_model, mode="serialization")
+
+    async def respond():
+        body = await serialize_response(field=field, response_content=content)
+        return JSONResponse(body).body
+
+    return respond
+
+
+def per_response(respond, repeat):
+    async def loop():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            await respond()
+        return (time.perf_counter() - start) / repeat
+
+    return asyncio.run(loop())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skus", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    item = Item(name="milk", description="1l carton", price=6.5, amount=5, category="dairy")
+    cases = {
+        "add_item": (
+            previous_path(ItemAddedResponse, {"message": "Item added successfully", "item": item}),
+            lambda: model_response(ItemAddedResponse.model_construct(message="Item added successfully", item=item)),
+            args.repeat,
+        ),
+        "buy_item": (
+            previous_path(PurchaseResponse, {"message": "Successfully bought 2 of 'milk'", "remaining": 3}),
+            lambda: model_response(PurchaseResponse.model_construct(
+                message="Successfully bought 2 of 'milk'", remaining=3
+            )),
+            args.repeat,
+        ),
+    }
+    for skus in args.skus:
+        items = [Item(name=f"sku{i}", price=10 + i % 90, amount=1 + i % 40) for i in range(skus)]
+        cases[f"GET / ({skus} items)"] = (
+            previous_path(List[Item], items),
+            lambda items=items: items_json.dump_json(items),
+            max(args.repeat * 10 // skus, 20),
+        )
+
+    print(f"{'response':>22} {'previous':>12} {'new':>12} {'speedup':>8}")
+    for name, (previous, new, repeat) in cases.items():
+        before = per_response(previous, repeat)
+
+        async def respond_new(new=new):
+            return new()
+
+        after = per_response(respond_new, repeat)
+        print(f"{name:>22} {before * 1e6:>10.1f}us {after * 1e6:>10.1f}us {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
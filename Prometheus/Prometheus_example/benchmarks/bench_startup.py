@@ -0,0 +1,113 @@
+"""
+Cold start of prom.app: how long ``import prom.app`` takes, and after spawning
+uvicorn, how long until it accepts a connection, until /ready turns 200, and
+until a first GET / is answered, for inventories of several sizes.
+
+The import is also timed with the warm-up done in the foreground, as before it
+moved to the lifespan, to show what the deferred work costs.
+
+    python -m benchmarks.bench_startup [--runs 5] [--skus 0 100000]
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from prom.main.schemas.item import Item
+from prom.main.utils.journal import InventoryJournal
+
+PROM_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+IMPORT = "import time; start = time.perf_counter(); import prom.app; print(time.perf_counter() - start)"
+IMPORT_AND_WARM_UP = (
+    "import time; start = time.perf_counter(); import prom.app; from prom.main import config; "
+    "from prom.main.utils.inventory_helper import load_inventory; "
+    "from prom.main.utils.tracing import start_trace_export; load_inventory(); "
+    "start_trace_export(config.OTEL_EXPORTER_OTLP_ENDPOINT, config.TRACE_SAMPLE_RATIO, config.TRACE_EXCLUDED_PATHS, "
+    "config.TRACE_SLOW_SECONDS, config.TRACE_EXPORT_QUEUE_SIZE, config.TRACE_EXPORT_BATCH_SIZE); "
+    "print(time.perf_counter() - start)"
+)
+
+
+def seeded_data_dir(skus):
+    directory = tempfile.mkdtemp()
+    if skus:
+        InventoryJournal(directory).seed([Item(name=f"sku{i}", price=1 + i % 500, amount=1 + i % 40) for i in range(skus)])
+    return directory
+
+
+def app_environment(data_dir):
+    return {**os.environ, "INVENTORY_DATA_DIR": data_dir, "PYTHONPATH": PROM_DIR, "BUY_ITEM_DELAY_SECONDS": "0"}
+
+
+def time_import(code, skus):
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=PROM_DIR, env=app_environment(seeded_data_dir(skus)),
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return float(output.split()[-1])
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def poll(url, until, deadline):
+    """Time at which ``until(response)`` first holds for a GET of ``url``."""
+    while time.monotonic() < deadline:
+        try:
+            if until(httpx.get(url, timeout=5)):
+                return time.perf_counter()
+        except httpx.TransportError:
+            pass
+        time.sleep(0.005)
+    raise RuntimeError(f"{url} did not answer in time")
+
+
+def time_to_first_request(skus):
+    """Seconds from spawning uvicorn until it accepts, is ready, and has served a first listing."""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = app_environment(seeded_data_dir(skus))
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "prom.app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=PROM_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 120
+    try:
+        accepting = poll(f"{base_url}/ready", lambda response: True, deadline)
+        listing = poll(f"{base_url}/", lambda response: response.status_code == 200, deadline)
+        ready = poll(f"{base_url}/ready", lambda response: response.status_code == 200, deadline)
+    finally:
+        process.terminate()
+        process.wait()
+    return accepting - start, ready - start, listing - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--skus", type=int, nargs="+", default=[0, 100000], help="items in the persisted inventory")
+    args = parser.parse_args()
+
+    print(f"{'skus':>7} {'import':>9} {'+ warm-up':>10} {'accepting':>10} {'ready':>9} {'first GET /':>12}  (medians)")
+    for skus in args.skus:
+        imports = [time_import(IMPORT, skus) for _ in range(args.runs)]
+        warm_imports = [time_import(IMPORT_AND_WARM_UP, skus) for _ in range(args.runs)]
+        starts = [time_to_first_request(skus) for _ in range(args.runs)]
+        accepting, ready, listing = (statistics.median(column) for column in zip(*starts))
+        print(f"{skus:>7} {statistics.median(imports):8.3f}s {statistics.median(warm_imports):9.3f}s "
+              f"{accepting:9.3f}s {ready:8.3f}s {listing:11.3f}s")
+
+
+if __name__ == "__main__":
+    main()
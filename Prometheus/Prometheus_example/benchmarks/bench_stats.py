@@ -0,0 +1,91 @@
+"""
+Cost of the inventory stats: reading the columns of each in-memory backend and
+computing the stats from them, against the same figures from a loop over the
+Item models, and a repeated GET /inventory/stats served from the cache.
+
+    python -m benchmarks.bench_stats [--skus 100000 1000000] [--requests 200]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from bisect import bisect_left, bisect_right
+from heapq import nlargest
+
+os.environ.setdefault("INVENTORY_DATA_DIR", tempfile.mkdtemp())
+
+import httpx  # noqa: E402
+from fastapi import FastAPI, Depends  # noqa: E402
+
+from prom.main import config  # noqa: E402
+from prom.main.routers.items import router  # noqa: E402
+from prom.main.utils.columnar_store import ColumnarInventory  # noqa: E402
+from prom.main.utils.inventory_helper import get_inventory, load_inventory  # noqa: E402
+from prom.main.utils.inventory_store import InventoryStore  # noqa: E402
+from prom.main.utils.stats import compute_stats  # noqa: E402
+from benchmarks.bench_columnar import catalog  # noqa: E402
+
+THRESHOLDS = [5, 10, 20]
+
+app = FastAPI()
+app.include_router(router, dependencies=[Depends(get_inventory)])
+
+
+def loop_over_items(items):
+    """The same figures computed item by item, as an offline script over the listing would."""
+    value = value_with_tax = units = 0
+    histogram = [0] * (len(config.STATS_QUANTITY_BUCKETS) + 1)
+    low = [0] * len(THRESHOLDS)
+    for item in items:
+        item_value = item.price * item.amount
+        value += item_value
+        value_with_tax += item_value * (1 + (item.tax or 0) / 100)
+        units += item.amount
+        histogram[bisect_left(config.STATS_QUANTITY_BUCKETS, item.amount)] += 1
+        for index in range(bisect_right(THRESHOLDS, item.amount), len(THRESHOLDS)):
+            low[index] += 1
+    return nlargest(config.STATS_TOP_ITEMS, items, key=lambda item: item.price * item.amount)
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+async def cached_requests(requests):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        await client.get("/inventory/stats")
+        start = time.perf_counter()
+        for _ in range(requests):
+            await client.get("/inventory/stats")
+        return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skus", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'skus':>8} {'backend':>18} {'columns ms':>11} {'stats ms':>9} {'item loop ms':>13}")
+    for skus in args.skus:
+        for backend in (InventoryStore, ColumnarInventory):
+            inventory = backend(items=catalog(skus))
+            columns = inventory.stock_columns()
+            columns_ms = timed(inventory.stock_columns)
+            stats_ms = timed(lambda: compute_stats(
+                columns, 0, config.STATS_QUANTITY_BUCKETS, THRESHOLDS, config.STATS_TOP_ITEMS
+            ))
+            loop_ms = timed(lambda: loop_over_items(inventory.items()))
+            print(f"{skus:>8} {backend.__name__:>18} {columns_ms:>11.1f} {stats_ms:>9.1f} {loop_ms:>13.1f}")
+            del inventory, columns
+
+    inventory = load_inventory()
+    inventory.add_many(list(catalog(args.skus[0])))
+    print(f"cached GET /inventory/stats, {len(inventory)} SKUs: {asyncio.run(cached_requests(args.requests)):.0f} req/s")
+
+
+if __name__ == "__main__":
+    main()
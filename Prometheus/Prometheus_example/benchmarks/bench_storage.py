@@ -0,0 +1,85 @@
+"""
+Persistence throughput of the storage backends: restocks and purchases per
+second from N threads, for the journaled in-memory store and SQLite. Every
+operation waits until its change is durable, as requests do by default, so the
+write-behind journal commits concurrent changes in groups.
+
+    python -m benchmarks.bench_storage [--threads 1 4 16] [--operations 4000] [--skus 256]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from prom.main.schemas.item import Item
+from prom.main.utils.inventory_store import InventoryStore
+from prom.main.utils.journal import InventoryJournal
+from prom.main.utils.sqlite_store import SQLiteInventory
+
+
+def memory_backend(directory, skus, fsync=False, flush_interval=0.0):
+    journal = InventoryJournal(directory, fsync=fsync, flush_interval=flush_interval)
+    journal.replay()
+    store = InventoryStore(items=skus)
+    store.add_journal(journal)
+    return store
+
+
+def sqlite_backend(directory, skus, synchronous="NORMAL"):
+    store = SQLiteInventory(os.path.join(directory, "inventory.db"), pool_size=16, synchronous=synchronous)
+    store.add_many(skus)
+    return store
+
+
+def run(store, threads, operations, skus):
+    per_thread = operations // threads
+
+    def worker(offset):
+        durable = threading.Event()
+        for i in range(per_thread):
+            name = f"sku{(i * 7 + offset) % skus}"
+            if i % 2:
+                store.take(name, 1)
+            else:
+                store.add(Item(name=name, price=10, amount=1))
+            durable.clear()
+            store.when_durable(lambda error: durable.set())
+            durable.wait()
+
+    workers = [threading.Thread(target=worker, args=(offset,)) for offset in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--operations", type=int, default=4000)
+    parser.add_argument("--skus", type=int, default=256)
+    args = parser.parse_args()
+
+    backends = {
+        "memory + journal": memory_backend,
+        "journal (fsync)": lambda directory, skus: memory_backend(directory, skus, fsync=True),
+        "write-behind (fsync)": lambda directory, skus: memory_backend(directory, skus, fsync=True, flush_interval=0.002),
+        "sqlite (NORMAL)": sqlite_backend,
+        "sqlite (FULL)": lambda directory, skus: sqlite_backend(directory, skus, synchronous="FULL"),
+    }
+    print(f"{'backend':>20} " + " ".join(f"{threads:>9} thr" for threads in args.threads))
+    for name, factory in backends.items():
+        rates = []
+        for threads in args.threads:
+            skus = [Item(name=f"sku{i}", price=10, amount=10 ** 6) for i in range(args.skus)]
+            store = factory(tempfile.mkdtemp(), skus)
+            rates.append(run(store, threads, args.operations, args.skus))
+            store.close()
+        print(f"{name:>20} " + " ".join(f"{rate:>9.0f}/s" for rate in rates))
+
+
+if __name__ == "__main__":
+    main()
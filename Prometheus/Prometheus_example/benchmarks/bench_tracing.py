@@ -0,0 +1,110 @@
+"""
+Request latency while traces are exported to a local stub OTLP collector that
+answers normally or stalls every export, with the bounded export queue.
+
+    python -m benchmarks.bench_tracing [--requests 2000] [--ratio 1.0]
+"""
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+from concurrent import futures
+
+import grpc
+import httpx
+from fastapi import FastAPI
+from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.proto.collector.trace.v1 import trace_service_pb2, trace_service_pb2_grpc
+from opentelemetry.sdk.trace import TracerProvider
+from prometheus_client import REGISTRY
+
+from prom.main.utils.tracing_sdk import TailKeepingSpanProcessor, make_sampler
+
+
+class StubCollector(trace_service_pb2_grpc.TraceServiceServicer):
+    def __init__(self):
+        self.stalled = threading.Event()
+        self.released = threading.Event()
+        self.spans = 0
+
+    def Export(self, request, context):
+        if self.stalled.is_set():
+            self.released.wait()
+        self.spans += sum(len(scope.spans) for resource in request.resource_spans for scope in resource.scope_spans)
+        return trace_service_pb2.ExportTraceServiceResponse()
+
+
+def start_collector():
+    collector = StubCollector()
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    trace_service_pb2_grpc.add_TraceServiceServicer_to_server(collector, server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    return collector, server, port
+
+
+def build_app(port, ratio):
+    app = FastAPI()
+
+    @app.get("/")
+    async def root():
+        return {"ok": True}
+
+    provider = TracerProvider(sampler=make_sampler(ratio, ["/metrics"]))
+    processor = TailKeepingSpanProcessor(
+        OTLPSpanExporter(endpoint=f"http://127.0.0.1:{port}", insecure=True, timeout=30),
+        max_queue_size=2048, max_export_batch_size=512, schedule_delay=0.1,
+    )
+    provider.add_span_processor(processor)
+    FastAPIInstrumentor.instrument_app(app, tracer_provider=provider, exclude_spans=["receive", "send"])
+    return app, processor
+
+
+async def measure(app, requests):
+    latencies = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for _ in range(requests):
+            start = time.perf_counter()
+            await client.get("/")
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "p50": latencies[len(latencies) // 2],
+        "p99": latencies[int(len(latencies) * 0.99)],
+        "mean": statistics.fmean(latencies),
+    }
+
+
+def dropped(reason):
+    return REGISTRY.get_sample_value('otel_spans_dropped_total', {'reason': reason}) or 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--ratio", type=float, default=1.0)
+    args = parser.parse_args()
+
+    collector, server, port = start_collector()
+    app, processor = build_app(port, args.ratio)
+    asyncio.run(measure(app, 200))  # warm up
+    processor.force_flush()
+
+    for name in ("healthy", "stalled"):
+        if name == "stalled":
+            collector.stalled.set()
+        before = dropped("queue_full")
+        result = asyncio.run(measure(app, args.requests))
+        print(f"{name:>8} collector: p50 {result['p50'] * 1e3:6.3f} ms  p99 {result['p99'] * 1e3:6.3f} ms  "
+              f"mean {result['mean'] * 1e3:6.3f} ms  spans dropped {dropped('queue_full') - before:.0f}")
+
+    collector.released.set()
+    processor.shutdown()
+    server.stop(None)
+    print(f"collector received {collector.spans} spans")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Keep the app's persisted inventory out of the working tree while testing
+os.environ.setdefault("INVENTORY_DATA_DIR", tempfile.mkdtemp(prefix="prom-test-"))
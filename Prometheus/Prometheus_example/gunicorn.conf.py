@@ -0,0 +1,28 @@
+# Run several workers with metrics aggregated across them:
+#   gunicorn -c gunicorn.conf.py prom.app:app
+import os
+import shutil
+
+# Every worker writes its metrics to mmap files in this directory; set before the workers import prometheus_client
+multiproc_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+
+bind = "0.0.0.0:5001"
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Workers share the inventory through SQLite; the memory and columnar backends keep it in each worker's
+# memory and their journal directory takes a single writer
+storage_backend = os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+if workers > 1 and storage_backend != "sqlite":
+    raise RuntimeError(f"STORAGE_BACKEND={storage_backend} keeps the inventory per process; use sqlite with {workers} workers")
+
+
+def on_starting(server):
+    # Files left by a previous run would be merged into the new one
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
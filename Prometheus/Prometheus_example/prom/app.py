@@ -1,41 +1,92 @@
+import functools
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Depends
-import uvicorn
-from opentelemetry.sdk.resources import Resource
+from opentelemetry import trace
 
+from .main import config
+from .main.custom_metrics.basicMetrics import request_metrics
+from .main.instrumentation.admission import AdmissionControl, LaneSettings
+from .main.routers.health import router as health_router
 from .main.routers.items import router as items_router
 from .main.routers.metrics import router as metrics_router
-from .main.utils.inventory_helper import get_inventory
+from .main.utils.inventory_helper import get_inventory, load_inventory
+from .main.utils.tracing import instrument_app, start_trace_export
+from .main.utils.warmup import warmup
 
-from opentelemetry import trace
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Heavy startup work runs in the background, so the server accepts connections right away;
+    # /ready reports when the inventory is loaded, and requests that need it wait for it. A slow
+    # trace collector only delays tracing, not readiness.
+    warmup.start({
+        "inventory": load_inventory,
+        # Trace a sample of the requests (plus every error and slow one) and export them to Tempo
+        "tracing": functools.partial(
+            start_trace_export,
+            endpoint=config.OTEL_EXPORTER_OTLP_ENDPOINT,
+            ratio=config.TRACE_SAMPLE_RATIO,
+            excluded_paths=config.TRACE_EXCLUDED_PATHS,
+            slow_threshold=config.TRACE_SLOW_SECONDS,
+            max_queue_size=config.TRACE_EXPORT_QUEUE_SIZE,
+            max_export_batch_size=config.TRACE_EXPORT_BATCH_SIZE,
+        ),
+    }, required={"inventory"})
+    yield
+    await warmup.wait()
+    inventory = warmup.steps["inventory"].result
+    if inventory is not None:
+        # Write the changes still queued by the write-behind journal
+        inventory.close()
+    provider = warmup.steps["tracing"].result
+    if provider is not None:
+        # Export the spans still queued
+        provider.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Purchases are slow (BUY_ITEM_DELAY_SECONDS); they get a lane of their own so that a pile-up of them
+# never takes the capacity of reads and stock updates
+PURCHASE_PATHS = {"/buy_item/", "/buy_items/"}
+
 
+def admission_lane(scope):
+    if scope["path"] in config.ADMISSION_EXEMPT_PATHS:
+        return None
+    if scope["method"] in ("GET", "HEAD"):
+        return "read"
+    return "purchase" if scope["path"] in PURCHASE_PATHS else "write"
+
+
+# Limit the requests of each lane and shed the excess with 503; installed first, so the request metrics
+# middleware wraps it and records the shed requests too
+if config.ADMISSION_CONTROL:
+    admission_control = AdmissionControl({
+        lane: LaneSettings(
+            limit, config.ADMISSION_MIN_LIMITS[lane], config.ADMISSION_MAX_LIMITS[lane],
+            config.ADMISSION_QUEUE_SIZES[lane], config.ADMISSION_QUEUE_SECONDS[lane],
+        )
+        for lane, limit in config.ADMISSION_LIMITS.items()
+    }, admission_lane)
+    admission_control.instrument(app)
+
+# Record latency and count of every request, per route, method and status
+request_metrics.instrument(app)
 
 # Include routes and inject the Inventory instance
 app.include_router(items_router, dependencies=[Depends(get_inventory)])
 app.include_router(metrics_router)
+app.include_router(health_router)
 
-# Set up OpenTelemetry tracing with a service name
-trace.set_tracer_provider(
-    TracerProvider(
-        resource=Resource.create({"service.name": "my_fastapi_service"})
-    )
-)
+# Spans are recorded once the tracing warm-up step has installed the tracer provider
+instrument_app(app, config.TRACE_EXCLUDED_PATHS)
 tracer = trace.get_tracer(__name__)
 
-# Configure the OTLP exporter to send traces to Tempo
-otlp_exporter = OTLPSpanExporter(endpoint="http://tempo:4317", insecure=True)
-span_processor = BatchSpanProcessor(otlp_exporter)
-trace.get_tracer_provider().add_span_processor(span_processor)
-
-# Instrument FastAPI with OpenTelemetry
-FastAPIInstrumentor.instrument_app(app)
-
 
 if __name__ == "__main__":
+    import uvicorn
+
     # Start the FastAPI application on port 5001
     uvicorn.run(app, port=5001)
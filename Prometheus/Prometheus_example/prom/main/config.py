@@ -0,0 +1,105 @@
+import os
+
+# Base directory of the project (the folder holding the .env file)
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+
+# Directory holding the inventory snapshot and journal segments, or the SQLite database
+INVENTORY_DATA_DIR = os.getenv("INVENTORY_DATA_DIR", os.path.join(BASE_DIR, "data"))
+
+# Inventory storage: "memory" (in-memory store persisted by the journal), "columnar" (the same with compact
+# column storage, for very large catalogs) or "sqlite"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "memory")
+
+# SQLite database file and its synchronous mode (NORMAL is durable across process crashes in WAL mode)
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(INVENTORY_DATA_DIR, "inventory.db"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+
+# Number of journal records written before the segment is folded into the snapshot
+JOURNAL_COMPACT_EVERY = int(os.getenv("JOURNAL_COMPACT_EVERY", "10000"))
+
+# fsync every journal append (survives power loss, not only process crashes)
+JOURNAL_FSYNC = os.getenv("JOURNAL_FSYNC", "false").lower() == "true"
+
+# Write-behind journal: queued changes are flushed together this long after the first one, or once this many
+# are waiting (an interval of 0 writes every change as it happens)
+JOURNAL_FLUSH_INTERVAL_SECONDS = float(os.getenv("JOURNAL_FLUSH_INTERVAL_SECONDS", "0.002"))
+JOURNAL_FLUSH_MAX_RECORDS = int(os.getenv("JOURNAL_FLUSH_MAX_RECORDS", "1000"))
+
+# Whether mutating requests answer only once their changes are on disk; a request can override it with
+# the X-Wait-For-Durability header
+WAIT_FOR_DURABILITY = os.getenv("WAIT_FOR_DURABILITY", "true").lower() == "true"
+
+# How long a mutating request waits for its changes to reach the disk before it answers 503
+DURABILITY_TIMEOUT_SECONDS = float(os.getenv("DURABILITY_TIMEOUT_SECONDS", "5"))
+
+# Simulated processing delay of a purchase, in seconds
+BUY_ITEM_DELAY_SECONDS = float(os.getenv("BUY_ITEM_DELAY_SECONDS", "10"))
+
+# Low-stock thresholds: the main one, extra ones to track, and per-category ones ("dairy:20,bakery:5")
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "10"))
+LOW_STOCK_THRESHOLDS = [int(value) for value in os.getenv("LOW_STOCK_THRESHOLDS", "5,20").split(",") if value]
+LOW_STOCK_CATEGORY_THRESHOLDS = {
+    category: int(value)
+    for category, value in (pair.split(":") for pair in os.getenv("LOW_STOCK_CATEGORY_THRESHOLDS", "").split(",") if pair)
+}
+
+# Window of the recent purchase success ratio, in seconds
+PURCHASE_RATIO_WINDOW_SECONDS = float(os.getenv("PURCHASE_RATIO_WINDOW_SECONDS", "300"))
+
+# Purchase histograms: upper boundaries of the price bands, and buckets of the line value and of the units bought
+PURCHASE_PRICE_BANDS = [float(value) for value in os.getenv("PURCHASE_PRICE_BANDS", "5,10,100,1000").split(",") if value]
+PURCHASE_VALUE_BUCKETS = [
+    float(value) for value in os.getenv("PURCHASE_VALUE_BUCKETS", "5,10,25,50,100,250,500,1000,2500,10000").split(",") if value
+]
+PURCHASE_UNITS_BUCKETS = [float(value) for value in os.getenv("PURCHASE_UNITS_BUCKETS", "1,2,5,10,20,50,100").split(",") if value]
+
+# How long a rendered /metrics exposition is served before it is rendered again (0 disables caching)
+METRICS_CACHE_TTL_SECONDS = float(os.getenv("METRICS_CACHE_TTL_SECONDS", "1"))
+
+# Page size of filtered or paginated listings, when the request gives none, and its upper limit
+LISTING_PAGE_SIZE = int(os.getenv("LISTING_PAGE_SIZE", "100"))
+LISTING_MAX_PAGE_SIZE = int(os.getenv("LISTING_MAX_PAGE_SIZE", "1000"))
+
+# Idempotency keys of the mutating routes: how long a stored response is replayed, and the bounds of the cache
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+IDEMPOTENCY_MAX_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# Admission control: requests go through a lane (read, write or purchase) with an adaptive concurrency limit
+# that starts at ADMISSION_LIMITS and stays between ADMISSION_MIN_LIMITS and ADMISSION_MAX_LIMITS, a queue of
+# at most ADMISSION_QUEUE_SIZES requests and a budget of ADMISSION_QUEUE_SECONDS in it; beyond that they get a 503.
+# Values are given per lane ("read:200,purchase:50"); ADMISSION_EXEMPT_PATHS are always admitted.
+def _per_lane(variable, default, value_type):
+    return {lane: value_type(value) for lane, value in (pair.split(":") for pair in os.getenv(variable, default).split(",") if pair)}
+
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() == "true"
+ADMISSION_LIMITS = _per_lane("ADMISSION_LIMITS", "read:200,write:50,purchase:100", int)
+ADMISSION_MIN_LIMITS = _per_lane("ADMISSION_MIN_LIMITS", "read:20,write:5,purchase:5", int)
+ADMISSION_MAX_LIMITS = _per_lane("ADMISSION_MAX_LIMITS", "read:1000,write:200,purchase:500", int)
+ADMISSION_QUEUE_SIZES = _per_lane("ADMISSION_QUEUE_SIZES", "read:1000,write:100,purchase:100", int)
+ADMISSION_QUEUE_SECONDS = _per_lane("ADMISSION_QUEUE_SECONDS", "read:2,write:1,purchase:0.5", float)
+ADMISSION_EXEMPT_PATHS = [path for path in os.getenv("ADMISSION_EXEMPT_PATHS", "/metrics,/ready").split(",") if path]
+
+# Inventory stats: upper bounds of the quantity histogram buckets, and how many SKUs the top-by-value list holds
+STATS_QUANTITY_BUCKETS = [int(value) for value in os.getenv("STATS_QUANTITY_BUCKETS", "1,5,10,20,50,100,500").split(",") if value]
+STATS_TOP_ITEMS = int(os.getenv("STATS_TOP_ITEMS", "10"))
+
+# Worker threads (and SQLite connections) available for blocking database work
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "16"))
+
+# OTLP collector the traces are exported to
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://tempo:4317")
+
+# Share of new traces that are sampled; errors and slow requests are kept regardless
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "0.1"))
+
+# Paths that are never traced (comma separated)
+TRACE_EXCLUDED_PATHS = [path for path in os.getenv("TRACE_EXCLUDED_PATHS", "/metrics,/ready").split(",") if path]
+
+# Requests taking at least this long are always traced, in seconds
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "1"))
+
+# Spans held for export before new ones are dropped, and spans sent per export call
+TRACE_EXPORT_QUEUE_SIZE = int(os.getenv("TRACE_EXPORT_QUEUE_SIZE", "2048"))
+TRACE_EXPORT_BATCH_SIZE = int(os.getenv("TRACE_EXPORT_BATCH_SIZE", "512"))
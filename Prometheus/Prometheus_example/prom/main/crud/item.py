@@ -1,85 +1,193 @@
-import time
-from fastapi import HTTPException
-from prom.main.custom_metrics.basicMetrics import requests_total, request_duration, request_latency, amount_bought_summary, \
-    low_stock_metric
+import asyncio
+from typing import List
+from fastapi import HTTPException, Response
+from fastapi.responses import StreamingResponse
+from prom.main.custom_metrics.basicMetrics import low_stock_metric, purchase_histogram
 from prom.main.custom_metrics.basicMetrics import purchase_success_ratio
-from prom.main.schemas.inventory import Inventory
-from prom.main.schemas.item import Item
-from prom.main.utils.functions import save_inventory_to_env, execute_query
-
-
-async def root1(inventory: Inventory):
-    method = 'get'  # Define the label value for GET request
-    # Increment the total request count with the method label
-    requests_total.labels(method=method).inc()
-    start_time = time.time()
-    # Simulate some work
-    items = inventory.items
-    # Measure request latency
-    latency = time.time() - start_time
-    request_latency.labels(method=method).observe(latency)
-    request_duration.labels(method=method).observe(latency)
-    low_stock_metric.update_inventory(inventory)
-    return items
-
-
-async def add_item1(item: Item, inventory: Inventory):
-    method = 'post'  # Define the label value for POST request
-    # Increment the total request count with the method label
-    requests_total.labels(method=method).inc()
-    start_time = time.time()
-    for existing_item in inventory.items:
-        if existing_item.name == item.name:
-            existing_item.amount += item.amount
-            save_inventory_to_env(inventory)
-            execute_query()
-            latency = time.time() - start_time
-            request_latency.labels(method=method).observe(latency)
-            request_duration.labels(method=method).observe(latency)
-            low_stock_metric.update_inventory(inventory)
-            return {"message": f"Item '{item.name}' quantity updated to {existing_item.amount}"}
-
-    inventory.items.append(item)
-    save_inventory_to_env(inventory)
-    execute_query()
-    latency = time.time() - start_time
-    request_latency.labels(method=method).observe(latency)
-    request_duration.labels(method=method).observe(latency)
-    low_stock_metric.update_inventory(inventory)
-    return {"message": "Item added successfully", "item": item}
-
-
-async def buy_item1(name: str, amount: int, inventory: Inventory):
-    time.sleep(10)
-    method = 'post'
-    requests_total.labels(method=method).inc()
-    start_time = time.time()
+from prom.main.schemas.item import Item, ItemAddedResponse, ItemUpdatedResponse
+from prom.main.schemas.purchase import PurchaseLine, PurchaseResponse
+from prom.main import config
+from prom.main.utils.functions import listing_cache, run_db_operation, stats_cache, wait_until_durable
+from prom.main.utils.idempotency import begin_change
+from prom.main.utils.listing import decode_cursor, encode_cursor, etag_matches, items_json, ndjson_accepted
+from prom.main.utils.responses import model_response
+from prom.main.utils.stats import compute_stats
+from prom.main.utils.storage import (
+    InventoryBackend, ItemNotFound, InsufficientStock, BatchRejected, ItemQuery, NotPersisted,
+)
+
+# Request latency and counts are recorded once per request by the request_metrics middleware.
+# Storage calls may block on I/O, so they run on the db thread pool and are timed there.
+# The hot routes return ready-made JSON responses: their models are valid already, and
+# serializing them once in pydantic-core skips FastAPI's re-validation and jsonable_encoder.
+
+
+async def root1(inventory: InventoryBackend, if_none_match: str | None = None, prefix: str | None = None,
+                min_price: float | None = None, max_price: float | None = None, low_stock: bool = False,
+                cursor: str | None = None, limit: int | None = None, accept: str | None = None, url=None):
+    query = ItemQuery(prefix, min_price, max_price, low_stock_metric.low_stock_threshold if low_stock else None)
+    after = None
+    if cursor is not None:
+        try:
+            after = decode_cursor(cursor, query)
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error))
+
+    if ndjson_accepted(accept):
+        return StreamingResponse(_stream_items(inventory, query, after, limit), media_type="application/x-ndjson")
+    if query == ItemQuery() and after is None and limit is None:
+        return await _full_listing(inventory, if_none_match)
+
+    # One page; the Link header points at the next one while pages come back full
+    limit = limit or config.LISTING_PAGE_SIZE
+    page = await run_db_operation(inventory.query, query, after, limit)
+    headers = {}
+    if len(page) == limit and url is not None:
+        headers["Link"] = f'<{url.include_query_params(cursor=encode_cursor(query.sort_key(page[-1])))}>; rel="next"'
+    return Response(content=items_json.dump_json(page), media_type="application/json", headers=headers)
+
+
+async def _version(inventory: InventoryBackend) -> int:
+    # A storage call like any other: SQLite reads the version from the database
+    return await run_db_operation(lambda: inventory.version)
+
+
+async def _full_listing(inventory: InventoryBackend, if_none_match: str | None):
+    # Serialize the listing only when the inventory changed since the last call
+    version = await _version(inventory)
+    listing = listing_cache.get(version)
+    if listing is None:
+        listing = listing_cache.put(version, await run_db_operation(inventory.items))
+    if etag_matches(if_none_match, listing.etag):
+        return Response(status_code=304, headers={"ETag": listing.etag})
+    return Response(content=listing.body, media_type="application/json", headers={"ETag": listing.etag})
+
+
+async def _stream_items(inventory: InventoryBackend, query: ItemQuery, after: tuple | None, limit: int | None):
+    # Read and write one page at a time; the whole listing is never held in memory
+    remaining = limit
+    while remaining is None or remaining > 0:
+        chunk = config.LISTING_MAX_PAGE_SIZE if remaining is None else min(remaining, config.LISTING_MAX_PAGE_SIZE)
+        page = await run_db_operation(inventory.query, query, after, chunk)
+        if page:
+            yield b"".join(item.__pydantic_serializer__.to_json(item) + b"\n" for item in page)
+        if len(page) < chunk:
+            return
+        after = query.sort_key(page[-1])
+        if remaining is not None:
+            remaining -= len(page)
+
+
+async def inventory_stats1(inventory: InventoryBackend):
+    # Computed once per inventory version; repeated dashboard calls get the cached body until the next change
+    version = await _version(inventory)
+    body = stats_cache.get(version)
+    if body is None:
+        stats = await run_db_operation(_compute_stats, inventory, version)
+        body = stats_cache.put(stats)
+    return Response(content=body, media_type="application/json")
+
+
+def _compute_stats(inventory: InventoryBackend, version: int):
+    return compute_stats(
+        inventory.stock_columns(), version, config.STATS_QUANTITY_BUCKETS, low_stock_metric.thresholds,
+        config.STATS_TOP_ITEMS,
+    )
+
+
+async def add_item1(item: Item, inventory: InventoryBackend, durable: bool = True):
+    begin_change()
+    stored_item, created = await run_db_operation(inventory.add, item)
+    if durable:
+        await _wait_until_durable(inventory)
+    if not created:
+        return model_response(ItemUpdatedResponse.model_construct(
+            message=f"Item '{item.name}' quantity updated to {stored_item.amount}"
+        ))
+    return model_response(ItemAddedResponse.model_construct(message="Item added successfully", item=item))
+
+
+async def buy_item1(name: str, amount: int, inventory: InventoryBackend, durable: bool = True):
+    # Simulated processing delay; awaited so other requests keep being served
+    await asyncio.sleep(config.BUY_ITEM_DELAY_SECONDS)
     # Increment total purchase attempts in custom metric
     purchase_success_ratio.increment_attempts()
-    for item in inventory.items:
-        if item.name == name:
-            if item.amount < amount:
-                latency = time.time() - start_time
-                request_latency.labels(method=method).observe(latency)
-                request_duration.labels(method=method).observe(latency)
-                raise HTTPException(status_code=400, detail="Not enough items in stock")
-
-            # Increment successful purchases in custom metric
-            purchase_success_ratio.increment_successes()
-
-            item.amount -= amount
-            if item.amount == 0:
-                inventory.items.remove(item)
-            save_inventory_to_env(inventory)
-            execute_query()
-            low_stock_metric.update_inventory(inventory)
-            amount_bought_summary.observe_amount(item.price, amount)
-            latency = time.time() - start_time
-            request_latency.labels(method=method).observe(latency)
-            request_duration.labels(method=method).observe(latency)
-            return {"message": f"{amount} units of '{item.name}' purchased successfully", "remaining": item.amount}
-
-    latency = time.time() - start_time
-    request_latency.labels(method=method).observe(latency)
-    request_duration.labels(method=method).observe(latency)
-    raise HTTPException(status_code=404, detail="Item not found")
+    # From here a retry with the same Idempotency-Key must not buy again
+    begin_change()
+    try:
+        # Check and decrement atomically (item lock or database transaction)
+        item, remaining = await run_db_operation(inventory.take, name, amount)
+    except ItemNotFound:
+        raise HTTPException(status_code=404, detail="Item not found")
+    except InsufficientStock:
+        raise HTTPException(status_code=400, detail="Not enough items in stock")
+    if durable:
+        await _wait_until_durable(inventory)
+
+    # Increment successful purchases in custom metric
+    purchase_success_ratio.increment_successes()
+    purchase_histogram.observe(item.price, amount)
+    return model_response(PurchaseResponse.model_construct(
+        message=f"{amount} units of '{item.name}' purchased successfully", remaining=remaining
+    ))
+
+
+async def add_items1(items: List[Item], inventory: InventoryBackend, durable: bool = True):
+    # Apply and persist every line at once
+    begin_change()
+    results = await run_db_operation(inventory.add_many, items)
+    if durable:
+        await _wait_until_durable(inventory)
+    return {
+        "message": f"{len(items)} items added successfully",
+        "results": [
+            {"name": item.name, "status": "added" if created else "updated", "amount": amount}
+            for item, created, amount in results
+        ],
+    }
+
+
+async def buy_items1(lines: List[PurchaseLine], inventory: InventoryBackend, durable: bool = True):
+    # Simulated processing delay, paid once for the whole batch
+    await asyncio.sleep(config.BUY_ITEM_DELAY_SECONDS)
+    purchase_success_ratio.increment_attempts(len(lines))
+    begin_change()
+    try:
+        # All or nothing: either every line is fulfilled or the inventory is left untouched
+        results = await run_db_operation(inventory.take_many, [(line.name, line.amount) for line in lines])
+    except BatchRejected as rejected:
+        raise HTTPException(status_code=400, detail={
+            "message": "No items were purchased",
+            "results": [
+                {"name": line.name, "amount": line.amount, "status": _batch_error(rejected.errors.get(index))}
+                for index, line in enumerate(lines)
+            ],
+        })
+    if durable:
+        await _wait_until_durable(inventory)
+
+    purchase_success_ratio.increment_successes(len(lines))
+    purchase_histogram.observe_many((item.price, line.amount) for line, (item, _) in zip(lines, results))
+    return {
+        "message": f"{len(lines)} purchases completed successfully",
+        "results": [
+            {"name": line.name, "amount": line.amount, "status": "purchased", "remaining": remaining}
+            for line, (_, remaining) in zip(lines, results)
+        ],
+    }
+
+
+async def _wait_until_durable(inventory: InventoryBackend):
+    try:
+        await wait_until_durable(inventory)
+    except NotPersisted as error:
+        # The change is applied, but the client must not take it as saved
+        raise HTTPException(status_code=503, detail=str(error))
+
+
+def _batch_error(error):
+    if error is None:
+        return "ok"
+    if isinstance(error, ItemNotFound):
+        return "Item not found"
+    return "Not enough items in stock"
@@ -1,38 +1,63 @@
-from prometheus_client import Summary, Counter, Histogram, REGISTRY
+from prometheus_client import Gauge, Histogram, REGISTRY
 
-from prom.main.custom_metrics.amountBoughtSummary import AmountBoughtCollector
+from prom.main import config
+
+from prom.main.custom_metrics.idempotencyCache import IdempotencyCacheMetrics
 from prom.main.custom_metrics.lowStockPercent import LowStockPercentage
+from prom.main.custom_metrics.multiprocess import is_multiprocess, multiprocess_registry
+from prom.main.custom_metrics.purchaseHistogram import PurchaseHistogram
 from prom.main.custom_metrics.purchaseSuccessRatio import PurchaseSuccessRatio
+from prom.main.instrumentation.requests import RequestMetrics
+from prom.main.utils.tracing import trace_exemplar
 
-# Define labels for the request_latency Summary
-request_latency = Summary(
-    'request_latency_seconds',
-    'Request latency in seconds',
-    labelnames=['method']  # Define the labels
-)
-
-# Define labels for the requests_total Counter
-requests_total = Counter(
-    'requests_total',
-    'Total number of requests',
-    labelnames=['method']  # Define the labels
-)
+# Exemplars link histogram buckets to Tempo traces; the multiprocess mmap files cannot hold them
+duration_exemplar = None if is_multiprocess() else trace_exemplar
 
-# Define labels for request duration Histogram
-request_duration = Histogram(
-    'request_duration_seconds',
-    'Histogram of request durations in seconds',
-    labelnames=['method'],  # Define the labels
-    buckets=[0.1, 0.5, 1, 2, 5, 10]  # Define histogram buckets
-)
+# Request latency, count and duration per method, route and status, recorded by the
+# middleware that request_metrics.instrument(app) installs
+request_metrics = RequestMetrics(exemplar=duration_exemplar)
+request_latency = request_metrics.request_latency
+requests_total = request_metrics.requests_total
+request_duration = request_metrics.request_duration
 
 DB_OPERATION_DURATION = Histogram('db_operation_duration_seconds', 'Time taken for database operations')
 
+# Write-behind persistence: records written per flush, time taken by each flush and records waiting for one
+PERSISTENCE_FLUSH_RECORDS = Histogram(
+    'persistence_flush_records', 'Inventory changes written to disk by one flush',
+    buckets=[1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000]
+)
+PERSISTENCE_FLUSH_DURATION = Histogram(
+    'persistence_flush_duration_seconds', 'Time taken to write (and fsync) one flush',
+    buckets=[0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1]
+)
+PERSISTENCE_QUEUE_RECORDS = Gauge(
+    'persistence_queue_records', 'Inventory changes waiting to be flushed', multiprocess_mode='livesum'
+)
+
 
 # Custom metric instance
-purchase_success_ratio = PurchaseSuccessRatio()
-low_stock_metric = LowStockPercentage(low_stock_threshold=10)
-amount_bought_summary = AmountBoughtCollector()
+purchase_success_ratio = PurchaseSuccessRatio(window=config.PURCHASE_RATIO_WINDOW_SECONDS)
+purchase_success_ratio.start_recording()
+low_stock_metric = LowStockPercentage(
+    low_stock_threshold=config.LOW_STOCK_THRESHOLD,
+    thresholds=config.LOW_STOCK_THRESHOLDS,
+    category_thresholds=config.LOW_STOCK_CATEGORY_THRESHOLDS,
+)
+purchase_histogram = PurchaseHistogram(
+    price_bands=config.PURCHASE_PRICE_BANDS,
+    value_buckets=config.PURCHASE_VALUE_BUCKETS,
+    units_buckets=config.PURCHASE_UNITS_BUCKETS,
+)
+# Lookups, evictions and size of the idempotency cache; the collector adds its hit ratio
+idempotency_metrics = IdempotencyCacheMetrics()
 REGISTRY.register(purchase_success_ratio)
-REGISTRY.register(amount_bought_summary)
 REGISTRY.register(low_stock_metric)
+REGISTRY.register(idempotency_metrics)
+
+# Registry served on /metrics. With several worker processes (PROMETHEUS_MULTIPROC_DIR set),
+# it merges every worker's metrics and the custom collectors compute from the merged totals.
+if is_multiprocess():
+    METRICS_REGISTRY = multiprocess_registry(purchase_success_ratio, low_stock_metric, idempotency_metrics)
+else:
+    METRICS_REGISTRY = REGISTRY
@@ -0,0 +1,64 @@
+from prometheus_client import Counter, Gauge, REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+
+from prom.main.custom_metrics.multiprocess import is_multiprocess, merged_values
+
+# Outcomes of a request carrying an Idempotency-Key: its stored response was replayed (hit), it waited for the
+# original still in flight and got its response (in_flight), it ran (miss), or the key came with another request
+LOOKUP_RESULTS = ("hit", "in_flight", "miss", "conflict")
+
+
+class IdempotencyCacheMetrics:
+    """
+    Lookups, evictions and size of the idempotency cache, and its hit ratio.
+
+    The hit ratio is the share of keyed requests answered without running
+    again: replayed from a stored response or from the original in flight.
+    With several worker processes it is computed from the lookups merged
+    across all workers.
+    """
+
+    def __init__(self, registry=REGISTRY):
+        self.lookups = Counter(
+            'idempotency_lookups', 'Requests carrying an Idempotency-Key, by outcome',
+            labelnames=['result'], registry=registry
+        )
+        self.evictions = Counter(
+            'idempotency_evictions', 'Stored responses dropped from the idempotency cache, by reason',
+            labelnames=['reason'], registry=registry
+        )
+        self.entries = Gauge(
+            'idempotency_cache_entries', 'Responses held by the idempotency cache',
+            multiprocess_mode='livesum', registry=registry
+        )
+        self.bytes = Gauge(
+            'idempotency_cache_bytes', 'Approximate memory held by the idempotency cache',
+            multiprocess_mode='livesum', registry=registry
+        )
+        self._lookups = {result: self.lookups.labels(result=result) for result in LOOKUP_RESULTS}
+        self.expired = self.evictions.labels(reason='expired')
+        self.evicted = self.evictions.labels(reason='capacity')
+
+    def lookup(self, result):
+        self._lookups[result].inc()
+
+    def _lookup_counts(self):
+        if is_multiprocess():
+            merged = merged_values('counter', 'idempotency_lookups_total')['idempotency_lookups_total']
+            return {result: merged.get((result,), 0.0) for result in LOOKUP_RESULTS}
+        return {result: child._value.get() for result, child in self._lookups.items()}
+
+    def get_hit_ratio(self):
+        counts = self._lookup_counts()
+        total = sum(counts.values())
+        if total == 0:
+            return 0.0
+        return (counts["hit"] + counts["in_flight"]) / total
+
+    def collect(self):
+        metric = GaugeMetricFamily(
+            'idempotency_cache_hit_ratio',
+            'Share of requests with an Idempotency-Key answered from the cache instead of running again'
+        )
+        metric.add_metric([], self.get_hit_ratio())
+        yield metric
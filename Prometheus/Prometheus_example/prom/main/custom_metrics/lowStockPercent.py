@@ -1,30 +1,181 @@
+import threading
+from bisect import bisect_right
+
 from prometheus_client.core import GaugeMetricFamily
 
+from prom.main.custom_metrics.multiprocess import is_multiprocess
+
 
 class LowStockPercentage:
-    def __init__(self, low_stock_threshold=10):
+    """
+    Percentage of inventory items whose amount is below a low-stock threshold.
+
+    The counts are kept incrementally: the collector listens to the inventory store
+    and every change moves one item across the thresholds or not, so nothing is
+    recounted on requests or scrapes. Besides the main threshold it can track
+    several extra thresholds and a threshold per item category.
+
+    With several worker processes the workers share the inventory (SQLite), and
+    a worker's listener only sees its own changes. There the counts are taken
+    from the shared inventory on collection instead, and cached until its
+    version changes, so every worker reports the same values.
+    """
+
+    def __init__(self, low_stock_threshold=10, thresholds=(), category_thresholds=None):
+        self._lock = threading.Lock()
         self.low_stock_threshold = low_stock_threshold
+        self.thresholds = sorted(set(thresholds) | {low_stock_threshold})
+        self.category_thresholds = dict(category_thresholds or {})
         self.total_items = 0
         self.low_stock_items = 0
+        self._low_counts = [0] * len(self.thresholds)
+        self._category_totals = dict.fromkeys(self.category_thresholds, 0)
+        self._category_low = dict.fromkeys(self.category_thresholds, 0)
+        # Multiprocess mode: the shared inventory, its counts as (version, generation, counts), and the
+        # generation of the thresholds, bumped when they change
+        self._inventory = None
+        self._shared = None
+        self._generation = 0
 
     def update_inventory(self, inventory):
         """
-        Update the count of total items and low stock items based on the provided inventory.
+        Recount total and low stock items from scratch, and count this inventory from now on.
+
+        Only needed at startup; afterwards ``on_change`` keeps the counts current.
 
-        :param inventory: List of inventory items where each item has a 'stock' attribute.
+        :param inventory: Inventory backend; only the amount and category of its items are read.
         """
-        self.total_items = len(inventory.items)
-        self.low_stock_items = sum(1 for item in inventory.items if item.amount < self.low_stock_threshold)
+        with inventory.locked_all(), self._lock:
+            self._inventory = inventory
+            self._resync(inventory)
+
+    def set_thresholds(self, inventory, low_stock_threshold=None, thresholds=None, category_thresholds=None):
+        """Change the thresholds and resync the counts against the inventory, in one step for ``on_change``."""
+        with inventory.locked_all(), self._lock:
+            if low_stock_threshold is not None:
+                self.low_stock_threshold = low_stock_threshold
+            base = self.thresholds if thresholds is None else thresholds
+            self.thresholds = sorted(set(base) | {self.low_stock_threshold})
+            if category_thresholds is not None:
+                self.category_thresholds = dict(category_thresholds)
+            self._generation += 1
+            self._resync(inventory)
+
+    def _resync(self, inventory):
+        # Called holding every SKU lock and self._lock, so no change lands between the thresholds and the counts
+        self.total_items = 0
+        self._low_counts = [0] * len(self.thresholds)
+        self._category_totals = dict.fromkeys(self.category_thresholds, 0)
+        self._category_low = dict.fromkeys(self.category_thresholds, 0)
+        for amount, category in inventory.stock_levels():
+            self._apply(None, category, None, amount)
+        self.low_stock_items = self._low_counts[self.thresholds.index(self.low_stock_threshold)]
+
+    def on_change(self, changes):
+        """Inventory store listener: move the changed items across the thresholds."""
+        with self._lock:
+            for item, old_amount, new_amount, old_category in changes:
+                self._apply(old_category, item.category, old_amount, new_amount)
+            self.low_stock_items = self._low_counts[self.thresholds.index(self.low_stock_threshold)]
+
+    def _apply(self, old_category, category, old_amount, new_amount):
+        thresholds = self.thresholds
+        if old_amount is None:
+            self.total_items += 1
+            # Item is low for every threshold above its amount
+            for index in range(bisect_right(thresholds, new_amount), len(thresholds)):
+                self._low_counts[index] += 1
+        elif new_amount is None:
+            self.total_items -= 1
+            for index in range(bisect_right(thresholds, old_amount), len(thresholds)):
+                self._low_counts[index] -= 1
+        else:
+            # Only the thresholds between the old and the new amount are crossed
+            low, high = sorted((old_amount, new_amount))
+            step = 1 if new_amount < old_amount else -1
+            for index in range(bisect_right(thresholds, low), bisect_right(thresholds, high)):
+                self._low_counts[index] += step
 
-    def get_percentage(self):
-        if self.total_items == 0:
+        # An upsert may move the item to another category: leave the old one, then join the new one
+        if old_amount is not None:
+            self._apply_category(old_category, old_amount, -1)
+        if new_amount is not None:
+            self._apply_category(category, new_amount, 1)
+
+    def _apply_category(self, category, amount, step):
+        threshold = self.category_thresholds.get(category)
+        if threshold is None:
+            return
+        self._category_totals[category] += step
+        if amount < threshold:
+            self._category_low[category] += step
+
+    def _counts(self):
+        """Current (main threshold, low count per threshold, total, category totals, category low counts)."""
+        inventory = self._inventory
+        if inventory is not None and is_multiprocess():
+            return self._shared_counts(inventory)
+        with self._lock:
+            return self._snapshot()
+
+    def _snapshot(self):
+        return self.low_stock_threshold, dict(zip(self.thresholds, self._low_counts)), self.total_items, \
+            dict(self._category_totals), dict(self._category_low)
+
+    def _shared_counts(self, inventory):
+        # Read the version first: a change landing during the count only makes the next collection count again
+        version = inventory.version
+        with self._lock:
+            generation = self._generation
+            if self._shared is not None and self._shared[:2] == (version, generation):
+                return self._shared[2]
+            counter = LowStockPercentage(self.low_stock_threshold, self.thresholds, self.category_thresholds)
+        for amount, category in inventory.stock_levels():
+            counter._apply(None, category, None, amount)
+        counts = counter._snapshot()
+        with self._lock:
+            if self._generation == generation:
+                self._shared = (version, generation, counts)
+        return counts
+
+    @staticmethod
+    def _percentage(count, total):
+        if total == 0:
             return 0.0
-        return (self.low_stock_items / self.total_items) * 100
+        return (count / total) * 100
+
+    def get_percentage(self, threshold=None):
+        main_threshold, low_counts, total, _, _ = self._counts()
+        return self._percentage(low_counts[main_threshold if threshold is None else threshold], total)
+
+    def get_category_percentage(self, category):
+        _, _, _, category_totals, category_low = self._counts()
+        return self._percentage(category_low.get(category, 0), category_totals.get(category, 0))
 
     def collect(self):
+        main_threshold, low_counts, total, category_totals, category_low = self._counts()
         metric = GaugeMetricFamily(
             'low_stock_percentage',
             'Percentage of inventory items that are low on stock'
         )
-        metric.add_metric([], self.get_percentage())
+        metric.add_metric([], self._percentage(low_counts[main_threshold], total))
         yield metric
+
+        by_threshold = GaugeMetricFamily(
+            'low_stock_percentage_by_threshold',
+            'Percentage of inventory items with an amount below the threshold',
+            labels=['threshold']
+        )
+        for threshold, count in low_counts.items():
+            by_threshold.add_metric([str(threshold)], self._percentage(count, total))
+        yield by_threshold
+
+        if category_totals:
+            by_category = GaugeMetricFamily(
+                'low_stock_percentage_by_category',
+                'Percentage of items of a category with an amount below the category threshold',
+                labels=['category']
+            )
+            for category, category_total in category_totals.items():
+                by_category.add_metric([category], self._percentage(category_low[category], category_total))
+            yield by_category
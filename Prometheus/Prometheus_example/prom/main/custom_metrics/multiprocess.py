@@ -0,0 +1,40 @@
+import glob
+import os
+
+from prometheus_client import CollectorRegistry
+from prometheus_client.multiprocess import MultiProcessCollector
+
+
+def is_multiprocess():
+    """True when the app runs with several worker processes sharing PROMETHEUS_MULTIPROC_DIR."""
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+def multiprocess_registry(*collectors):
+    """
+    Registry to expose in multiprocess mode: the metrics merged from every worker's
+    mmap files, plus the custom collectors that derive their values from them.
+    """
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    for collector in collectors:
+        registry.register(collector)
+    return registry
+
+
+def merged_values(file_prefix, *sample_names):
+    """
+    Read sample values merged across all worker processes.
+
+    :param file_prefix: Kind of mmap files to read, e.g. 'counter' or 'gauge_mostrecent'.
+    :param sample_names: Names of the samples to return.
+    :return: Dict of sample name to a dict of label values tuple to value.
+    """
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    files = glob.glob(os.path.join(path, f"{file_prefix}_*.db"))
+    values = {name: {} for name in sample_names}
+    for metric in MultiProcessCollector.merge(files, accumulate=False):
+        for sample in metric.samples:
+            if sample.name in values:
+                values[sample.name][tuple(sample.labels.values())] = sample.value
+    return values
@@ -0,0 +1,53 @@
+from bisect import bisect_left
+
+from prometheus_client import Histogram, REGISTRY
+
+
+def price_band_labels(price_bands):
+    """Label of every band the boundaries split prices into: '0To5', '5To10', ..., '1000Above'."""
+    bounds = [0] + list(price_bands)
+    labels = [f"{low:g}To{high:g}" for low, high in zip(bounds, bounds[1:])]
+    return labels + [f"{bounds[-1]:g}Above"]
+
+
+class PurchaseHistogram:
+    """
+    Distribution of purchases by price band: the value of each purchase line
+    (price times units) and the units bought.
+
+    Both are plain prometheus histograms, so ``histogram_quantile`` works on them
+    and with several worker processes they live in the shared mmap files. The
+    band children are created up front, and a purchase finds its band by
+    bisecting the band boundaries, then observes through the public child API.
+    """
+
+    def __init__(self, price_bands=(5, 10, 100, 1000), value_buckets=(5, 10, 25, 50, 100, 250, 500, 1000, 2500, 10000),
+                 units_buckets=(1, 2, 5, 10, 20, 50, 100), registry=REGISTRY):
+        self.price_bands = sorted(price_bands)
+        self.band_labels = price_band_labels(self.price_bands)
+        self.purchase_value = Histogram(
+            'purchase_value', 'Value of purchase lines (price times units) per price band',
+            labelnames=['price_band'], buckets=value_buckets, registry=registry
+        )
+        self.purchase_units = Histogram(
+            'purchase_units', 'Units bought per purchase line per price band',
+            labelnames=['price_band'], buckets=units_buckets, registry=registry
+        )
+        self._bands = [
+            (self.purchase_value.labels(price_band=label), self.purchase_units.labels(price_band=label))
+            for label in self.band_labels
+        ]
+
+    def band(self, price):
+        """Label of the band a price falls in; a band includes its upper boundary."""
+        return self.band_labels[bisect_left(self.price_bands, price)]
+
+    def observe(self, price, amount):
+        value_child, units_child = self._bands[bisect_left(self.price_bands, price)]
+        value_child.observe(price * amount)
+        units_child.observe(amount)
+
+    def observe_many(self, purchases):
+        # Record a batch of (price, amount) purchase lines
+        for price, amount in purchases:
+            self.observe(price, amount)
@@ -1,26 +1,139 @@
-from prometheus_client.core import GaugeMetricFamily
+import threading
+import time
+from collections import deque
+
+from prometheus_client import Counter
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from prom.main.custom_metrics.multiprocess import is_multiprocess, merged_values
 
 
 class PurchaseSuccessRatio:
-    def __init__(self):
-        self.total_purchase_attempts = 0
-        self.successful_purchases = 0
+    """
+    Ratio of successful purchases to purchase attempts, over the process lifetime
+    and over a recent window.
 
-    def increment_attempts(self):
-        self.total_purchase_attempts += 1
+    Purchases are counted on the event loop, so the lock guarding the counts is
+    never contended.
 
-    def increment_successes(self):
-        self.successful_purchases += 1
+    With several worker processes the counts are prometheus counters in the
+    shared mmap files instead, and the ratio is computed from the totals merged
+    across all workers.
 
-    def get_ratio(self):
-        if self.total_purchase_attempts == 0:
+    The windowed ratio compares the current totals with the ones recorded about
+    ``window`` seconds earlier. ``start_recording`` records the totals every
+    ``window / resolution`` seconds on a thread of its own, so the window follows
+    the clock, not the scrapes.
+    """
+
+    def __init__(self, window=300, resolution=30, clock=time.monotonic):
+        self.window = window
+        self._clock = clock
+        self._multiprocess = is_multiprocess()
+        self._attempts = 0
+        self._successes = 0
+        self._lock = threading.Lock()
+        # (time, attempts, successes) as recorded, oldest first
+        self._history = deque([(clock(), 0, 0)])
+        self._history_spacing = window / resolution
+        self._history_lock = threading.Lock()
+        self._recorder = None
+        if self._multiprocess:
+            self.attempts = Counter('purchase_attempts', 'Total number of purchase attempts', registry=None)
+            self.successes = Counter('purchase_successes', 'Total number of successful purchases', registry=None)
+
+    def increment_attempts(self, count=1):
+        if self._multiprocess:
+            self.attempts.inc(count)
+        else:
+            with self._lock:
+                self._attempts += count
+
+    def increment_successes(self, count=1):
+        if self._multiprocess:
+            self.successes.inc(count)
+        else:
+            with self._lock:
+                self._successes += count
+
+    @property
+    def total_purchase_attempts(self):
+        return self._totals()[0]
+
+    @property
+    def successful_purchases(self):
+        return self._totals()[1]
+
+    def _totals(self):
+        if self._multiprocess:
+            values = merged_values('counter', 'purchase_attempts_total', 'purchase_successes_total')
+            return values['purchase_attempts_total'].get((), 0.0), values['purchase_successes_total'].get((), 0.0)
+        with self._lock:
+            return self._attempts, self._successes
+
+    def start_recording(self):
+        """Record the totals for the windowed ratio every ``window / resolution`` seconds, from a daemon thread."""
+        if self._recorder is None:
+            self._recorder = threading.Thread(target=self._record_periodically, name="purchase-ratio", daemon=True)
+            self._recorder.start()
+
+    def _record_periodically(self):
+        while True:
+            time.sleep(self._history_spacing)
+            self.record()
+
+    def record(self):
+        """Remember the current totals as the baseline of the windowed ratio ``window`` seconds from now."""
+        now = self._clock()
+        attempts, successes = self._totals()
+        with self._history_lock:
+            self._history.append((now, attempts, successes))
+            self._forget(now)
+
+    @staticmethod
+    def _ratio(attempts, successes):
+        if attempts == 0:
             return 0.0
-        return self.successful_purchases / self.total_purchase_attempts
+        return successes / attempts
+
+    def get_ratio(self):
+        return self._ratio(*self._totals())
+
+    def get_windowed_ratio(self):
+        """Success ratio of the purchases attempted over about the last ``window`` seconds."""
+        return self._windowed(self._clock(), *self._totals())
+
+    def _windowed(self, now, attempts, successes):
+        with self._history_lock:
+            self._forget(now)
+            _, base_attempts, base_successes = self._history[0]
+        return self._ratio(attempts - base_attempts, successes - base_successes)
+
+    def _forget(self, now):
+        # Keep the newest totals that are at least a window old as the baseline
+        history = self._history
+        while len(history) > 1 and history[1][0] <= now - self.window:
+            history.popleft()
 
     def collect(self):
+        attempts, successes = self._totals()
+        if not self._multiprocess:
+            # In multiprocess mode the counters are exposed from the mmap files
+            yield CounterMetricFamily(
+                'purchase_attempts', 'Total number of purchase attempts', value=attempts
+            )
+            yield CounterMetricFamily(
+                'purchase_successes', 'Total number of successful purchases', value=successes
+            )
         metric = GaugeMetricFamily(
             'purchase_success_ratio',
             'Ratio of successful purchases to total purchase attempts'
         )
-        metric.add_metric([], self.get_ratio())
+        metric.add_metric([], self._ratio(attempts, successes))
+        yield metric
+        metric = GaugeMetricFamily(
+            'purchase_success_ratio_window',
+            f'Ratio of successful purchases to purchase attempts over the last {self.window:g} seconds'
+        )
+        metric.add_metric([], self._windowed(self._clock(), attempts, successes))
         yield metric
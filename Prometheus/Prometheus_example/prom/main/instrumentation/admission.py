@@ -0,0 +1,228 @@
+import asyncio
+import json
+import math
+import random
+import time
+from collections import deque
+from typing import Callable, Dict, NamedTuple, Optional
+
+from fastapi import FastAPI
+from prometheus_client import Counter, Gauge, Histogram
+
+from prom.main.instrumentation.base import PrometheusMetricsBase, metric
+
+SHED_BODY = json.dumps({"detail": "Server is overloaded, retry later"}).encode()
+
+
+class LaneSettings(NamedTuple):
+    """Concurrency limit (initial, lowest and highest), queue length and queue-time budget of one lane."""
+
+    limit: int
+    min_limit: int
+    max_limit: int
+    max_queue: int
+    queue_timeout: float
+
+
+class AdaptiveLimit:
+    """
+    Concurrency limit that follows the latency of the requests it admits (a gradient limit).
+
+    A slow moving average of the latency is the baseline and a fast one the current
+    latency. While the current latency stays within ``tolerance`` times the baseline
+    the limit grows by about its square root per sample; as the current latency
+    rises above that, the limit shrinks in proportion, at most by half per sample.
+    Samples taken while less than half the limit is in use say nothing about the
+    capacity and leave the limit alone. When the latency stays high for long, the
+    baseline drifts up to it, so a lasting change of the workload is accepted.
+
+    ``latency_smoothing`` and ``baseline_smoothing`` are the weights of a new sample
+    in the fast and the slow average; ``smoothing`` is how far the limit moves
+    towards its new target per sample.
+    """
+
+    def __init__(self, limit, min_limit=1, max_limit=1000, tolerance=2.0, smoothing=0.2,
+                 latency_smoothing=0.2, baseline_smoothing=0.01):
+        self.value = float(limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.latency_smoothing = latency_smoothing
+        self.baseline_smoothing = baseline_smoothing
+        self.baseline: Optional[float] = None
+        self.current: Optional[float] = None
+
+    def __int__(self):
+        return int(self.value)
+
+    def on_sample(self, latency: float, in_flight: int):
+        if self.baseline is None:
+            self.baseline = self.current = latency
+            return
+        self.current += (latency - self.current) * self.latency_smoothing
+        self.baseline += (latency - self.baseline) * self.baseline_smoothing
+        if self.baseline * self.tolerance * 2 < self.current:
+            # Drift towards a lasting new latency rather than holding the limit at its minimum
+            self.baseline *= 1.05
+        if in_flight < self.value / 2:
+            return
+        gradient = max(0.5, min(1.0, self.tolerance * self.baseline / self.current))
+        target = self.value * gradient + math.sqrt(self.value)
+        value = self.value * (1 - self.smoothing) + target * self.smoothing
+        self.value = max(self.min_limit, min(self.max_limit, value))
+
+
+class _Lane:
+    def __init__(self, name: str, settings: LaneSettings, metrics):
+        self.name = name
+        self.settings = settings
+        self.limit = AdaptiveLimit(settings.limit, settings.min_limit, settings.max_limit)
+        self.in_flight = 0
+        self.waiters: deque = deque()
+        self.shed_queue_full, self.shed_queue_timeout = (
+            metrics.shed.labels(lane=name, reason=reason) for reason in ("queue_full", "queue_timeout")
+        )
+        self.queued_gauge = metrics.queued.labels(lane=name)
+        self.in_flight_gauge = metrics.in_flight.labels(lane=name)
+        self.limit_gauge = metrics.limit.labels(lane=name)
+        self.queue_wait = metrics.queue_wait.labels(lane=name)
+        self.limit_gauge.set(int(self.limit))
+
+    def retry_after(self) -> int:
+        """
+        Seconds until a slot is likely free (the time to serve the queue ahead at the current latency), spread
+        over up to four times that, so that clients shed in the same burst do not all come back at once.
+        """
+        latency = self.limit.current or self.settings.queue_timeout
+        estimate = max(1, math.ceil(latency * (len(self.waiters) + 1) / max(1, int(self.limit))))
+        return random.randint(estimate, 4 * estimate)
+
+    def dispatch(self):
+        # Hand free slots to the oldest waiters still waiting
+        while self.waiters and self.in_flight < int(self.limit):
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+        self.queued_gauge.set(len(self.waiters))
+        self.in_flight_gauge.set(self.in_flight)
+
+
+class AdmissionControl(PrometheusMetricsBase):
+    """
+    Admission control: every request goes through a lane with a concurrency limit, a bounded
+    queue and a queue-time budget, and excess requests are shed early with 503 and Retry-After.
+
+    ``classify(scope)`` names the lane of a request, or returns None for requests that
+    are always admitted (health checks, scrapes). Lanes are independent, so reads
+    keep their own capacity however many purchases pile up in theirs. Each lane's
+    limit adapts to the latency of the requests it admits (``AdaptiveLimit``): when
+    a lane slows down, fewer of its requests run at once and the rest wait or are
+    shed instead of slowing every request further.
+
+    Limits are per worker process; the metrics add up across workers.
+    """
+
+    shed = metric(Counter, 'admission_shed', 'Requests refused with 503 by admission control', ['lane', 'reason'])
+    queued = metric(Gauge, 'admission_queued', 'Requests waiting for admission', ['lane'], multiprocess_mode='livesum')
+    in_flight = metric(Gauge, 'admission_in_flight', 'Admitted requests in progress', ['lane'],
+                       multiprocess_mode='livesum')
+    limit = metric(Gauge, 'admission_limit', 'Current concurrency limit of a lane', ['lane'],
+                   multiprocess_mode='livesum')
+    queue_wait = metric(
+        Histogram, 'admission_queue_wait_seconds', 'Time admitted requests waited in the queue', ['lane'],
+        buckets=[0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5]
+    )
+
+    def __init__(self, lanes: Dict[str, LaneSettings], classify: Callable[[dict], Optional[str]], *args, **kwargs):
+        self.classify = classify
+        super().__init__(*args, **kwargs)
+        self.lanes = {name: _Lane(name, settings, self) for name, settings in lanes.items()}
+
+    def instrument(self, app: FastAPI, metrics_path: str | None = None):
+        app.add_middleware(AdmissionMiddleware, admission=self)
+        if metrics_path is not None:
+            self.setup_routes(app, metrics_path)
+
+    async def acquire(self, lane: _Lane) -> bool:
+        """Wait for a slot of the lane; False when the request is shed."""
+        if not lane.waiters and lane.in_flight < int(lane.limit):
+            lane.in_flight += 1
+            lane.in_flight_gauge.set(lane.in_flight)
+            lane.queue_wait.observe(0)
+            return True
+        if len(lane.waiters) >= lane.settings.max_queue:
+            lane.shed_queue_full.inc()
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        lane.waiters.append(waiter)
+        lane.queued_gauge.set(len(lane.waiters))
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, lane.settings.queue_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # The client went away while queued; give back a slot it may just have been handed
+            if waiter.done() and not waiter.cancelled():
+                self.release(lane)
+            raise
+        finally:
+            if waiter in lane.waiters:
+                lane.waiters.remove(waiter)
+            lane.queued_gauge.set(len(lane.waiters))
+        if waiter.done() and not waiter.cancelled():
+            lane.queue_wait.observe(time.perf_counter() - start)
+            return True
+        lane.shed_queue_timeout.inc()
+        return False
+
+    def release(self, lane: _Lane, latency: float | None = None, in_flight: int | None = None):
+        lane.in_flight -= 1
+        if latency is not None:
+            lane.limit.on_sample(latency, in_flight)
+            lane.limit_gauge.set(int(lane.limit))
+        lane.dispatch()
+
+
+class AdmissionMiddleware:
+    """ASGI middleware admitting every HTTP request through its lane, or answering 503 right away."""
+
+    def __init__(self, app, admission: AdmissionControl):
+        self.app = app
+        self.admission = admission
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        admission = self.admission
+        name = admission.classify(scope)
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        lane = admission.lanes[name]
+        if not await admission.acquire(lane):
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(SHED_BODY)).encode()),
+                    (b"retry-after", str(lane.retry_after()).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": SHED_BODY})
+            return
+
+        in_flight = lane.in_flight
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        except BaseException:
+            admission.release(lane)
+            raise
+        admission.release(lane, time.perf_counter() - start, in_flight)
@@ -0,0 +1,158 @@
+import asyncio
+import time
+from functools import wraps
+from typing import Any
+
+from fastapi import FastAPI, Response
+from prometheus_client import REGISTRY, generate_latest, start_http_server
+from prometheus_client.exposition import CONTENT_TYPE_LATEST
+
+
+class metric:
+    """
+    Declaration of a prometheus metric on a ``PrometheusMetricsBase`` subclass.
+
+    The metric itself is created when the instrumentation is instantiated, in
+    the instrumentation's registry, and replaces the declaration on the instance:
+
+        class StatusCodeCounterMetrics(PrometheusMetricsBase):
+            status_codes = metric(Counter, 'http_response_status_codes', 'Count of HTTP status codes', ['status_code'])
+    """
+
+    def __init__(self, metric_type, name, documentation, labelnames=(), **kwargs):
+        self.metric_type = metric_type
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.kwargs = kwargs
+
+    def create(self, registry):
+        return self.metric_type(self.name, self.documentation, labelnames=self.labelnames, registry=registry,
+                                **self.kwargs)
+
+
+def timed(observer, exemplar=None):
+    """
+    Decorator observing the run time of a sync or async function into a histogram
+    or summary (or one of its labeled children, bound once at decoration time).
+
+    ``exemplar``, if given, is called with the run time and returns the exemplar
+    labels to attach to the observation (or None); histograms only.
+    """
+    if exemplar is None:
+        observe = observer.observe
+    else:
+        def observe(duration):
+            observer.observe(duration, exemplar(duration))
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start_time = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    observe(time.perf_counter() - start_time)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(time.perf_counter() - start_time)
+        return wrapper
+    return decorator
+
+
+class PrometheusMetricsBase:
+    """
+    Base class for pluggable request instrumentation.
+
+    Subclasses declare their metrics as ``metric(...)`` class attributes and
+    implement the hooks; ``instrument(app)`` installs an ASGI middleware that calls
+    ``before_request`` and ``after_request`` around every HTTP request. The value
+    returned by ``before_request`` is handed back to ``after_request``, so per-request
+    state needs no extra allocation.
+    """
+
+    _metric_declarations: dict = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        declarations = dict(cls._metric_declarations)
+        declarations.update({name: value for name, value in vars(cls).items() if isinstance(value, metric)})
+        cls._metric_declarations = declarations
+
+    def __init__(self, app: FastAPI | None = None, registry=REGISTRY, metrics_path: str | None = None,
+                 metrics_port: int | None = None):
+        self.registry = registry
+        self.initialize_metrics()
+        if app is not None:
+            self.instrument(app, metrics_path)
+        if metrics_port is not None:
+            self.start_server(metrics_port)
+
+    def initialize_metrics(self):
+        """Create the declared metrics in the registry"""
+        for name, declaration in self._metric_declarations.items():
+            setattr(self, name, declaration.create(self.registry))
+
+    def before_request(self, scope: dict) -> Any:
+        """Actions to take before a request; the return value is passed to after_request"""
+        return None
+
+    def after_request(self, scope: dict, status_code: int, state: Any):
+        """Actions to take after a request"""
+
+    def instrument(self, app: FastAPI, metrics_path: str | None = None):
+        """Call the hooks around every request of the app, and optionally serve the metrics"""
+        app.add_middleware(InstrumentationMiddleware, instrumentation=self)
+        if metrics_path is not None:
+            self.setup_routes(app, metrics_path)
+
+    def setup_routes(self, app: FastAPI, metrics_path: str = "/metrics"):
+        """Setup Prometheus metrics route"""
+        registry = self.registry
+
+        @app.get(metrics_path)
+        def metrics_route():
+            return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+    def start_server(self, port: int):
+        """Serve the metrics on a separate port, for apps that do not expose a metrics route"""
+        start_http_server(port, registry=self.registry)
+
+    def metric_decorator(self, observer):
+        """Decorator to record the latency of a specific route into a histogram (child)"""
+        return timed(observer)
+
+
+class InstrumentationMiddleware:
+    """ASGI middleware calling an instrumentation's hooks around every HTTP request."""
+
+    def __init__(self, app, instrumentation: PrometheusMetricsBase):
+        self.app = app
+        self.instrumentation = instrumentation
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        instrumentation = self.instrumentation
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        state = instrumentation.before_request(scope)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            instrumentation.after_request(scope, status_code, state)
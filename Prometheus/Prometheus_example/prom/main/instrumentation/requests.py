@@ -0,0 +1,63 @@
+import time
+
+from prometheus_client import Counter, Histogram, Summary
+
+from prom.main.instrumentation.base import PrometheusMetricsBase, metric
+
+UNMATCHED_ROUTE = "<unmatched>"
+LABELS = ['method', 'route', 'status']
+
+
+class RequestMetrics(PrometheusMetricsBase):
+    """
+    Latency and count of every HTTP request, labeled by method, route template
+    and response status.
+
+    The labeled children are bound the first time a (method, route, status)
+    combination is seen and reused afterwards, so the hot path is one dict
+    lookup instead of three ``labels()`` resolutions.
+
+    ``exemplar``, if given, is called with the latency and returns the exemplar
+    labels attached to the ``request_duration`` observation (or None).
+    """
+
+    request_latency = metric(Summary, 'request_latency_seconds', 'Request latency in seconds', LABELS)
+    requests_total = metric(Counter, 'requests_total', 'Total number of requests', LABELS)
+    request_duration = metric(
+        Histogram, 'request_duration_seconds', 'Histogram of request durations in seconds', LABELS,
+        buckets=[0.1, 0.5, 1, 2, 5, 10]
+    )
+
+    def __init__(self, *args, exemplar=None, **kwargs):
+        self._children = {}
+        self.exemplar = exemplar
+        super().__init__(*args, **kwargs)
+
+    def before_request(self, scope):
+        return time.perf_counter()
+
+    def after_request(self, scope, status_code, start_time):
+        latency = time.perf_counter() - start_time
+        # Route templates, not raw paths, keep the label cardinality bounded
+        path = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+        key = (scope["method"], path, status_code)
+        children = self._children.get(key)
+        if children is None:
+            children = self._bind(*key)
+        latency_child, duration_child, total_child = children
+        latency_child.observe(latency)
+        if self.exemplar is None:
+            duration_child.observe(latency)
+        else:
+            duration_child.observe(latency, self.exemplar(latency))
+        total_child.inc()
+
+    def _bind(self, method, path, status_code):
+        labels = {"method": method.lower(), "route": path, "status": str(status_code)}
+        children = (
+            self.request_latency.labels(**labels),
+            self.request_duration.labels(**labels),
+            self.requests_total.labels(**labels),
+        )
+        self._children[(method, path, status_code)] = children
+        return children
@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from prom.main.utils.warmup import warmup
+
+
+# Create an instance of APIRouter
+router = APIRouter()
+
+
+@router.get("/ready")
+def ready():
+    # 503 until the startup warm-up is done, so load balancers hold traffic back meanwhile
+    return JSONResponse(warmup.report(), status_code=200 if warmup.ready else 503)
@@ -1,8 +1,12 @@
-from fastapi import APIRouter, Body, Depends
-from prom.main.crud.item import root1, add_item1, buy_item1
-from prom.main.schemas.inventory import Inventory
-from prom.main.schemas.item import Item
-from typing import Annotated
+from fastapi import APIRouter, Body, Depends, Header, Query, Request
+from prom.main import config
+from prom.main.crud.item import root1, add_item1, buy_item1, add_items1, buy_items1, inventory_stats1
+from prom.main.schemas.item import Item, ItemAddedResponse, ItemUpdatedResponse
+from prom.main.schemas.purchase import PurchaseLine, PurchaseResponse
+from prom.main.schemas.stats import InventoryStats
+from prom.main.utils.storage import InventoryBackend
+from typing import Annotated, List
+from prom.main.utils.functions import idempotent
 from prom.main.utils.inventory_helper import get_inventory  # Importing get_inventory from prom.py
 
 
@@ -11,21 +15,63 @@ from prom.main.utils.inventory_helper import get_inventory  # Importing get_inve
 router = APIRouter()
 
 
-@router.get("/")
-async def root(inventory: Inventory = Depends(get_inventory)):
-    items = await root1(inventory)
+# Whether a mutating request answers only once its changes are on disk; defaults to WAIT_FOR_DURABILITY
+def wait_for_durability(x_wait_for_durability: bool | None = Header(default=None)) -> bool:
+    return config.WAIT_FOR_DURABILITY if x_wait_for_durability is None else x_wait_for_durability
+
+
+# Client-chosen key of a mutating request; retries with the same key get the first response instead of a rerun
+IdempotencyKey = Annotated[str | None, Header(max_length=255)]
+
+
+@router.get("/", response_model=List[Item], responses={200: {"content": {"application/x-ndjson": {}}}})
+async def root(
+    request: Request,
+    inventory: InventoryBackend = Depends(get_inventory),
+    if_none_match: str | None = Header(default=None),
+    accept: str | None = Header(default=None),
+    prefix: str | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    low_stock: bool = False,
+    cursor: str | None = None,
+    limit: int | None = Query(default=None, ge=1, le=config.LISTING_MAX_PAGE_SIZE),
+):
+    items = await root1(inventory, if_none_match, prefix, min_price, max_price, low_stock, cursor, limit, accept,
+                        request.url)
     return items
 
 
-@router.post("/add_item/")
-async def add_item(item: Item, inventory: Inventory = Depends(get_inventory)):
-    message = await add_item1(item, inventory)
+@router.get("/inventory/stats", response_model=InventoryStats)
+async def inventory_stats(inventory: InventoryBackend = Depends(get_inventory)):
+    stats = await inventory_stats1(inventory)
+    return stats
+
+
+@router.post("/add_item/", response_model=ItemAddedResponse | ItemUpdatedResponse)
+async def add_item(request: Request, item: Item, idempotency_key: IdempotencyKey = None,
+                   inventory: InventoryBackend = Depends(get_inventory), durable: bool = Depends(wait_for_durability)):
+    message = await idempotent(request, idempotency_key, lambda: add_item1(item, inventory, durable))
     return message
 
 
-@router.post("/buy_item/")
-async def buy_item(name: Annotated[str, Body()], amount: Annotated[int, Body()], inventory: Inventory = Depends(get_inventory)):
-    message = await buy_item1(name, amount, inventory)
+@router.post("/buy_item/", response_model=PurchaseResponse)
+async def buy_item(request: Request, name: Annotated[str, Body()], amount: Annotated[int, Body(gt=0)],
+                   idempotency_key: IdempotencyKey = None, inventory: InventoryBackend = Depends(get_inventory),
+                   durable: bool = Depends(wait_for_durability)):
+    message = await idempotent(request, idempotency_key, lambda: buy_item1(name, amount, inventory, durable))
     return message
 
 
+@router.post("/add_items/")
+async def add_items(request: Request, items: Annotated[List[Item], Body(min_length=1)], idempotency_key: IdempotencyKey = None,
+                    inventory: InventoryBackend = Depends(get_inventory), durable: bool = Depends(wait_for_durability)):
+    message = await idempotent(request, idempotency_key, lambda: add_items1(items, inventory, durable))
+    return message
+
+
+@router.post("/buy_items/")
+async def buy_items(request: Request, lines: Annotated[List[PurchaseLine], Body(min_length=1)], idempotency_key: IdempotencyKey = None,
+                    inventory: InventoryBackend = Depends(get_inventory), durable: bool = Depends(wait_for_durability)):
+    message = await idempotent(request, idempotency_key, lambda: buy_items1(lines, inventory, durable))
+    return message
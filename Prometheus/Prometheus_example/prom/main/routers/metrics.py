@@ -1,4 +1,4 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Header
 from prom.main.utils.functions import metrics1
 
 
@@ -7,5 +7,5 @@ router = APIRouter()
 
 
 @router.get("/metrics")
-def metrics():
-    return metrics1()
+def metrics(accept_encoding: str | None = Header(default=None), accept: str | None = Header(default=None)):
+    return metrics1(accept_encoding, accept)
@@ -8,3 +8,13 @@ class Item(BaseModel):
     price: float
     tax: float | None = 12.5
     amount: int  # Quantity of the item
+    category: str | None = None  # Optional category, used for per-category low-stock thresholds
+
+
+# Responses of adding an item: a new item is echoed back, an existing one only gets its amount updated
+class ItemUpdatedResponse(BaseModel):
+    message: str
+
+
+class ItemAddedResponse(ItemUpdatedResponse):
+    item: Item
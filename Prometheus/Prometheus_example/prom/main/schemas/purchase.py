@@ -0,0 +1,13 @@
+from pydantic import BaseModel, Field
+
+
+# Model for one line of a batch purchase
+class PurchaseLine(BaseModel):
+    name: str
+    amount: int = Field(gt=0)  # Quantity to buy
+
+
+# Response of a single purchase
+class PurchaseResponse(BaseModel):
+    message: str
+    remaining: int  # Quantity left in stock
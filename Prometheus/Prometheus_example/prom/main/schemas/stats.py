@@ -0,0 +1,36 @@
+from typing import List
+
+from pydantic import BaseModel
+
+
+# Items whose amount is at most ``le`` (cumulative, as in a Prometheus histogram); le is None for the last bucket
+class QuantityBucket(BaseModel):
+    le: int | None
+    count: int
+
+
+# Items with an amount below the threshold
+class LowStockCount(BaseModel):
+    threshold: int
+    count: int
+    percentage: float
+
+
+# One of the SKUs holding the most stock value (price times amount, before tax)
+class TopItem(BaseModel):
+    name: str
+    price: float
+    amount: int
+    value: float
+
+
+# Stock health of the whole inventory, as of ``version``
+class InventoryStats(BaseModel):
+    version: int
+    items: int
+    units: int
+    stock_value: float
+    stock_value_with_tax: float
+    quantity_histogram: List[QuantityBucket]
+    low_stock: List[LowStockCount]
+    top_by_value: List[TopItem]
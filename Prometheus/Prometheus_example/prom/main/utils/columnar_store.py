@@ -0,0 +1,333 @@
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from math import isnan, nan
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from prom.main.schemas.item import Item
+from prom.main.utils.inventory_store import JournaledBackend
+from prom.main.utils.storage import (
+    BatchRejected, Change, InsufficientStock, ItemNotFound, ItemQuery, StockColumns, requested_amounts,
+)
+
+def _build_item(name, description, price, tax, amount, category) -> Item:
+    """
+    Item from column values. Validating the plain dict is the fastest public way to
+    build a model here: its values are already valid, so pydantic-core only checks
+    their types, which costs less than ``Item.model_construct``'s per-field handling.
+    Listings of a large catalog build an item per row, so this is their hot path.
+    """
+    return Item.model_validate({
+        "name": name, "description": description, "price": price, "tax": None if isnan(tax) else tax,
+        "amount": amount, "category": category,
+    })
+
+
+class ColumnarInventory(JournaledBackend):
+    """
+    In-memory inventory backend for very large catalogs: a column per item field
+    instead of a model per item.
+
+    Prices, taxes and amounts are typed arrays (8 bytes per item each), names and
+    categories are interned strings, and a dict maps every name to its row. The
+    name and (price, name) indexes are sorted arrays of row numbers. ``Item``
+    models are only built for what leaves the store: lookups, listings, query
+    pages, and the changes handed to listeners. Query filters and the low-stock
+    recount read the columns directly.
+
+    Rows follow insertion order, so iteration does too. Removing an item leaves
+    a dead row behind, marked by a name of None (any amount is a valid one);
+    once dead rows outnumber the live ones, the columns are rewritten without them.
+
+    Stock changes run under the item's SKU lock (see ``JournaledBackend``).
+    Adding and removing rows, index walks and compaction also hold the structure
+    lock; a plain stock change only writes the amount of its row.
+    """
+
+    def __init__(self, name: str | None = "Shufersal", items: Iterable[Item] = ()):
+        super().__init__(name)
+        self._names: List[Optional[str]] = []
+        self._descriptions: List[Optional[str]] = []
+        self._categories: List[Optional[str]] = []
+        self._price = array("d")
+        self._tax = array("d")  # NaN when the item has no tax
+        self._amount = array("q")
+        self._rows: Dict[str, int] = {}
+        self._dead = 0
+        self._structure_lock = threading.Lock()
+        # Compaction rewrites the columns in place, so these keys stay valid
+        names, price = self._names, self._price
+        self._name_key = names.__getitem__
+        self._price_key = lambda row: (price[row], names[row])
+
+        for item in items:
+            row = self._rows.get(item.name)
+            if row is None:
+                self._append_row(item)
+            else:
+                self._set_row(row, item)
+        self._by_name = array("q", sorted(self._rows.values(), key=self._name_key))
+        self._by_price = array("q", sorted(self._rows.values(), key=self._price_key))
+
+    # ---- rows ----------------------------------------------------------
+
+    def _item(self, row: int) -> Item:
+        return _build_item(
+            self._names[row], self._descriptions[row], self._price[row], self._tax[row], self._amount[row],
+            self._categories[row],
+        )
+
+    def _append_row(self, item: Item) -> int:
+        row = len(self._names)
+        name = sys.intern(item.name)
+        self._names.append(name)
+        self._descriptions.append(item.description)
+        self._categories.append(None if item.category is None else sys.intern(item.category))
+        self._price.append(item.price)
+        self._tax.append(nan if item.tax is None else item.tax)
+        self._amount.append(item.amount)
+        self._rows[name] = row
+        return row
+
+    def _set_row(self, row: int, item: Item):
+        self._descriptions[row] = item.description
+        self._categories[row] = None if item.category is None else sys.intern(item.category)
+        self._price[row] = item.price
+        self._tax[row] = nan if item.tax is None else item.tax
+        self._amount[row] = item.amount
+
+    def _index(self, row: int):
+        insort(self._by_name, row, key=self._name_key)
+        insort(self._by_price, row, key=self._price_key)
+
+    def _unindex(self, row: int):
+        del self._by_name[bisect_left(self._by_name, self._names[row], key=self._name_key)]
+        del self._by_price[bisect_left(self._by_price, self._price_key(row), key=self._price_key)]
+
+    def _insert(self, item: Item) -> int:
+        # Caller holds the item's SKU lock
+        with self._structure_lock:
+            row = self._append_row(item)
+            self._index(row)
+        return row
+
+    def _remove(self, row: int):
+        # Caller holds the item's SKU lock
+        with self._structure_lock:
+            self._unindex(row)
+            del self._rows[self._names[row]]
+            self._names[row] = self._descriptions[row] = self._categories[row] = None
+            self._dead += 1
+
+    def _maybe_compact(self):
+        """Drop the dead rows once they outnumber the live ones; called without any lock held."""
+        if self._dead <= max(1024, len(self._rows)):
+            return
+        with self.locked_all(), self._structure_lock:
+            if self._dead <= max(1024, len(self._rows)):
+                return  # Another thread compacted meanwhile
+            live = [row for row, name in enumerate(self._names) if name is not None]
+            new_rows = array("q", bytes(8 * len(self._amount)))
+            for new, old in enumerate(live):
+                new_rows[old] = new
+            for column in (self._names, self._descriptions, self._categories):
+                column[:] = [column[row] for row in live]
+            for column in (self._price, self._tax, self._amount):
+                column[:] = array(column.typecode, [column[row] for row in live])
+            for index in (self._by_name, self._by_price):
+                index[:] = array("q", [new_rows[row] for row in index])
+            self._rows.clear()
+            self._rows.update(zip(self._names, range(len(live))))
+            self._dead = 0
+
+    # ---- plain access --------------------------------------------------
+
+    def get(self, name: str) -> Optional[Item]:
+        with self.lock_for(name):
+            row = self._rows.get(name)
+            return None if row is None else self._item(row)
+
+    def upsert(self, item: Item) -> Item:
+        """Insert the item, or replace the item with the same name keeping its position."""
+        with self.lock_for(item.name):
+            row = self._rows.get(item.name)
+            if row is None:
+                row = self._insert(item)
+                old_amount = old_category = None
+            else:
+                old_amount, old_category = self._amount[row], self._categories[row]
+                with self._structure_lock:
+                    # Only the price index depends on the replaced fields
+                    del self._by_price[bisect_left(self._by_price, self._price_key(row), key=self._price_key)]
+                    self._set_row(row, item)
+                    insort(self._by_price, row, key=self._price_key)
+            stored = self._item(row)
+            self._notify([(stored, old_amount, stored.amount, old_category)])
+        return stored
+
+    def delete(self, name: str) -> Optional[Item]:
+        with self.lock_for(name):
+            row = self._rows.get(name)
+            if row is None:
+                return None
+            item = self._item(row)
+            self._remove(row)
+            self._notify([(item, item.amount, None, item.category)])
+        self._maybe_compact()
+        return item
+
+    def items(self) -> List[Item]:
+        with self._structure_lock:
+            columns = (
+                self._names[:], self._descriptions[:], self._price[:], self._tax[:], self._amount[:],
+                self._categories[:],
+            )
+        return [_build_item(*values) for values in zip(*columns) if values[0] is not None]
+
+    def stock_levels(self) -> Iterable[Tuple[int, Optional[str]]]:
+        # Copying two columns is a pair of memcpys; zip then reuses its result tuple while the caller scans
+        with self._structure_lock:
+            amounts, categories = self._amount[:], self._categories[:]
+            names = self._names[:] if self._dead else None
+        if names is None:
+            return zip(amounts, categories)
+        return ((amount, category) for name, amount, category in zip(names, amounts, categories) if name is not None)
+
+    def stock_columns(self) -> StockColumns:
+        with self._structure_lock:
+            names, prices, taxes, amounts = self._names[:], self._price[:], self._tax[:], self._amount[:]
+            dead = self._dead
+        if dead:
+            live = [row for row, name in enumerate(names) if name is not None]
+            names = [names[row] for row in live]
+            prices = array("d", [prices[row] for row in live])
+            taxes = array("d", [taxes[row] for row in live])
+            amounts = array("q", [amounts[row] for row in live])
+        # An item without tax is NaN in the column and a rate of 0 in the analytics
+        return StockColumns(names, prices, array("d", [0.0 if isnan(tax) else tax for tax in taxes]), amounts)
+
+    def query(self, query: ItemQuery, after: Optional[tuple] = None, limit: int = 100) -> List[Item]:
+        rows = []
+        with self._structure_lock:
+            if query.by_price:
+                index, price = self._by_price, self._price
+                start = 0 if query.min_price is None else bisect_left(index, (query.min_price,), key=self._price_key)
+                if after is not None:
+                    start = max(start, bisect_right(index, tuple(after), key=self._price_key))
+                for position in range(start, len(index)):
+                    row = index[position]
+                    if query.max_price is not None and price[row] > query.max_price:
+                        break
+                    if self._matches(query, row):
+                        rows.append(row)
+                        if len(rows) == limit:
+                            break
+            else:
+                index, names = self._by_name, self._names
+                start = 0 if query.prefix is None else bisect_left(index, query.prefix, key=self._name_key)
+                if after is not None:
+                    start = max(start, bisect_right(index, after[0], key=self._name_key))
+                for position in range(start, len(index)):
+                    row = index[position]
+                    if query.prefix is not None and not names[row].startswith(query.prefix):
+                        break  # Past the names with this prefix
+                    if self._matches(query, row):
+                        rows.append(row)
+                        if len(rows) == limit:
+                            break
+            return [self._item(row) for row in rows]
+
+    def _matches(self, query: ItemQuery, row: int) -> bool:
+        price = self._price[row]
+        return (
+            (query.prefix is None or self._names[row].startswith(query.prefix))
+            and (query.min_price is None or price >= query.min_price)
+            and (query.max_price is None or price <= query.max_price)
+            and (query.below_amount is None or self._amount[row] < query.below_amount)
+        )
+
+    # ---- stock changes -------------------------------------------------
+
+    def add(self, item: Item) -> tuple[Item, bool]:
+        with self.lock_for(item.name):
+            change = self._add(item)
+            self._notify([change])
+            return change[0], change[1] is None
+
+    def add_many(self, items: Sequence[Item]) -> List[tuple[Item, bool, int]]:
+        with self.locked(item.name for item in items):
+            changes = [self._add(item) for item in items]
+            results = [(item, old is None, new) for item, old, new, _ in changes]
+            self._notify(changes)
+        return results
+
+    def _add(self, item: Item) -> Change:
+        row = self._rows.get(item.name)
+        if row is None:
+            row = self._insert(item)
+            return self._item(row), None, item.amount, None
+        old_amount = self._amount[row]
+        self._amount[row] = old_amount + item.amount
+        return self._item(row), old_amount, old_amount + item.amount, self._categories[row]
+
+    def take(self, name: str, amount: int) -> tuple[Item, int]:
+        with self.lock_for(name):
+            row = self._rows.get(name)
+            if row is None:
+                raise ItemNotFound(name)
+            old_amount = self._amount[row]
+            if old_amount < amount:
+                raise InsufficientStock(self._item(row), amount)
+            self._amount[row] = left = old_amount - amount
+            item = self._item(row)
+            if left == 0:
+                self._remove(row)
+                self._notify([(item, old_amount, None, item.category)])
+            else:
+                self._notify([(item, old_amount, left, item.category)])
+        if left == 0:
+            self._maybe_compact()
+        return item, left
+
+    def take_many(self, lines: Sequence[tuple[str, int]]) -> List[tuple[Item, int]]:
+        with self.locked(name for name, _ in lines):
+            requested = requested_amounts(lines)
+            errors: Dict[int, Exception] = {}
+            for index, (name, _) in enumerate(lines):
+                row = self._rows.get(name)
+                if row is None:
+                    errors[index] = ItemNotFound(name)
+                elif self._amount[row] < requested[name]:
+                    errors[index] = InsufficientStock(self._item(row), requested[name])
+            if errors:
+                raise BatchRejected(errors)
+
+            rows = {name: self._rows[name] for name in requested}
+            old_amounts = {name: self._amount[row] for name, row in rows.items()}
+            results = []
+            for name, amount in lines:
+                row = rows[name]
+                self._amount[row] -= amount
+                results.append((self._item(row), self._amount[row]))
+            changes = []
+            for name, old_amount in old_amounts.items():
+                row = rows[name]
+                item = self._item(row)
+                if item.amount == 0:
+                    self._remove(row)
+                    changes.append((item, old_amount, None, item.category))
+                else:
+                    changes.append((item, old_amount, item.amount, item.category))
+            self._notify(changes)
+        self._maybe_compact()
+        return results
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._rows
+
+    def __iter__(self) -> Iterator[Item]:
+        return iter(self.items())
+
+    def __len__(self) -> int:
+        return len(self._rows)
@@ -0,0 +1,84 @@
+import gzip
+import threading
+import time
+
+from prometheus_client import REGISTRY, Histogram, generate_latest
+from prometheus_client.exposition import CONTENT_TYPE_LATEST
+from prometheus_client.openmetrics import exposition as openmetrics
+
+METRICS_RENDER_DURATION = Histogram(
+    'metrics_render_duration_seconds',
+    'Time taken to render the /metrics exposition',
+    ['format'],
+    buckets=[0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25]
+)
+
+# Exposition formats: (renderer, content type). Only OpenMetrics carries exemplars.
+TEXT = (generate_latest, CONTENT_TYPE_LATEST)
+OPENMETRICS = (openmetrics.generate_latest, openmetrics.CONTENT_TYPE_LATEST)
+
+
+class _Rendered:
+    __slots__ = ("rendered_at", "body", "gzipped")
+
+    def __init__(self):
+        self.rendered_at = float("-inf")
+        self.body = b""
+        self.gzipped = None
+
+
+class CachedExposition:
+    """
+    Pre-rendered metrics exposition shared by all scrapes within ``ttl`` seconds.
+
+    Collecting the registry (custom collectors included) happens at most once
+    per ``ttl`` and format; concurrent scrapes that find the cache stale wait for
+    a single render instead of rendering in parallel. The gzip body is compressed
+    lazily and cached alongside the plain one. A ``ttl`` of 0 renders on every scrape.
+    """
+
+    def __init__(self, registry=REGISTRY, ttl=1.0):
+        self.registry = registry
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rendered = {TEXT: _Rendered(), OPENMETRICS: _Rendered()}
+
+    def get(self, accept_gzip=False, exposition_format=TEXT):
+        """
+        :param exposition_format: ``TEXT`` or ``OPENMETRICS``.
+        :return: Tuple of (body, content encoding or None).
+        """
+        rendered = self._rendered[exposition_format]
+        if time.monotonic() - rendered.rendered_at >= self.ttl:
+            with self._lock:
+                # Another scrape may have rendered while this one waited for the lock
+                if time.monotonic() - rendered.rendered_at >= self.ttl:
+                    self._render(rendered, exposition_format)
+        body = rendered.body
+        if not accept_gzip:
+            return body, None
+        gzipped = rendered.gzipped
+        if gzipped is None or gzipped[0] is not body:
+            gzipped = rendered.gzipped = (body, gzip.compress(body, compresslevel=5))
+        return gzipped[1], "gzip"
+
+    def _render(self, rendered, exposition_format):
+        render, _ = exposition_format
+        start = time.perf_counter()
+        body = render(self.registry)
+        METRICS_RENDER_DURATION.labels(format="openmetrics" if exposition_format is OPENMETRICS else "text").observe(
+            time.perf_counter() - start
+        )
+        rendered.body = body
+        rendered.rendered_at = time.monotonic()
+
+
+def gzip_accepted(accept_encoding):
+    return any(part.split(";")[0].strip() == "gzip" for part in (accept_encoding or "").split(","))
+
+
+def negotiate_format(accept):
+    """OpenMetrics when the scraper asks for it (Prometheus does), the text format otherwise."""
+    if any(part.split(";")[0].strip() == "application/openmetrics-text" for part in (accept or "").split(",")):
+        return OPENMETRICS
+    return TEXT
@@ -1,63 +1,123 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
+import json
 import os
-import random
-import time
+from concurrent.futures import ThreadPoolExecutor
 
-from prometheus_client import generate_latest
+from starlette.requests import Request
 from starlette.responses import Response
 
-from prom.main.custom_metrics.basicMetrics import DB_OPERATION_DURATION
-from prom.main.schemas.inventory import Inventory
+from prom.main import config
+from prom.main.custom_metrics.basicMetrics import (
+    DB_OPERATION_DURATION, METRICS_REGISTRY, duration_exemplar, idempotency_metrics, low_stock_metric,
+)
+from prom.main.instrumentation.base import timed
 from prom.main.schemas.item import Item
-from dotenv import load_dotenv
+from prom.main.utils.exposition import CachedExposition, gzip_accepted, negotiate_format
+from prom.main.utils.idempotency import IdempotencyCache
+from prom.main.utils.listing import ListingCache
+from prom.main.utils.stats import StatsCache
+from prom.main.utils.storage import InventoryBackend, NotPersisted
 
 
-# Function to load inventory from .env
+# Function to load the legacy inventory from .env
 def load_inventory_from_env():
     items = os.getenv("INVENTORY_ITEMS")
     if items:
         return [Item.parse_raw(item) for item in items.split(";")]
 
 
-# Function to save inventory to .env
-def save_inventory_to_env(inventory):
-    # Serialize the inventory items
-    serialized_items = ";".join([item.json() for item in inventory.items])
+# Rendered exposition shared by scrapes within the configured staleness
+metrics_cache = CachedExposition(registry=METRICS_REGISTRY, ttl=config.METRICS_CACHE_TTL_SECONDS)
 
-    # Load the existing .env file
-    env_path = os.path.join(os.path.dirname(__file__), '../../../.env')
-    load_dotenv(dotenv_path=env_path)
 
-    # Update the environment variable
-    os.environ["INVENTORY_ITEMS"] = serialized_items
+# Serialized inventory listing, reused until the inventory version changes
+listing_cache = ListingCache()
 
-    # Write the new value to the .env file
-    with open(env_path, 'w') as f:
-        for key, value in os.environ.items():
-            if key == "INVENTORY_ITEMS":
-                f.write(f"{key}={serialized_items}\n")
+# Serialized inventory stats, recomputed only when the inventory version changes
+stats_cache = StatsCache()
 
+# Responses of the mutating routes by Idempotency-Key, replayed to retries
+idempotency_cache = IdempotencyCache(
+    ttl=config.IDEMPOTENCY_TTL_SECONDS,
+    max_entries=config.IDEMPOTENCY_MAX_ENTRIES,
+    max_bytes=config.IDEMPOTENCY_MAX_BYTES,
+    metrics=idempotency_metrics,
+)
 
-def metrics1():
-    return Response(content=generate_latest(), media_type='text/plain')
 
+async def idempotent(request: Request, idempotency_key: str | None, operation):
+    """Run a mutating request once per Idempotency-Key; a retry with the same key and body gets the first response."""
+    if idempotency_key is None:
+        return await operation()
+    # Keys are scoped to the route, and bound to the body they first came with
+    key = f"{request.method} {request.url.path} {idempotency_key}"
+    return await idempotency_cache.run(key, _fingerprint(await request.body()), operation)
 
-def calculate_low_stock_percentage(inventory: Inventory):
-    low_stock_threshold = 10
-    low_stock_count = sum(1 for item in inventory.items if item.amount < low_stock_threshold)
-    total_items = len(inventory.items)
-    if total_items == 0:
-        return 0
-    return (low_stock_count / total_items) * 100
 
+def _fingerprint(body: bytes) -> bytes:
+    # Hash the JSON document rather than its bytes, so a retry that serializes it differently still matches
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+    except ValueError:
+        pass
+    return hashlib.blake2b(body, digest_size=16).digest()
 
-def measure_db_operation(func):
-    def wrapper(*args, **kwargs):
-        with DB_OPERATION_DURATION.time():  # Measure the time taken by the decorated function
-            return func(*args, **kwargs)
-    return wrapper
+
+def metrics1(accept_encoding=None, accept=None):
+    exposition_format = negotiate_format(accept)
+    body, encoding = metrics_cache.get(accept_gzip=gzip_accepted(accept_encoding), exposition_format=exposition_format)
+    headers = {"Content-Encoding": encoding} if encoding else None
+    return Response(content=body, media_type=exposition_format[1], headers=headers)
+
+
+def calculate_low_stock_percentage():
+    # Kept up to date incrementally by the low_stock_metric collector, no scan needed
+    return low_stock_metric.get_percentage()
+
+
+# Measure the time taken by the decorated (sync or async) database function
+measure_db_operation = timed(DB_OPERATION_DURATION, exemplar=duration_exemplar)
+
+
+# Bounded pool for blocking database work, so it never runs on the event loop
+db_executor = ThreadPoolExecutor(max_workers=config.DB_POOL_SIZE, thread_name_prefix="db")
 
 
 @measure_db_operation
-def execute_query():
-    # Simulate a database query execution
-    time.sleep(random.uniform(0.1, 1.0))  # Simulating varying query times
+def _timed_call(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+async def run_db_operation(func, *args, **kwargs):
+    """Run a blocking storage call on the db thread pool, timed into DB_OPERATION_DURATION, and await its result."""
+    loop = asyncio.get_running_loop()
+    # Carry the request's context (its current span) into the pool thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(db_executor, functools.partial(context.run, _timed_call, func, *args, **kwargs))
+
+
+def _resolve(future, error):
+    if future.done():
+        return
+    if error is None:
+        future.set_result(None)
+    else:
+        future.set_exception(NotPersisted(f"Failed to persist the changes: {error}"))
+
+
+async def wait_until_durable(inventory: InventoryBackend, timeout: float = config.DURABILITY_TIMEOUT_SECONDS):
+    """
+    Wait until the changes applied so far are persisted (group commit), without holding a thread meanwhile.
+
+    :raises NotPersisted: Persisting them failed, or took longer than ``timeout`` seconds.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    inventory.when_durable(lambda error: loop.call_soon_threadsafe(_resolve, future, error))
+    try:
+        await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        raise NotPersisted(f"The changes were not persisted within {timeout} seconds") from None
@@ -0,0 +1,207 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from starlette.responses import Response
+
+# Rough bookkeeping cost of an entry on top of its key and body, so the byte bound also covers tiny responses
+ENTRY_OVERHEAD_BYTES = 400
+
+
+class IdempotencyConflict(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=422, detail="Idempotency-Key was already used with a different request")
+
+
+class OutcomeUnknown(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=409,
+            detail="The request with this Idempotency-Key was applied but did not complete; "
+                   "check the inventory before retrying with a new key",
+        )
+
+
+class _InFlight:
+    __slots__ = ("fingerprint", "done", "changing")
+
+    def __init__(self, fingerprint: bytes):
+        self.fingerprint = fingerprint
+        self.done = asyncio.get_running_loop().create_future()
+        self.changing = False
+
+
+# The keyed request the current task is running, if any
+_current: ContextVar[Optional[_InFlight]] = ContextVar("idempotent_request", default=None)
+
+
+def begin_change():
+    """
+    Record that the keyed request in progress, if any, is about to change the inventory.
+
+    From then on it is never run again for the same key. If it fails or is
+    cancelled rather than answering, the change may or may not have been
+    applied (a storage call keeps running in its thread after a cancel), so its
+    duplicates get ``OutcomeUnknown``.
+    """
+    in_flight = _current.get()
+    if in_flight is not None:
+        in_flight.changing = True
+
+
+class _Stored:
+    """The final outcome of a keyed request: a response, or an HTTP error it raised."""
+
+    __slots__ = ("fingerprint", "status_code", "body", "headers", "media_type", "error", "expires", "size")
+
+    def __init__(self, key: str, fingerprint: bytes, outcome, expires: float):
+        self.fingerprint = fingerprint
+        self.expires = expires
+        if isinstance(outcome, HTTPException):
+            self.error, self.status_code, self.body, self.headers, self.media_type = outcome, outcome.status_code, b"", {}, None
+        else:
+            self.error, self.status_code, self.body, self.media_type = None, outcome.status_code, outcome.body, outcome.media_type
+            self.headers = {name: value for name, value in outcome.headers.items() if name != "content-length"}
+        self.size = len(key) + len(self.body) + ENTRY_OVERHEAD_BYTES
+
+    def replay(self) -> Response:
+        if self.error is not None:
+            raise HTTPException(self.error.status_code, self.error.detail, {"Idempotent-Replayed": "true"})
+        return Response(self.body, self.status_code, {**self.headers, "Idempotent-Replayed": "true"}, self.media_type)
+
+
+class IdempotencyCache:
+    """
+    Outcomes of mutating requests by ``Idempotency-Key``, so that a retried request
+    is answered with the first response instead of being applied again.
+
+    A key is bound to the request it first came with (its fingerprint); reusing it
+    for a different request is refused. While the original request runs, its
+    duplicates wait for it and get its response. Responses and HTTP errors below
+    500 are stored. After a server error, a crash or a cancelled request nothing
+    is stored and the next duplicate runs the request itself, unless the request
+    had started changing the inventory (``begin_change``): then its duplicates
+    get 409 (``OutcomeUnknown``) rather than risk applying it a second time.
+
+    Stored outcomes expire ``ttl`` seconds after they were recorded, and the least
+    recently used ones are evicted to stay within ``max_entries`` and
+    ``max_bytes``. Everything runs on the event loop, so no locking is needed.
+    Each worker process has its own cache: a retry that lands on another worker
+    is not recognized.
+    """
+
+    def __init__(self, ttl=86400.0, max_entries=10000, max_bytes=16 * 1024 * 1024, metrics=None, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._metrics = metrics
+        self._clock = clock
+        self._stored: OrderedDict[str, _Stored] = OrderedDict()
+        self._in_flight: Dict[str, _InFlight] = {}
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._stored)
+
+    def clear(self):
+        self._stored.clear()
+        self._bytes = 0
+        self._publish()
+
+    async def run(self, key: str, fingerprint: bytes, operation: Callable[[], Awaitable]) -> Response:
+        """
+        The response of ``operation()`` for this key: stored, awaited from the original in flight, or run now.
+
+        A result that is not a ``Response`` is rendered as JSON, as FastAPI would.
+
+        :raises IdempotencyConflict: The key was used with a different request.
+        """
+        waited = False
+        while True:
+            stored = self._get(key)
+            if stored is not None:
+                self._check(stored.fingerprint, fingerprint)
+                self._lookup("in_flight" if waited else "hit")
+                return stored.replay()
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                break
+            self._check(in_flight.fingerprint, fingerprint)
+            waited = True
+            # The original may still fail; then the loop finds nothing stored and this request runs itself
+            await asyncio.shield(in_flight.done)
+
+        self._lookup("miss")
+        in_flight = self._in_flight[key] = _InFlight(fingerprint)
+        token = _current.set(in_flight)
+        try:
+            try:
+                outcome = await operation()
+            except HTTPException as error:
+                self._store(key, fingerprint, in_flight, error)
+                raise
+            except BaseException:
+                self._store(key, fingerprint, in_flight, None)
+                raise
+            if not isinstance(outcome, Response):
+                outcome = JSONResponse(outcome)
+            self._store(key, fingerprint, in_flight, outcome)
+            return outcome
+        finally:
+            _current.reset(token)
+            del self._in_flight[key]
+            in_flight.done.set_result(None)
+
+    def _store(self, key: str, fingerprint: bytes, in_flight: _InFlight, outcome):
+        """Store a final outcome (below 500), or OutcomeUnknown when a changing request failed or was cancelled."""
+        if outcome is None or outcome.status_code >= 500:
+            if not in_flight.changing:
+                return
+            outcome = OutcomeUnknown()
+        self._put(key, _Stored(key, fingerprint, outcome, self._clock() + self.ttl))
+
+    def _check(self, expected: bytes, fingerprint: bytes):
+        if expected != fingerprint:
+            self._lookup("conflict")
+            raise IdempotencyConflict()
+
+    def _get(self, key: str) -> Optional[_Stored]:
+        stored = self._stored.get(key)
+        if stored is None:
+            return None
+        if stored.expires <= self._clock():
+            self._drop(key, expired=True)
+            return None
+        self._stored.move_to_end(key)
+        return stored
+
+    def _put(self, key: str, stored: _Stored):
+        previous = self._stored.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.size
+        self._stored[key] = stored
+        self._bytes += stored.size
+        now = self._clock()
+        while self._stored and (len(self._stored) > self.max_entries or self._bytes > self.max_bytes):
+            oldest, entry = next(iter(self._stored.items()))
+            self._drop(oldest, expired=entry.expires <= now)
+        self._publish()
+
+    def _drop(self, key: str, expired: bool):
+        self._bytes -= self._stored.pop(key).size
+        if self._metrics is not None:
+            (self._metrics.expired if expired else self._metrics.evicted).inc()
+        self._publish()
+
+    def _lookup(self, result: str):
+        if self._metrics is not None:
+            self._metrics.lookup(result)
+
+    def _publish(self):
+        if self._metrics is not None:
+            self._metrics.entries.set(len(self._stored))
+            self._metrics.bytes.set(self._bytes)
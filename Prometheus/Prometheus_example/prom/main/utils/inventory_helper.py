@@ -1,16 +1,70 @@
+import asyncio
+import threading
+
 from dotenv import load_dotenv
+from prom.main import config
+from prom.main.custom_metrics.basicMetrics import low_stock_metric
 from prom.main.utils.functions import load_inventory_from_env
-from prom.main.schemas.inventory import Inventory
+from prom.main.utils.columnar_store import ColumnarInventory
+from prom.main.utils.journal import InventoryJournal
+from prom.main.utils.inventory_store import InventoryStore
+from prom.main.utils.sqlite_store import SQLiteInventory
+from prom.main.utils.storage import InventoryBackend
+
+
+def create_inventory() -> InventoryBackend:
+    """Open the configured storage backend, migrating the inventory kept in the .env file on first start."""
+    # Load environment variables from .env file
+    load_dotenv()
+    if config.STORAGE_BACKEND == "sqlite":
+        backend = SQLiteInventory(
+            config.SQLITE_PATH, pool_size=config.DB_POOL_SIZE, synchronous=config.SQLITE_SYNCHRONOUS
+        )
+        if backend.version == 0:
+            # Nothing was ever written to the database; seed() checks again inside its transaction
+            backend.seed(load_inventory_from_env() or [])
+        return backend
 
+    # Journal that persists every inventory mutation
+    journal = InventoryJournal(
+        config.INVENTORY_DATA_DIR,
+        compact_every=config.JOURNAL_COMPACT_EVERY,
+        fsync=config.JOURNAL_FSYNC,
+        flush_interval=config.JOURNAL_FLUSH_INTERVAL_SECONDS,
+        flush_max_records=config.JOURNAL_FLUSH_MAX_RECORDS,
+    )
+    # Replay the persisted state into an in-memory store
+    store_class = ColumnarInventory if config.STORAGE_BACKEND == "columnar" else InventoryStore
+    store = store_class(items=journal.replay())
+    # Migrate only into a journal that was never written, not into one emptied by purchases
+    if not journal.restored:
+        store = store_class(items=load_inventory_from_env() or [])
+        if store:
+            journal.seed(store)
+    store.add_journal(journal)
+    return store
 
-# Load environment variables from .env file
-load_dotenv()
 
-# Create a global instance of Inventory
-inventory = Inventory()
-inventory.items = load_inventory_from_env()
+# The global inventory, opened by load_inventory: in the background at startup, or by the first request
+inventory: InventoryBackend | None = None
+_inventory_lock = threading.Lock()
 
 
-# Dependency function to provide the inventory instance
-def get_inventory() -> Inventory:
+def load_inventory() -> InventoryBackend:
+    """Open the global inventory on first call and return it; later calls return the same backend."""
+    global inventory
+    with _inventory_lock:
+        if inventory is None:
+            backend = create_inventory()
+            # Count low-stock items once; the listener keeps the counts current from now on
+            low_stock_metric.update_inventory(backend)
+            backend.add_listener(low_stock_metric.on_change)
+            inventory = backend
     return inventory
+
+
+# Dependency function to provide the inventory instance; waits for it off the event loop while it loads
+async def get_inventory() -> InventoryBackend:
+    if inventory is not None:
+        return inventory
+    return await asyncio.to_thread(load_inventory)
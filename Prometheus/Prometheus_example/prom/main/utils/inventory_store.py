@@ -0,0 +1,265 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from prom.main.schemas.item import Item
+from prom.main.utils.storage import (
+    BatchRejected, Change, ChangeListener, InsufficientStock, InventoryBackend, ItemNotFound, ItemQuery,
+    requested_amounts,
+)
+
+
+class JournaledBackend(InventoryBackend):
+    """
+    Base of the in-memory backends: striped SKU locks, change listeners, the
+    version counter and persistence through an ``InventoryJournal``.
+
+    Stock changes check and update an item under a lock that belongs to its SKU.
+    Locks are striped, so purchases of different items run in parallel while
+    purchases of the same item are serialized and cannot oversell. Listeners
+    are called under the same lock, so they observe the changes of an item in
+    the order they happened.
+
+    ``version`` counts the changes; it is bumped right after each one is applied.
+    Changes are persisted by the journal given to ``add_journal``; with a
+    write-behind journal ``when_durable`` follows its flushes.
+    """
+
+    LOCK_STRIPES = 256
+
+    def __init__(self, name: str | None = "Shufersal"):
+        self.name = name
+        self._locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self._listeners: List[ChangeListener] = []
+        self._journal = None
+        self._version = 0
+        self._version_lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def add_listener(self, listener: ChangeListener):
+        self._listeners.append(listener)
+
+    def add_journal(self, journal):
+        """Persist every change through an ``InventoryJournal``."""
+        self._journal = journal
+        self.add_listener(journal.on_change)
+
+    def when_durable(self, callback):
+        if self._journal is None:
+            callback(None)
+        else:
+            self._journal.when_durable(callback)
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+
+    def lock_for(self, name: str) -> threading.Lock:
+        return self._locks[hash(name) % self.LOCK_STRIPES]
+
+    @contextmanager
+    def locked(self, names: Iterable[str]):
+        """Hold the locks of several SKUs, always taken in stripe order to avoid deadlocks."""
+        with self._locked_stripes(sorted({hash(name) % self.LOCK_STRIPES for name in names})):
+            yield
+
+    @contextmanager
+    def _locked_stripes(self, stripes):
+        with ExitStack() as stack:
+            for stripe in stripes:
+                stack.enter_context(self._locks[stripe])
+            yield
+
+    def locked_all(self):
+        """Hold every SKU lock, e.g. to take a consistent view of the whole inventory."""
+        return self._locked_stripes(range(self.LOCK_STRIPES))
+
+    def _notify(self, changes: List[Change]):
+        # Changes of different SKUs are applied in parallel, so the increment needs its own lock
+        with self._version_lock:
+            self._version += 1
+        for listener in self._listeners:
+            listener(changes)
+
+
+class InventoryStore(JournaledBackend):
+    """
+    In-memory inventory backend: items indexed by name, persisted by a journal listener.
+
+    Lookup, upsert and delete are O(1). Iteration follows insertion order, the
+    same order the former ``List[Item]`` had, so listings stay stable.
+
+    Stock changes (``add``/``take``) run under the item's SKU lock (see
+    ``JournaledBackend``).
+
+    Sorted name and (price, name) indexes serve the filtered listing queries.
+    They only change when an item is added, removed or replaced, never on a
+    plain stock change.
+    """
+
+    def __init__(self, name: str | None = "Shufersal", items: Iterable[Item] = ()):
+        super().__init__(name)
+        self._items: Dict[str, Item] = {item.name: item for item in items}
+        self._index_lock = threading.Lock()
+        self._by_name = sorted(self._items)
+        self._by_price = sorted((item.price, item.name) for item in self._items.values())
+
+    def _index(self, item: Item):
+        with self._index_lock:
+            insort(self._by_name, item.name)
+            insort(self._by_price, (item.price, item.name))
+
+    def _unindex(self, item: Item):
+        with self._index_lock:
+            del self._by_name[bisect_left(self._by_name, item.name)]
+            del self._by_price[bisect_left(self._by_price, (item.price, item.name))]
+
+    # ---- plain access --------------------------------------------------
+
+    def get(self, name: str) -> Optional[Item]:
+        return self._items.get(name)
+
+    def upsert(self, item: Item) -> Item:
+        """Insert the item, or replace the item with the same name keeping its position."""
+        with self.lock_for(item.name):
+            previous = self._items.get(item.name)
+            self._items[item.name] = item
+            if previous is not None:
+                self._unindex(previous)
+            self._index(item)
+            if previous is None:
+                self._notify([(item, None, item.amount, None)])
+            else:
+                self._notify([(item, previous.amount, item.amount, previous.category)])
+        return item
+
+    def delete(self, name: str) -> Optional[Item]:
+        with self.lock_for(name):
+            item = self._items.pop(name, None)
+            if item is not None:
+                self._unindex(item)
+                self._notify([(item, item.amount, None, item.category)])
+        return item
+
+    def items(self) -> list[Item]:
+        return list(self._items.values())
+
+    def query(self, query: ItemQuery, after: Optional[tuple] = None, limit: int = 100) -> List[Item]:
+        page = []
+        with self._index_lock:
+            if query.by_price:
+                index = self._by_price
+                start = 0 if query.min_price is None else bisect_left(index, (query.min_price,))
+                if after is not None:
+                    start = max(start, bisect_right(index, tuple(after)))
+                for position in range(start, len(index)):
+                    price, name = index[position]
+                    if query.max_price is not None and price > query.max_price:
+                        break
+                    if self._collect(page, name, query) == limit:
+                        break
+            else:
+                index = self._by_name
+                start = 0 if query.prefix is None else bisect_left(index, query.prefix)
+                if after is not None:
+                    start = max(start, bisect_right(index, after[0]))
+                for position in range(start, len(index)):
+                    name = index[position]
+                    if query.prefix is not None and not name.startswith(query.prefix):
+                        break  # Past the names with this prefix
+                    if self._collect(page, name, query) == limit:
+                        break
+        return page
+
+    def _collect(self, page, name, query):
+        item = self._items.get(name)
+        if item is not None and query.matches(item):
+            page.append(item)
+        return len(page)
+
+    # ---- stock changes -------------------------------------------------
+
+    def add(self, item: Item) -> tuple[Item, bool]:
+        with self.lock_for(item.name):
+            change = self._add(item)
+            self._notify([change])
+            return change[0], change[1] is None
+
+    def add_many(self, items: Sequence[Item]) -> List[tuple[Item, bool, int]]:
+        with self.locked(item.name for item in items):
+            changes = [self._add(item) for item in items]
+            # Report the amount right after each line, as later lines may update the same item
+            results = [(item, old is None, new) for item, old, new, _ in changes]
+            self._notify(changes)
+        return results
+
+    def _add(self, item: Item) -> Change:
+        existing = self._items.get(item.name)
+        if existing is None:
+            self._items[item.name] = item
+            self._index(item)
+            return item, None, item.amount, None
+        old_amount = existing.amount
+        existing.amount += item.amount
+        return existing, old_amount, existing.amount, existing.category
+
+    def take(self, name: str, amount: int) -> tuple[Item, int]:
+        with self.lock_for(name):
+            item = self._items.get(name)
+            if item is None:
+                raise ItemNotFound(name)
+            if item.amount < amount:
+                raise InsufficientStock(item, amount)
+            old_amount = item.amount
+            item.amount -= amount
+            if item.amount == 0:
+                del self._items[name]
+                self._unindex(item)
+                self._notify([(item, old_amount, None, item.category)])
+            else:
+                self._notify([(item, old_amount, item.amount, item.category)])
+            return item, item.amount
+
+    def take_many(self, lines: Sequence[tuple[str, int]]) -> List[tuple[Item, int]]:
+        with self.locked(name for name, _ in lines):
+            requested = requested_amounts(lines)
+            errors: Dict[int, Exception] = {}
+            for index, (name, _) in enumerate(lines):
+                item = self._items.get(name)
+                if item is None:
+                    errors[index] = ItemNotFound(name)
+                elif item.amount < requested[name]:
+                    errors[index] = InsufficientStock(item, requested[name])
+            if errors:
+                raise BatchRejected(errors)
+
+            old_amounts = {name: self._items[name].amount for name in requested}
+            results = []
+            for name, amount in lines:
+                item = self._items[name]
+                item.amount -= amount
+                results.append((item, item.amount))
+            changes = []
+            for name, old_amount in old_amounts.items():
+                item = self._items[name]
+                if item.amount == 0:
+                    del self._items[name]
+                    self._unindex(item)
+                    changes.append((item, old_amount, None, item.category))
+                else:
+                    changes.append((item, old_amount, item.amount, item.category))
+            self._notify(changes)
+            return results
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._items
+
+    def __iter__(self) -> Iterator[Item]:
+        return iter(list(self._items.values()))
+
+    def __len__(self) -> int:
+        return len(self._items)
@@ -0,0 +1,334 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from prom.main.custom_metrics.basicMetrics import (
+    PERSISTENCE_FLUSH_DURATION, PERSISTENCE_FLUSH_RECORDS, PERSISTENCE_QUEUE_RECORDS,
+)
+from prom.main.schemas.item import Item
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = "inventory.snapshot"
+SEGMENT_PREFIX = "inventory.journal."
+LOCK_FILE = "inventory.lock"
+
+
+class JournalInUse(RuntimeError):
+    """Another journal, in this process or another one, is writing to the directory."""
+
+
+class InventoryJournal:
+    """
+    Append-only persistence for the inventory.
+
+    Every mutation appends one compact JSON line ``[seq, op, payload]`` to the
+    active journal segment, so a write costs the same whatever the catalog size.
+    Once a segment holds ``compact_every`` records it is closed and a background
+    thread folds the closed segments into the snapshot.
+
+    The snapshot remembers the last sequence number it contains. Replay loads the
+    snapshot and applies only newer journal records, so a crash at any point of
+    the compaction leaves a state that replays correctly.
+
+    With a ``flush_interval``, records are written behind: they are queued in
+    order and a flusher thread writes (and fsyncs) everything queued with one
+    write, once ``flush_max_records`` are waiting or ``flush_interval`` seconds
+    after the first one was queued. Recording a change then never waits for the
+    disk; callers that need durability register with ``when_durable`` and are
+    called back after the flush that covers their change (group commit).
+    Without an interval every record is written as it is recorded.
+
+    A failed write calls back the waiters it covered with the error. The segment
+    may now end in a torn record, which replay stops at, so it is abandoned and
+    the records are written again into a new segment.
+
+    A directory has a single writer: the journal holds an exclusive lock on it
+    until ``close``. Each writer numbers records from its own sequence, so a
+    second one would have its records skipped on replay.
+    """
+
+    def __init__(self, directory, compact_every=10000, fsync=False, flush_interval=0.0, flush_max_records=1000):
+        self.directory = directory
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.flush_interval = flush_interval
+        self.flush_max_records = flush_max_records
+        # _lock guards the sequence numbers and the queue, _write_lock the segment files
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        self._compactor = None
+        self._seq = 0
+        self._durable_seq = 0
+        self._queue = []
+        self._waiters = deque()  # (seq, callback), in seq order
+        self._segment_no = 0
+        self._segment = None
+        self._segment_records = 0
+        self._flusher = None
+        self._queued = threading.Event()
+        self._full = threading.Event()
+        self._closing = False
+        # Set by replay: whether a snapshot or a journal segment was found, even if it holds no items
+        self.restored = False
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, LOCK_FILE), "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise JournalInUse(f"The inventory journal in {directory} is used by another writer") from None
+
+    # ---- startup -------------------------------------------------------
+
+    def replay(self):
+        """
+        Rebuild the inventory from the snapshot and the journal segments, and set ``restored``.
+
+        :return: List of items in their original insertion order.
+        """
+        with self._write_lock, self._lock:
+            items, seq = self._read_snapshot()
+            segments = self._segments()
+            self.restored = os.path.exists(os.path.join(self.directory, SNAPSHOT_FILE)) or bool(segments)
+            for _, path in segments:
+                seq = self._apply_segment(path, items, seq)
+            self._seq = self._durable_seq = seq
+            self._segment_no = segments[-1][0] + 1 if segments else 0
+            self._open_segment()
+        if self.flush_interval > 0 and self._flusher is None:
+            self._flusher = threading.Thread(target=self._run_flusher, name="inventory-journal-flush", daemon=True)
+            self._flusher.start()
+        return [Item.model_validate(data) for data in items.values()]
+
+    def seed(self, items):
+        """Write a snapshot for an empty journal, e.g. when migrating from the .env file."""
+        with self._write_lock, self._lock:
+            self._seq += 1
+            self._durable_seq = self._seq
+            self._write_snapshot({item.name: item.model_dump() for item in items}, self._seq)
+
+    # ---- write path ----------------------------------------------------
+
+    def record_upsert(self, item):
+        """Record the new state of an item that was added or changed."""
+        self._append(['"u",' + item.model_dump_json()])
+
+    def record_delete(self, name):
+        """Record that an item was removed from the inventory."""
+        self._append(['"d",' + json.dumps(name)])
+
+    def on_change(self, changes):
+        """Inventory store listener: journal every change of an operation with a single write."""
+        self._append([
+            '"d",' + json.dumps(item.name) if new_amount is None else '"u",' + item.model_dump_json()
+            for item, _, new_amount, _ in changes
+        ])
+
+    def _append(self, bodies):
+        with self._lock:
+            for body in bodies:
+                self._seq += 1
+                self._queue.append(f"[{self._seq},{body}]\n")
+            queued = len(self._queue)
+        if self._flusher is None:
+            self._flush()
+            return
+        PERSISTENCE_QUEUE_RECORDS.set(queued)
+        self._queued.set()
+        if queued >= self.flush_max_records:
+            self._full.set()
+
+    def when_durable(self, callback):
+        """
+        Call ``callback(None)`` once every change recorded so far is on disk: at once, or from the flusher thread.
+
+        If the write covering them fails, ``callback`` gets the error instead.
+        """
+        with self._lock:
+            if self._durable_seq < self._seq:
+                self._waiters.append((self._seq, callback))
+                return
+        callback(None)
+
+    # ---- flushing ------------------------------------------------------
+
+    def _run_flusher(self):
+        while True:
+            self._queued.wait()
+            if not self._closing:
+                # Let concurrent writers join the batch, unless enough records are waiting already
+                self._full.wait(self.flush_interval)
+            self._queued.clear()
+            self._full.clear()
+            try:
+                self._flush()
+            except Exception:
+                # The records stay queued and the flush is retried (by close() once closing)
+                logger.exception("Failed to write the inventory journal")
+                if self._closing:
+                    return
+                self._queued.set()
+                time.sleep(max(self.flush_interval, 0.1))
+                continue
+            if self._closing:
+                return
+
+    def _flush(self):
+        """Write every queued record with one write, then call back the waiters it made durable."""
+        with self._write_lock:
+            with self._lock:
+                lines, self._queue = self._queue, []
+                last_seq = self._seq
+            if not lines:
+                return
+            start = time.perf_counter()
+            try:
+                if self._segment is None:
+                    self._open_segment()
+                self._segment.write("".join(lines))
+                self._segment.flush()
+                if self.fsync:
+                    os.fsync(self._segment.fileno())
+            except BaseException as error:
+                self._abandon_segment()
+                with self._lock:
+                    self._queue[:0] = lines
+                    failed = self._pop_waiters(last_seq)
+                for callback in failed:
+                    callback(error)
+                raise
+            PERSISTENCE_FLUSH_DURATION.observe(time.perf_counter() - start)
+            PERSISTENCE_FLUSH_RECORDS.observe(len(lines))
+            self._segment_records += len(lines)
+            if self._segment_records >= self.compact_every:
+                self._rotate()
+            with self._lock:
+                self._durable_seq = last_seq
+                done = self._pop_waiters(last_seq)
+                queued = len(self._queue)
+        if self._flusher is not None:
+            PERSISTENCE_QUEUE_RECORDS.set(queued)
+        for callback in done:
+            callback(None)
+
+    def _pop_waiters(self, last_seq):
+        callbacks = []
+        while self._waiters and self._waiters[0][0] <= last_seq:
+            callbacks.append(self._waiters.popleft()[1])
+        return callbacks
+
+    def _abandon_segment(self):
+        # Part of the batch may have reached the segment, ending it in a torn record that replay
+        # stops at. Nothing may follow it there, so the batch is retried into the next segment;
+        # records written twice are skipped on replay by their sequence number.
+        if self._segment is not None:
+            try:
+                self._segment.close()
+            except OSError:
+                pass
+            self._segment = None
+        self._segment_no += 1
+
+    def _rotate(self):
+        self._segment.close()
+        self._segment_no += 1
+        self._open_segment()
+        if self._compactor is None or not self._compactor.is_alive():
+            self._compactor = threading.Thread(target=self.compact, name="inventory-compactor", daemon=True)
+            self._compactor.start()
+
+    def _open_segment(self):
+        path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self._segment_no}")
+        self._segment = open(path, "a", encoding="utf-8")
+        self._segment_records = 0
+
+    # ---- compaction ----------------------------------------------------
+
+    def compact(self):
+        """Fold every closed journal segment into the snapshot."""
+        with self._compaction_lock:
+            with self._write_lock:
+                active = self._segment_no
+            closed = [(no, path) for no, path in self._segments() if no < active]
+            if not closed:
+                return
+            items, seq = self._read_snapshot()
+            for _, path in closed:
+                seq = self._apply_segment(path, items, seq)
+            self._write_snapshot(items, seq)
+            for _, path in closed:
+                os.remove(path)
+
+    def wait_for_compaction(self):
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+    def close(self):
+        """Write the queued records, stop the flusher and close the active segment."""
+        flusher = self._flusher
+        if flusher is not None:
+            self._closing = True
+            self._queued.set()
+            flusher.join()
+            self._flusher = None
+        self._flush()
+        self.wait_for_compaction()
+        with self._write_lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+        # Closing the file releases the lock
+        self._lock_file.close()
+
+    # ---- file helpers --------------------------------------------------
+
+    def _segments(self):
+        segments = []
+        for file_name in os.listdir(self.directory):
+            suffix = file_name[len(SEGMENT_PREFIX):]
+            if file_name.startswith(SEGMENT_PREFIX) and suffix.isdigit():
+                segments.append((int(suffix), os.path.join(self.directory, file_name)))
+        return sorted(segments)
+
+    def _read_snapshot(self):
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if not os.path.exists(path):
+            return {}, 0
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        return {data["name"]: data for data in snapshot["items"]}, snapshot["seq"]
+
+    def _write_snapshot(self, items, seq):
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"seq": seq, "items": list(items.values())}, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _apply_segment(path, items, seq):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record_seq, op, payload = json.loads(line)
+                except ValueError:
+                    # A torn trailing line from a crash mid-append; nothing after it was acknowledged
+                    logger.warning("Ignoring incomplete journal record in %s", path)
+                    break
+                if record_seq <= seq:
+                    continue
+                if op == "u":
+                    items[payload["name"]] = payload
+                else:
+                    items.pop(payload, None)
+                seq = record_seq
+        return seq
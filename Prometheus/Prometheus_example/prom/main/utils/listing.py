@@ -0,0 +1,76 @@
+import base64
+import hashlib
+import json
+from typing import List, NamedTuple, Optional
+
+from pydantic import TypeAdapter
+
+from prom.main.schemas.item import Item
+from prom.main.utils.storage import ItemQuery
+
+items_json = TypeAdapter(List[Item])
+
+
+class Listing(NamedTuple):
+    version: int
+    etag: str
+    body: bytes
+
+
+class ListingCache:
+    """
+    The serialized inventory listing, kept until the inventory version changes.
+
+    Polls of an unchanged inventory reuse the same JSON body. The ETag is derived
+    from the body rather than from the version, so it stays valid across restarts
+    and is the same on every worker serving the same inventory.
+    """
+
+    def __init__(self):
+        self._listing: Optional[Listing] = None
+
+    def get(self, version: int) -> Optional[Listing]:
+        listing = self._listing
+        if listing is not None and listing.version == version:
+            return listing
+        return None
+
+    def clear(self):
+        self._listing = None
+
+    def put(self, version: int, items: List[Item]) -> Listing:
+        """Serialize the items read at ``version`` (read the version first, then the items)."""
+        body = items_json.dump_json(items)
+        listing = Listing(version, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"', body)
+        self._listing = listing
+        return listing
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches the ETag (weak comparison, as RFC 9110 asks for GET)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def ndjson_accepted(accept: Optional[str]) -> bool:
+    return any(part.split(";")[0].strip() == "application/x-ndjson" for part in (accept or "").split(","))
+
+
+def encode_cursor(sort_key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(sort_key, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor: str, query: ItemQuery) -> tuple:
+    """
+    :raises ValueError: The cursor is malformed or belongs to a listing with a different order.
+    """
+    try:
+        sort_key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as error:
+        raise ValueError("Malformed cursor") from error
+    if not isinstance(sort_key, list) or not query.is_sort_key(sort_key):
+        raise ValueError("Cursor does not match this listing")
+    return tuple(sort_key)
@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+from starlette.responses import Response
+
+
+def model_response(model: BaseModel, status_code: int = 200, headers=None) -> Response:
+    """
+    JSON response for a model that is already valid, serialized once by pydantic-core.
+
+    FastAPI passes a returned ``Response`` through untouched, so the route's
+    ``response_model`` only documents the body.
+    """
+    return Response(
+        content=model.__pydantic_serializer__.to_json(model),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json",
+    )
@@ -0,0 +1,374 @@
+import os
+import queue
+import sqlite3
+import threading
+from array import array
+from contextlib import contextmanager
+from typing import List, Optional, Sequence, Tuple
+
+from prom.main.schemas.item import Item
+from prom.main.utils.storage import (
+    BatchRejected, Change, ChangeListener, InsufficientStock, InventoryBackend, ItemNotFound, ItemQuery,
+    StockColumns, requested_amounts,
+)
+
+COLUMNS = ("name", "description", "price", "tax", "amount", "category")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    description TEXT,
+    price REAL NOT NULL,
+    tax REAL,
+    amount INTEGER NOT NULL,
+    category TEXT
+);
+CREATE INDEX IF NOT EXISTS items_by_price ON items (price, name);
+CREATE TABLE IF NOT EXISTS inventory_version (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO inventory_version (id, version) VALUES (0, 0);
+"""
+
+# Fixed statement texts, so every pooled connection prepares each of them once and
+# reuses it from its statement cache afterwards
+SELECT_ALL = "SELECT name, description, price, tax, amount, category FROM items ORDER BY id"
+SELECT_ONE = "SELECT name, description, price, tax, amount, category FROM items WHERE name = ?"
+SELECT_STOCK_LEVELS = "SELECT amount, category FROM items"
+SELECT_STOCK_COLUMNS = "SELECT name, price, COALESCE(tax, 0), amount FROM items ORDER BY id"
+COUNT = "SELECT COUNT(*) FROM items"
+INSERT = "INSERT INTO items (name, description, price, tax, amount, category) VALUES (?, ?, ?, ?, ?, ?)"
+UPSERT = (
+    "INSERT INTO items (name, description, price, tax, amount, category) VALUES (?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (name) DO UPDATE SET description = excluded.description, price = excluded.price, "
+    "tax = excluded.tax, amount = excluded.amount, category = excluded.category"
+)
+SET_AMOUNT = "UPDATE items SET amount = ? WHERE name = ?"
+DELETE = "DELETE FROM items WHERE name = ?"
+SELECT_VERSION = "SELECT version FROM inventory_version WHERE id = 0"
+BUMP_VERSION = "UPDATE inventory_version SET version = version + 1 WHERE id = 0"
+
+
+def _prefix_end(prefix: str) -> Optional[str]:
+    """Smallest string greater than every string starting with ``prefix`` (None if there is none)."""
+    while prefix:
+        last = ord(prefix[-1])
+        if last < 0x10FFFF:
+            return prefix[:-1] + chr(last + 1)
+        prefix = prefix[:-1]
+    return None
+
+
+def _query_sql(query: ItemQuery, after: Optional[tuple], limit: int):
+    # The statement text only depends on which filters are set, so the few variants
+    # stay in the connections' statement caches
+    clauses, params = [], []
+    if query.prefix:
+        clauses.append("name >= ?")
+        params.append(query.prefix)
+        end = _prefix_end(query.prefix)
+        if end is not None:
+            clauses.append("name < ?")
+            params.append(end)
+    if query.min_price is not None:
+        clauses.append("price >= ?")
+        params.append(query.min_price)
+    if query.max_price is not None:
+        clauses.append("price <= ?")
+        params.append(query.max_price)
+    if query.below_amount is not None:
+        clauses.append("amount < ?")
+        params.append(query.below_amount)
+    if after is not None:
+        clauses.append("(price, name) > (?, ?)" if query.by_price else "name > ?")
+        params.extend(after)
+    order = "price, name" if query.by_price else "name"
+    where = " AND ".join(clauses) or "1"
+    params.append(limit)
+    return f"SELECT {', '.join(COLUMNS)} FROM items WHERE {where} ORDER BY {order} LIMIT ?", params
+
+
+def _item(row) -> Item:
+    # Rows were validated on the way in
+    return Item.model_construct(**dict(zip(COLUMNS, row)))
+
+
+def _row(item: Item):
+    return item.name, item.description, item.price, item.tax, item.amount, item.category
+
+
+class ConnectionPool:
+    """
+    Up to ``size`` SQLite connections shared by the db threads.
+
+    Connections are opened on first use in WAL mode, so readers never wait for the
+    writer, and are handed out most recently used first.
+    """
+
+    def __init__(self, path, size=16, synchronous="NORMAL", busy_timeout=30.0):
+        self.path = path
+        self.size = size
+        self.synchronous = synchronous
+        self.busy_timeout = busy_timeout
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def connect(self):
+        """Open a new connection configured like the pooled ones."""
+        connection = sqlite3.connect(
+            self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False, cached_statements=64
+        )
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute(f"PRAGMA synchronous = {self.synchronous}")
+        return connection
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                connection = self.connect()
+                self._connections.append(connection)
+                return connection
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        connection = self._acquire()
+        try:
+            yield connection
+        finally:
+            self._idle.put(connection)
+
+    @contextmanager
+    def transaction(self):
+        """A connection inside a write transaction, committed on success and rolled back on error."""
+        with self.connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+            self._opened = 0
+            self._idle = queue.LifoQueue()
+
+
+class SQLiteInventory(InventoryBackend):
+    """
+    Inventory backend persisted in a SQLite database.
+
+    Reads run in parallel on pooled connections. Every stock change checks and
+    updates the rows inside one ``BEGIN IMMEDIATE`` transaction, so a purchase
+    cannot oversell and a batch is applied completely or not at all, also across
+    processes sharing the database file.
+
+    Within the process, writers take a lock before opening their transaction:
+    SQLite runs one writer at a time anyway, and queuing on the lock is much
+    cheaper than SQLite's busy-retry sleeps. Listeners are called under the same
+    lock, after the commit, so they observe the changes in commit order.
+
+    ``version`` is stored in the database and bumped by every write transaction,
+    so it also reflects the changes made by other processes. It is read on a
+    connection of its own, which never waits for the pool.
+    """
+
+    def __init__(self, path, name: str | None = "Shufersal", pool_size=16, synchronous="NORMAL"):
+        self.name = name
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.pool = ConnectionPool(path, size=pool_size, synchronous=synchronous)
+        self._write_lock = threading.Lock()
+        self._listeners: List[ChangeListener] = []
+        with self.pool.connection() as connection:
+            connection.executescript(SCHEMA)
+        self._version_connection = self.pool.connect()
+        self._version_lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        with self._version_lock:
+            return self._version_connection.execute(SELECT_VERSION).fetchone()[0]
+
+    def add_listener(self, listener: ChangeListener):
+        self._listeners.append(listener)
+
+    def locked_all(self):
+        return self._write_lock
+
+    @contextmanager
+    def _writing(self):
+        with self._write_lock:
+            with self.pool.transaction() as connection:
+                changes: List[Change] = []
+                yield connection, changes
+                if changes:
+                    connection.execute(BUMP_VERSION)
+            # Committed; still under the write lock so listeners see the commit order
+            if changes:
+                self._notify(changes)
+
+    def _notify(self, changes: List[Change]):
+        for listener in self._listeners:
+            listener(changes)
+
+    # ---- plain access --------------------------------------------------
+
+    def get(self, name: str) -> Optional[Item]:
+        with self.pool.connection() as connection:
+            row = connection.execute(SELECT_ONE, (name,)).fetchone()
+        return _item(row) if row is not None else None
+
+    def items(self) -> List[Item]:
+        with self.pool.connection() as connection:
+            rows = connection.execute(SELECT_ALL).fetchall()
+        return [_item(row) for row in rows]
+
+    def stock_levels(self) -> List[Tuple[int, Optional[str]]]:
+        with self.pool.connection() as connection:
+            return connection.execute(SELECT_STOCK_LEVELS).fetchall()
+
+    def stock_columns(self) -> StockColumns:
+        with self.pool.connection() as connection:
+            rows = connection.execute(SELECT_STOCK_COLUMNS).fetchall()
+        names, prices, taxes, amounts = zip(*rows) if rows else ((), (), (), ())
+        return StockColumns(list(names), array("d", prices), array("d", taxes), array("q", amounts))
+
+    def query(self, query: ItemQuery, after: Optional[tuple] = None, limit: int = 100) -> List[Item]:
+        sql, params = _query_sql(query, after, limit)
+        with self.pool.connection() as connection:
+            rows = connection.execute(sql, params).fetchall()
+        return [_item(row) for row in rows]
+
+    def __len__(self) -> int:
+        with self.pool.connection() as connection:
+            return connection.execute(COUNT).fetchone()[0]
+
+    def upsert(self, item: Item) -> Item:
+        with self._writing() as (connection, changes):
+            previous = connection.execute(SELECT_ONE, (item.name,)).fetchone()
+            connection.execute(UPSERT, _row(item))
+            if previous is None:
+                changes.append((item, None, item.amount, None))
+            else:
+                changes.append((item, previous[4], item.amount, previous[5]))
+        return item
+
+    def seed(self, items: Sequence[Item]) -> bool:
+        """
+        Insert the items into a database nothing was ever written to, e.g. when migrating from the .env file.
+
+        Every write transaction bumps the version, so version 0 marks a fresh database
+        however many items it holds now. Checked inside the write transaction, so of
+        several processes opening the same fresh database only one seeds it.
+
+        :return: Whether the items were inserted.
+        """
+        if not items:
+            return False
+        with self._writing() as (connection, changes):
+            if connection.execute(SELECT_VERSION).fetchone()[0] != 0:
+                return False
+            changes.extend(self._add(connection, item) for item in items)
+        return True
+
+    def delete(self, name: str) -> Optional[Item]:
+        with self._writing() as (connection, changes):
+            row = connection.execute(SELECT_ONE, (name,)).fetchone()
+            if row is None:
+                return None
+            connection.execute(DELETE, (name,))
+            item = _item(row)
+            changes.append((item, item.amount, None, item.category))
+        return item
+
+    # ---- stock changes -------------------------------------------------
+
+    def add(self, item: Item) -> Tuple[Item, bool]:
+        with self._writing() as (connection, changes):
+            change = self._add(connection, item)
+            changes.append(change)
+        return change[0], change[1] is None
+
+    def add_many(self, items: Sequence[Item]) -> List[Tuple[Item, bool, int]]:
+        with self._writing() as (connection, changes):
+            changes.extend(self._add(connection, item) for item in items)
+        return [(item, old is None, new) for item, old, new, _ in changes]
+
+    @staticmethod
+    def _add(connection, item: Item) -> Change:
+        row = connection.execute(SELECT_ONE, (item.name,)).fetchone()
+        if row is None:
+            connection.execute(INSERT, _row(item))
+            return item, None, item.amount, None
+        existing = _item(row)
+        old_amount = existing.amount
+        existing.amount += item.amount
+        connection.execute(SET_AMOUNT, (existing.amount, item.name))
+        return existing, old_amount, existing.amount, existing.category
+
+    def take(self, name: str, amount: int) -> Tuple[Item, int]:
+        with self._writing() as (connection, changes):
+            row = connection.execute(SELECT_ONE, (name,)).fetchone()
+            if row is None:
+                raise ItemNotFound(name)
+            item = _item(row)
+            if item.amount < amount:
+                raise InsufficientStock(item, amount)
+            changes.append(self._take(connection, item, amount))
+        return item, item.amount
+
+    def take_many(self, lines: Sequence[Tuple[str, int]]) -> List[Tuple[Item, int]]:
+        with self._writing() as (connection, changes):
+            requested = requested_amounts(lines)
+            items = {}
+            for name in requested:
+                row = connection.execute(SELECT_ONE, (name,)).fetchone()
+                if row is not None:
+                    items[name] = _item(row)
+            errors = {}
+            for index, (name, _) in enumerate(lines):
+                item = items.get(name)
+                if item is None:
+                    errors[index] = ItemNotFound(name)
+                elif item.amount < requested[name]:
+                    errors[index] = InsufficientStock(item, requested[name])
+            if errors:
+                raise BatchRejected(errors)
+
+            remaining = {name: item.amount for name, item in items.items()}
+            results = []
+            for name, amount in lines:
+                remaining[name] -= amount
+                results.append((items[name], remaining[name]))
+            changes.extend(self._take(connection, items[name], amount) for name, amount in requested.items())
+        return results
+
+    @staticmethod
+    def _take(connection, item: Item, amount: int) -> Change:
+        old_amount = item.amount
+        item.amount -= amount
+        if item.amount == 0:
+            connection.execute(DELETE, (item.name,))
+            return item, old_amount, None, item.category
+        connection.execute(SET_AMOUNT, (item.amount, item.name))
+        return item, old_amount, item.amount, item.category
+
+    def close(self):
+        self.pool.close()
+        self._version_connection.close()
@@ -0,0 +1,81 @@
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from heapq import nlargest
+from math import fsum
+from operator import mul
+from typing import Optional, Sequence, Tuple
+
+from prom.main.schemas.stats import InventoryStats, LowStockCount, QuantityBucket, TopItem
+from prom.main.utils.storage import StockColumns
+
+
+def compute_stats(columns: StockColumns, version: int, quantity_buckets: Sequence[int], thresholds: Sequence[int],
+                  top_items: int) -> InventoryStats:
+    """
+    Stock health of the inventory from its columns.
+
+    Every figure is one pass of a builtin (``map``, ``fsum``, ``Counter``,
+    ``nlargest``) over whole columns, so the per-item work runs in C rather
+    than in a Python loop.
+    """
+    names, prices, taxes, amounts = columns
+    quantity_buckets, thresholds = sorted(quantity_buckets), sorted(thresholds)
+    values = list(map(mul, prices, amounts))
+    stock_value = fsum(values)
+    tax_value = fsum(map(mul, values, taxes)) / 100
+
+    # Catalogs hold far fewer distinct amounts than items: count those once, then place them in the
+    # histogram buckets and below the thresholds
+    per_bucket, first_low = Counter(), Counter()
+    for amount, items in Counter(amounts).items():
+        per_bucket[bisect_left(quantity_buckets, amount)] += items
+        # An amount is low for every threshold from the first one above it on
+        first_low[bisect_right(thresholds, amount)] += items
+
+    histogram, count = [], 0
+    for index, bound in enumerate(quantity_buckets + [None]):
+        count += per_bucket[index]
+        histogram.append(QuantityBucket(le=bound, count=count))
+
+    low_stock, count = [], 0
+    for index, threshold in enumerate(thresholds):
+        count += first_low[index]
+        low_stock.append(LowStockCount(
+            threshold=threshold, count=count, percentage=count / len(amounts) * 100 if amounts else 0.0
+        ))
+
+    top = nlargest(top_items, range(len(values)), key=values.__getitem__)
+    return InventoryStats(
+        version=version,
+        items=len(amounts),
+        units=sum(amounts),
+        stock_value=stock_value,
+        stock_value_with_tax=stock_value + tax_value,
+        quantity_histogram=histogram,
+        low_stock=low_stock,
+        top_by_value=[TopItem(name=names[row], price=prices[row], amount=amounts[row], value=values[row]) for row in top],
+    )
+
+
+class StatsCache:
+    """
+    The serialized inventory stats, kept until the inventory version changes, so
+    dashboards polling an unchanged inventory cost no recomputation.
+    """
+
+    def __init__(self):
+        self._stats: Optional[Tuple[int, bytes]] = None
+
+    def get(self, version: int) -> Optional[bytes]:
+        stats = self._stats
+        if stats is not None and stats[0] == version:
+            return stats[1]
+        return None
+
+    def clear(self):
+        self._stats = None
+
+    def put(self, stats: InventoryStats) -> bytes:
+        body = stats.__pydantic_serializer__.to_json(stats)
+        self._stats = (stats.version, body)
+        return body
@@ -0,0 +1,209 @@
+from abc import ABC, abstractmethod
+from array import array
+from typing import Callable, ContextManager, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from prom.main.schemas.item import Item
+
+# A change is (item, old_amount, new_amount, old_category). old_amount is None for a new
+# item and new_amount is None for a removed one; old_category is the category the item
+# had before, which an upsert may have replaced. Listeners receive every change of one
+# operation at once, so a batch can be persisted with a single write.
+Change = Tuple[Item, Optional[int], Optional[int], Optional[str]]
+ChangeListener = Callable[[List[Change]], None]
+
+
+class ItemNotFound(LookupError):
+    pass
+
+
+class InsufficientStock(ValueError):
+    def __init__(self, item: Item, requested: int):
+        super().__init__(f"Only {item.amount} of '{item.name}' in stock, {requested} requested")
+        self.item = item
+        self.requested = requested
+
+
+class NotPersisted(RuntimeError):
+    """Changes were applied, but could not be persisted (yet)."""
+
+
+class BatchRejected(Exception):
+    """A batch purchase was refused as a whole; ``errors`` maps line index to the reason."""
+
+    def __init__(self, errors: Dict[int, Exception]):
+        super().__init__(f"{len(errors)} line(s) of the batch cannot be fulfilled")
+        self.errors = errors
+
+
+class ItemQuery(NamedTuple):
+    """
+    Filters of a listing query. Results come in name order, or in (price, name)
+    order when a price bound is given, so that either filter can use its index.
+    """
+
+    prefix: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    below_amount: Optional[int] = None  # Only items with a smaller amount, e.g. the low-stock threshold
+
+    @property
+    def by_price(self) -> bool:
+        return self.min_price is not None or self.max_price is not None
+
+    def sort_key(self, item: Item) -> tuple:
+        """Position of an item in the result order; pass the last one back as ``after`` to get the next page."""
+        return (item.price, item.name) if self.by_price else (item.name,)
+
+    def is_sort_key(self, key: tuple) -> bool:
+        """Whether ``key`` has the shape of this query's sort keys, so it can be compared with the index entries."""
+        if self.by_price:
+            return (
+                len(key) == 2 and isinstance(key[0], (int, float)) and not isinstance(key[0], bool)
+                and isinstance(key[1], str)
+            )
+        return len(key) == 1 and isinstance(key[0], str)
+
+    def matches(self, item: Item) -> bool:
+        return (
+            (self.prefix is None or item.name.startswith(self.prefix))
+            and (self.min_price is None or item.price >= self.min_price)
+            and (self.max_price is None or item.price <= self.max_price)
+            and (self.below_amount is None or item.amount < self.below_amount)
+        )
+
+
+class StockColumns(NamedTuple):
+    """Per-item columns of the whole inventory, in insertion order, for analytics passes over every item."""
+
+    names: Sequence[str]
+    prices: Sequence[float]
+    taxes: Sequence[float]  # Tax rate in percent, 0 for an item without tax
+    amounts: Sequence[int]
+
+
+class InventoryBackend(ABC):
+    """
+    Storage the inventory routes go through.
+
+    Every method may block on I/O, so the CRUD functions call them on the db
+    thread pool (``run_db_operation``). Stock changes are atomic per call: a
+    purchase never oversells and a batch is applied completely or not at all.
+    Listeners get the changes of each call once they are applied.
+    """
+
+    name: str | None = "Shufersal"
+
+    @property
+    @abstractmethod
+    def version(self) -> int:
+        """Number that changes whenever the inventory changes, e.g. to validate caches; may block like the rest."""
+
+    @abstractmethod
+    def add_listener(self, listener: ChangeListener):
+        ...
+
+    @abstractmethod
+    def locked_all(self) -> ContextManager:
+        """Hold off every change, e.g. to take a consistent view of the whole inventory."""
+
+    @abstractmethod
+    def get(self, name: str) -> Optional[Item]:
+        ...
+
+    @abstractmethod
+    def items(self) -> List[Item]:
+        """Every item, in insertion order."""
+
+    def stock_levels(self) -> Iterable[Tuple[int, Optional[str]]]:
+        """(amount, category) of every item, e.g. to recount the low-stock metrics without building whole items."""
+        return [(item.amount, item.category) for item in self.items()]
+
+    def stock_columns(self) -> StockColumns:
+        """Name, price, tax and amount of every item, as columns."""
+        items = self.items()
+        return StockColumns(
+            [item.name for item in items], array("d", [item.price for item in items]),
+            array("d", [item.tax or 0.0 for item in items]), array("q", [item.amount for item in items]),
+        )
+
+    @abstractmethod
+    def query(self, query: ItemQuery, after: Optional[tuple] = None, limit: int = 100) -> List[Item]:
+        """
+        Up to ``limit`` items matching the query, in query order, starting after the ``after`` sort key.
+
+        Walks the name or price index from the first possible match, so the cost
+        depends on the page, not on the catalog size.
+        """
+
+    @abstractmethod
+    def upsert(self, item: Item) -> Item:
+        """Insert the item, or replace the item with the same name."""
+
+    @abstractmethod
+    def delete(self, name: str) -> Optional[Item]:
+        ...
+
+    @abstractmethod
+    def add(self, item: Item) -> Tuple[Item, bool]:
+        """
+        Add the item's amount to the stock, inserting the item if it is new.
+
+        :return: The stored item and whether it was newly created.
+        """
+
+    @abstractmethod
+    def add_many(self, items: Sequence[Item]) -> List[Tuple[Item, bool, int]]:
+        """
+        Add several items at once; listeners get the whole batch in one call.
+
+        :return: For each line, the stored item, whether it was created and its amount after that line.
+        """
+
+    @abstractmethod
+    def take(self, name: str, amount: int) -> Tuple[Item, int]:
+        """
+        Remove ``amount`` units of an item from the stock; the item is deleted when none are left.
+
+        :return: The item and the amount left right after this purchase.
+        :raises ItemNotFound: No item with this name.
+        :raises InsufficientStock: Fewer than ``amount`` units are in stock.
+        """
+
+    @abstractmethod
+    def take_many(self, lines: Sequence[Tuple[str, int]]) -> List[Tuple[Item, int]]:
+        """
+        Take several (name, amount) lines at once: either every line is fulfilled or none is.
+
+        :return: For each line, the item and the amount left right after that line.
+        :raises BatchRejected: At least one line cannot be fulfilled; nothing was changed.
+        """
+
+    def when_durable(self, callback: Callable[[Optional[Exception]], None]):
+        """
+        Call ``callback(None)`` once every change applied so far is persisted, possibly from another thread,
+        or ``callback(error)`` if persisting them failed.
+
+        Backends that persist each change before the call returns, like SQLite, call it at once.
+        """
+        callback(None)
+
+    def close(self):
+        """Release the backend's files and connections."""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def __iter__(self) -> Iterator[Item]:
+        return iter(self.items())
+
+
+def requested_amounts(lines: Iterable[Tuple[str, int]]) -> Dict[str, int]:
+    """Total amount requested per item over the lines of a batch purchase."""
+    requested: Dict[str, int] = {}
+    for name, amount in lines:
+        requested[name] = requested.get(name, 0) + amount
+    return requested
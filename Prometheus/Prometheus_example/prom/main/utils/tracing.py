@@ -0,0 +1,72 @@
+from opentelemetry.trace import format_span_id, format_trace_id, get_current_span
+from prometheus_client import Counter, Gauge, Histogram
+
+from prom.main import config
+
+# The OpenTelemetry SDK and the OTLP exporter are only imported by start_trace_export,
+# which the app runs in the background once it accepts connections
+
+SPANS_QUEUED = Gauge('otel_export_queue_spans', 'Spans waiting in the export queue', multiprocess_mode='livesum')
+SPANS_EXPORTED = Counter('otel_spans_exported', 'Spans handed to the exporter successfully')
+SPANS_DROPPED = Counter('otel_spans_dropped', 'Spans dropped before export', ['reason'])
+EXPORT_DURATION = Histogram(
+    'otel_export_duration_seconds', 'Time taken by one export call',
+    buckets=[0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10]
+)
+
+
+def trace_exemplar(duration):
+    """
+    Exemplar labels linking an observation to the current trace, or None.
+
+    Only traces that reach Tempo get one: sampled traces, and recorded-only traces
+    when the observation alone makes the request slow enough to be kept.
+    """
+    span = get_current_span()
+    span_context = span.get_span_context()
+    if not span_context.trace_flags.sampled and not (span.is_recording() and duration >= config.TRACE_SLOW_SECONDS):
+        return None
+    return {"trace_id": format_trace_id(span_context.trace_id), "span_id": format_span_id(span_context.span_id)}
+
+
+def instrument_app(app, excluded_paths):
+    """
+    Install the FastAPI instrumentation; excluded routes get no span at all.
+
+    It traces through the global tracer provider, so spans start being recorded
+    once start_trace_export has installed the SDK provider.
+    """
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+
+    FastAPIInstrumentor.instrument_app(
+        app,
+        excluded_urls=",".join(excluded_paths),
+        exclude_spans=["receive", "send"],
+    )
+
+
+def start_trace_export(endpoint, ratio, excluded_paths, slow_threshold, max_queue_size, max_export_batch_size):
+    """Install the SDK tracer provider with the sampler and the OTLP exporter pipeline, and return it."""
+    from opentelemetry import trace
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+
+    from prom.main.utils.tracing_sdk import TailKeepingSpanProcessor, make_sampler
+
+    # Set up OpenTelemetry tracing with a service name
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": "my_fastapi_service"}),
+        sampler=make_sampler(ratio, excluded_paths),
+    )
+
+    # Configure the OTLP exporter to send traces to Tempo through the bounded queue
+    otlp_exporter = OTLPSpanExporter(endpoint=endpoint, insecure=True)
+    provider.add_span_processor(TailKeepingSpanProcessor(
+        otlp_exporter,
+        max_queue_size=max_queue_size,
+        max_export_batch_size=max_export_batch_size,
+        slow_threshold=slow_threshold,
+    ))
+    trace.set_tracer_provider(provider)
+    return provider
@@ -0,0 +1,193 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+from opentelemetry.context import Context, attach, detach, set_value, _SUPPRESS_INSTRUMENTATION_KEY
+from opentelemetry.sdk.trace import SpanProcessor
+from opentelemetry.sdk.trace.export import SpanExportResult
+from opentelemetry.sdk.trace.sampling import (
+    ALWAYS_OFF, ALWAYS_ON, Decision, ParentBased, Sampler, SamplingResult, TraceIdRatioBased,
+)
+from opentelemetry.trace import StatusCode
+
+from prom.main.utils.tracing import EXPORT_DURATION, SPANS_DROPPED, SPANS_EXPORTED, SPANS_QUEUED
+
+logger = logging.getLogger(__name__)
+
+
+class _RecordOnly(Sampler):
+    """Record the span so it can still be kept later (error, slow), without sampling it."""
+
+    def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None):
+        return SamplingResult(Decision.RECORD_ONLY, attributes, trace_state)
+
+    def get_description(self):
+        return "RecordOnly"
+
+
+class RouteAwareSampler(Sampler):
+    """
+    Root sampler: drops excluded routes (e.g. /metrics) entirely, samples a ratio
+    of the other traces, and records the rest without sampling them so that
+    ``TailKeepingSpanProcessor`` can still keep the errors and slow requests.
+    """
+
+    def __init__(self, ratio, excluded_paths=()):
+        self.ratio_sampler = TraceIdRatioBased(ratio)
+        self.excluded_paths = frozenset(excluded_paths)
+
+    def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None):
+        if attributes:
+            path = attributes.get("url.path") or attributes.get("http.target")
+            if path is not None and path.split("?", 1)[0] in self.excluded_paths:
+                return SamplingResult(Decision.DROP, None, trace_state)
+        result = self.ratio_sampler.should_sample(parent_context, trace_id, name, kind, attributes, links, trace_state)
+        if result.decision is Decision.DROP:
+            return SamplingResult(Decision.RECORD_ONLY, attributes, trace_state)
+        return result
+
+    def get_description(self):
+        return f"RouteAwareSampler{{{self.ratio_sampler.get_description()}, excluded={sorted(self.excluded_paths)}}}"
+
+
+def make_sampler(ratio, excluded_paths=()):
+    """Parent-based sampling: follow the caller's decision, apply RouteAwareSampler to new traces."""
+    return ParentBased(
+        root=RouteAwareSampler(ratio, excluded_paths),
+        remote_parent_sampled=ALWAYS_ON,
+        remote_parent_not_sampled=ALWAYS_OFF,
+        local_parent_sampled=ALWAYS_ON,
+        # Children of a recorded-only root are recorded too, so a kept trace is complete
+        local_parent_not_sampled=_RecordOnly(),
+    )
+
+
+class TailKeepingSpanProcessor(SpanProcessor):
+    """
+    Exports sampled spans and the recorded-only traces that turned out to be
+    errors or slow, through a bounded queue drained by a background thread.
+
+    Recorded-only spans are held per trace until the trace's local root span
+    ends, then the whole trace is queued or discarded. Ending a span never blocks
+    on the exporter: when the queue (or the per-trace buffer) is full the span is
+    dropped and counted in ``otel_spans_dropped_total``, so a stalled collector
+    costs the app nothing but the dropped spans.
+    """
+
+    def __init__(self, exporter, max_queue_size=2048, max_export_batch_size=512, schedule_delay=1.0,
+                 slow_threshold=1.0, max_pending_traces=1000):
+        self.exporter = exporter
+        self.max_queue_size = max_queue_size
+        self.max_export_batch_size = max_export_batch_size
+        self.schedule_delay = schedule_delay
+        self.slow_threshold_ns = int(slow_threshold * 1e9)
+        self.max_pending_traces = max_pending_traces
+        self._queue = deque()
+        self._pending = OrderedDict()  # trace id -> [keep, spans]
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flushed = threading.Condition(self._lock)
+        self._exporting = False
+        self._shutdown = False
+        self._worker = threading.Thread(target=self._run, name="otel-span-export", daemon=True)
+        self._worker.start()
+
+    # ---- span lifecycle ------------------------------------------------
+
+    def on_start(self, span, parent_context=None):
+        pass
+
+    def on_end(self, span):
+        if span.context.trace_flags.sampled:
+            self._enqueue([span])
+            return
+        keep = self._is_interesting(span)
+        is_local_root = span.parent is None or span.parent.is_remote
+        trace_id = span.context.trace_id
+        with self._lock:
+            pending = self._pending.pop(trace_id, None)
+            if pending is None:
+                pending = [False, []]
+            pending[0] = pending[0] or keep
+            pending[1].append(span)
+            if not is_local_root:
+                self._pending[trace_id] = pending
+                if len(self._pending) > self.max_pending_traces:
+                    _, (_, evicted) = self._pending.popitem(last=False)
+                    SPANS_DROPPED.labels(reason="pending_full").inc(len(evicted))
+                return
+        if pending[0]:
+            self._enqueue(pending[1])
+        else:
+            SPANS_DROPPED.labels(reason="not_sampled").inc(len(pending[1]))
+
+    def _is_interesting(self, span):
+        if span.status.status_code is StatusCode.ERROR:
+            return True
+        return span.end_time - span.start_time >= self.slow_threshold_ns
+
+    def _enqueue(self, spans):
+        with self._lock:
+            room = self.max_queue_size - len(self._queue)
+            if room < len(spans):
+                SPANS_DROPPED.labels(reason="queue_full").inc(len(spans) - max(room, 0))
+                spans = spans[:max(room, 0)]
+            self._queue.extend(spans)
+            queued = len(self._queue)
+        SPANS_QUEUED.set(queued)
+        if queued >= self.max_export_batch_size:
+            self._wake.set()
+
+    # ---- export thread -------------------------------------------------
+
+    def _run(self):
+        while not self._shutdown:
+            self._wake.wait(self.schedule_delay)
+            self._wake.clear()
+            self._export_all()
+        self._export_all()
+
+    def _export_all(self):
+        while True:
+            with self._lock:
+                batch = [self._queue.popleft() for _ in range(min(self.max_export_batch_size, len(self._queue)))]
+                self._exporting = bool(batch)
+                if not batch:
+                    self._flushed.notify_all()
+                    return
+            SPANS_QUEUED.set(len(self._queue))
+            # The exporter must not create spans of its own while exporting
+            token = attach(set_value(_SUPPRESS_INSTRUMENTATION_KEY, True, Context()))
+            start = time.perf_counter()
+            try:
+                result = self.exporter.export(batch)
+            except Exception:
+                logger.exception("Exception while exporting spans")
+                result = SpanExportResult.FAILURE
+            finally:
+                detach(token)
+            EXPORT_DURATION.observe(time.perf_counter() - start)
+            if result is SpanExportResult.SUCCESS:
+                SPANS_EXPORTED.inc(len(batch))
+            else:
+                SPANS_DROPPED.labels(reason="export_failed").inc(len(batch))
+
+    def force_flush(self, timeout_millis=30000):
+        deadline = time.monotonic() + timeout_millis / 1000
+        self._wake.set()
+        with self._lock:
+            while self._queue or self._exporting:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._flushed.wait(remaining)
+        return True
+
+    def shutdown(self):
+        if self._shutdown:
+            return
+        self._shutdown = True
+        self._wake.set()
+        self._worker.join()
+        self.exporter.shutdown()
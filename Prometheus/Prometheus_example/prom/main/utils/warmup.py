@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Collection, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupStep:
+    def __init__(self, required=True):
+        self.required = required  # Whether the worker is ready only once this step is done
+        self.state = "pending"  # pending, done or failed
+        self.seconds: Optional[float] = None
+        self.result = None
+
+
+class Warmup:
+    """
+    Startup work that runs in the background once the server accepts connections.
+
+    Every step is a blocking callable run on its own thread, so the event loop
+    serves requests meanwhile. ``ready`` turns true when every required step
+    is done; the readiness endpoint reports it, so traffic is only routed to a
+    warm worker. Optional steps, like exporting traces, finish on their own
+    time without holding the worker out of rotation.
+    """
+
+    def __init__(self):
+        self.steps: Dict[str, WarmupStep] = {}
+        self._tasks = set()
+
+    def start(self, steps: Dict[str, Callable], required: Optional[Collection[str]] = None):
+        """Run the steps in the background; readiness waits for the ``required`` ones (all by default)."""
+        for name, func in steps.items():
+            step = self.steps[name] = WarmupStep(required is None or name in required)
+            task = asyncio.create_task(self._run(name, step, func))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    async def _run(name, step, func):
+        start = time.perf_counter()
+        try:
+            step.result = await asyncio.to_thread(func)
+        except Exception:
+            logger.exception("Warm-up step %s failed", name)
+            step.state = "failed"
+        else:
+            step.state = "done"
+        step.seconds = time.perf_counter() - start
+
+    @property
+    def ready(self) -> bool:
+        return all(step.state == "done" for step in self.steps.values() if step.required)
+
+    async def wait(self):
+        """Wait until every step started so far has finished, successfully or not."""
+        await asyncio.gather(*self._tasks)
+
+    def report(self):
+        return {
+            "ready": self.ready,
+            "steps": {
+                name: {"state": step.state, "seconds": step.seconds, "required": step.required}
+                for name, step in self.steps.items()
+            },
+        }
+
+
+# Warm-up of the app process, started by its lifespan
+warmup = Warmup()
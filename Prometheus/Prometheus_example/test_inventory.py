@@ -0,0 +1,411 @@
+import errno
+import os
+import queue
+import threading
+import time
+from collections import Counter
+
+import pytest
+from prometheus_client import REGISTRY
+
+from prom.main import config
+from prom.main.schemas.item import Item
+from prom.main.utils.columnar_store import ColumnarInventory
+from prom.main.utils.inventory_helper import create_inventory
+from prom.main.utils.inventory_store import InventoryStore, InsufficientStock, ItemNotFound
+from prom.main.utils.journal import InventoryJournal, JournalInUse, SNAPSHOT_FILE
+from prom.main.utils.sqlite_store import SQLiteInventory
+from prom.main.utils.stats import compute_stats
+from prom.main.utils.storage import BatchRejected, ItemQuery
+
+
+def make_item(name, amount=10, price=20.0):
+    return Item(name=name, price=price, amount=amount)
+
+
+@pytest.fixture(params=["memory", "columnar", "sqlite"])
+def make_store(request, tmp_path):
+    """Factory building a backend of each kind holding the given items."""
+    def make(items=()):
+        if request.param == "memory":
+            return InventoryStore(items=items)
+        if request.param == "columnar":
+            return ColumnarInventory(items=items)
+        store = SQLiteInventory(str(tmp_path / "inventory.db"), pool_size=8)
+        store.add_many(list(items))
+        request.addfinalizer(store.close)
+        return store
+    return make
+
+
+# Journal-related Tests
+
+def test_journal_replays_mutations_in_order(tmp_path):
+    journal = InventoryJournal(str(tmp_path))
+    assert journal.replay() == []
+    journal.record_upsert(make_item("apple"))
+    journal.record_upsert(make_item("pear"))
+    journal.record_upsert(make_item("apple", amount=3))
+    journal.record_delete("pear")
+    journal.record_upsert(make_item("plum"))
+    journal.close()
+
+    items = InventoryJournal(str(tmp_path)).replay()
+    assert [(item.name, item.amount) for item in items] == [("apple", 3), ("plum", 10)]
+
+
+def test_journal_compaction_folds_segments_into_snapshot(tmp_path):
+    journal = InventoryJournal(str(tmp_path), compact_every=5)
+    journal.replay()
+    for i in range(12):
+        journal.record_upsert(make_item(f"item{i}", amount=i))
+    journal.record_delete("item0")
+    journal.wait_for_compaction()
+    journal.compact()
+    journal.close()
+
+    assert os.path.exists(tmp_path / SNAPSHOT_FILE)
+    # Only the active segment remains after compaction
+    assert len([f for f in os.listdir(tmp_path) if f.startswith("inventory.journal.")]) == 1
+    items = InventoryJournal(str(tmp_path)).replay()
+    assert [item.name for item in items] == [f"item{i}" for i in range(1, 12)]
+
+
+def test_journal_ignores_torn_trailing_record(tmp_path):
+    journal = InventoryJournal(str(tmp_path))
+    journal.replay()
+    journal.record_upsert(make_item("apple"))
+    journal.close()
+    with open(tmp_path / "inventory.journal.0", "a") as f:
+        f.write('[2,"u",{"name":"pe')  # Crash in the middle of an append
+
+    items = InventoryJournal(str(tmp_path)).replay()
+    assert [item.name for item in items] == ["apple"]
+
+
+def test_journal_replay_skips_records_already_in_snapshot(tmp_path):
+    journal = InventoryJournal(str(tmp_path), compact_every=2)
+    journal.replay()
+    journal.record_upsert(make_item("apple", amount=1))
+    journal.record_upsert(make_item("apple", amount=2))
+    journal.wait_for_compaction()
+    journal.close()
+    # Simulate a crash after the snapshot was written but before the segment was removed
+    with open(tmp_path / "inventory.journal.0", "w") as f:
+        f.write('[1,"u",{"name":"apple","description":null,"price":20.0,"tax":12.5,"amount":1}]\n')
+
+    items = InventoryJournal(str(tmp_path)).replay()
+    assert [(item.name, item.amount) for item in items] == [("apple", 2)]
+
+
+def test_journal_refuses_a_second_writer_of_its_directory(tmp_path):
+    journal = InventoryJournal(str(tmp_path))
+    journal.replay()
+    journal.record_upsert(make_item("apple"))
+    with pytest.raises(JournalInUse):
+        InventoryJournal(str(tmp_path))  # E.g. a second gunicorn worker on the memory backend
+    journal.close()
+
+    items = InventoryJournal(str(tmp_path)).replay()
+    assert [item.name for item in items] == ["apple"]
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_env_inventory_is_migrated_only_on_first_start(backend, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "STORAGE_BACKEND", backend)
+    monkeypatch.setattr(config, "INVENTORY_DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "SQLITE_PATH", str(tmp_path / "inventory.db"))
+    monkeypatch.setenv("INVENTORY_ITEMS", make_item("milk", amount=2).model_dump_json())
+
+    store = create_inventory()
+    assert store.get("milk").amount == 2
+    store.take("milk", 2)
+    store.close()
+
+    # Sold out on purpose: the next start keeps the empty inventory instead of the stale .env stock
+    store = create_inventory()
+    assert len(store) == 0
+    store.close()
+
+
+def test_write_behind_journal_groups_concurrent_changes(tmp_path):
+    # Flushed only once twenty records are queued, so the batch does not depend on timing
+    journal = InventoryJournal(str(tmp_path), fsync=True, flush_interval=60, flush_max_records=20)
+    store = InventoryStore(items=journal.replay())
+    store.add_journal(journal)
+    durable = queue.Queue()
+
+    def buyer(index):
+        store.add(make_item(f"sku{index}", amount=1))
+        store.when_durable(lambda error: durable.put((index, error)))
+
+    flushes = REGISTRY.get_sample_value("persistence_flush_records_count")
+    threads = [threading.Thread(target=buyer, args=(index,)) for index in range(20)]
+    for thread in threads:
+        thread.start()
+    # Twenty changes committed together, not one fsync after the other
+    assert sorted(durable.get(timeout=10) for _ in range(20)) == [(index, None) for index in range(20)]
+    assert REGISTRY.get_sample_value("persistence_flush_records_count") - flushes == 1
+    with open(tmp_path / "inventory.journal.0") as f:
+        assert len(f.readlines()) == 20
+
+    # Changes still queued are written on close
+    store.add(make_item("late", amount=1))
+    store.close()
+    assert {item.name for item in InventoryJournal(str(tmp_path)).replay()} == {f"sku{i}" for i in range(20)} | {"late"}
+
+
+def test_failed_journal_write_fails_its_waiters_and_is_retried_in_a_new_segment(tmp_path):
+    journal = InventoryJournal(str(tmp_path), flush_interval=0.01)
+    store = InventoryStore(items=journal.replay())
+    store.add_journal(journal)
+    segment, registered = journal._segment, threading.Event()
+
+    class FullDisk:
+        def write(self, data):
+            registered.wait(5)
+            segment.write(data[:10])  # Part of the record reached the file before the disk filled up
+            segment.flush()
+            raise OSError(errno.ENOSPC, "No space left on device")
+
+        def close(self):
+            segment.close()
+
+    journal._segment = FullDisk()
+    store.add(make_item("apple"))
+    outcomes = queue.Queue()
+    store.when_durable(outcomes.put)
+    registered.set()
+    assert isinstance(outcomes.get(timeout=5), OSError)
+
+    # The flusher writes the records again, into the next segment, and later changes follow them there
+    store.add(make_item("pear"))
+    store.when_durable(outcomes.put)
+    assert outcomes.get(timeout=5) is None
+    store.close()
+    assert os.path.exists(tmp_path / "inventory.journal.1")
+    assert [item.name for item in InventoryJournal(str(tmp_path)).replay()] == ["apple", "pear"]
+
+
+# Store-related Tests
+
+def test_store_lookup_upsert_and_delete(make_store):
+    store = make_store([make_item("apple"), make_item("pear")])
+    assert store.get("apple").amount == 10
+    assert store.get("missing") is None
+    assert "pear" in store and len(store) == 2
+
+    store.upsert(make_item("apple", amount=1))
+    assert store.get("apple").amount == 1
+    assert store.delete("pear").name == "pear"
+    assert store.delete("pear") is None
+    assert [item.name for item in store] == ["apple"]
+
+
+def test_store_keeps_items_with_any_amount(make_store):
+    store = make_store([make_item("a"), make_item("b", amount=-1)])
+    assert len(store) == 2
+    assert [item.name for item in store.items()] == ["a", "b"]
+    assert sorted(store.stock_levels()) == [(-1, None), (10, None)]
+
+
+def test_store_keeps_insertion_order(make_store):
+    store = make_store([make_item("c"), make_item("a"), make_item("b")])
+    store.upsert(make_item("a", amount=5))  # Updating keeps the position
+    store.delete("c")
+    store.upsert(make_item("c"))  # Re-adding goes to the end
+    assert [item.name for item in store.items()] == ["a", "b", "c"]
+
+
+def test_store_version_changes_with_every_change(make_store):
+    store = make_store([make_item("apple")])
+    versions = [store.version]
+    store.add(make_item("apple", amount=2))
+    versions.append(store.version)
+    store.take("apple", 1)
+    versions.append(store.version)
+    assert store.get("apple") is not None and store.version == versions[-1]  # Reads leave it alone
+    assert len(set(versions)) == 3
+
+
+def test_store_queries_walk_the_indexes_page_by_page(make_store):
+    names = ["apple", "apricot", "avocado", "banana", "blueberry", "cherry", "date", "fig", "grape", "kiwi"]
+    store = make_store([make_item(name, amount=i + 1, price=float(10 - i % 4)) for i, name in enumerate(names)])
+    store.delete("date")
+    store.upsert(make_item("fig", amount=6, price=1.5))  # Moves in the price index
+
+    def walk(query, limit):
+        pages, after = [], None
+        while True:
+            page = store.query(query, after, limit)
+            pages.append([item.name for item in page])
+            if len(page) < limit:
+                return pages
+            after = query.sort_key(page[-1])
+
+    assert walk(ItemQuery(prefix="a"), 2) == [["apple", "apricot"], ["avocado"]]
+    assert walk(ItemQuery(prefix="b", below_amount=5), 10) == [["banana"]]
+
+    query = ItemQuery(min_price=7, max_price=9.5)
+    expected = sorted((item for item in store if query.matches(item)), key=query.sort_key)
+    assert sum(walk(query, 2), []) == [item.name for item in expected]
+    assert walk(ItemQuery(max_price=2), 5) == [["fig"]]
+    assert sum(walk(ItemQuery(), 3), []) == sorted(name for name in names if name != "date")
+
+
+# Concurrency-related Tests
+
+def test_concurrent_purchases_never_oversell(make_store):
+    stock = 1000
+    store = make_store([make_item("hot", amount=stock)])
+    sold = []
+    failures = []
+
+    def buyer():
+        for _ in range(250):
+            try:
+                store.take("hot", 1)
+                sold.append(1)
+            except (InsufficientStock, ItemNotFound):
+                failures.append(1)
+
+    threads = [threading.Thread(target=buyer) for _ in range(16)]  # 4000 buys for 1000 units
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(sold) == stock
+    assert len(failures) == 16 * 250 - stock
+    assert store.get("hot") is None
+
+
+def test_concurrent_purchases_of_different_items_stay_consistent(make_store):
+    skus = [make_item(f"sku{i}", amount=1000) for i in range(64)]
+    store = make_store(skus)
+    journaled = []
+    store.add_listener(lambda changes: journaled.extend((item.name, old, new) for item, old, new, _ in changes))
+
+    failures = []
+
+    def buyer(offset):
+        for i in range(2000):
+            name = f"sku{(i + offset) % 64}"
+            try:
+                store.take(name, 1)
+            except (InsufficientStock, ItemNotFound):
+                failures.append(name)
+
+    # The same purchases made one buyer after the other, as the baseline
+    start = time.perf_counter()
+    for offset in range(8):
+        buyer(offset)
+    serial = time.perf_counter() - start
+
+    threads = [threading.Thread(target=buyer, args=(offset,)) for offset in range(8)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    # No SKU runs out, so every purchase succeeds and each SKU lost exactly the units bought of it
+    sold = Counter(f"sku{(i + offset) % 64}" for offset in range(8) for i in range(2000))
+    expected = {name: 1000 - 2 * count for name, count in sold.items()}
+    assert failures == []
+    assert {item.name: item.amount for item in store} == expected
+    # Listeners saw every change of an item in order: each new amount is one below the previous one
+    per_item = {}
+    for name, old, new in journaled:
+        assert per_item.get(name, 1000) == old == new + 1
+        per_item[name] = new
+    assert per_item == expected
+    # Buyers of different SKUs do not convoy on one lock: with the GIL they take about the serial time,
+    # a collapse takes many times that; the margin is wide so a busy runner does not fail the test
+    assert elapsed < 4 * serial, (elapsed, serial)
+
+
+def test_store_stats_are_computed_from_its_columns(make_store):
+    store = make_store([
+        Item(name="milk", price=5, amount=3), Item(name="tea", price=10, amount=40, tax=None),
+        Item(name="rice", price=2, amount=8), Item(name="gone", price=1, amount=1),
+    ])
+    store.delete("gone")
+    stats = compute_stats(store.stock_columns(), store.version, [5, 10, 50], [5, 10, 20], top_items=2)
+
+    assert (stats.items, stats.units) == (3, 51)
+    assert stats.stock_value == 5 * 3 + 10 * 40 + 2 * 8
+    assert stats.stock_value_with_tax == (5 * 3 + 2 * 8) * 1.125 + 10 * 40
+    assert [(bucket.le, bucket.count) for bucket in stats.quantity_histogram] == [(5, 1), (10, 2), (50, 3), (None, 3)]
+    assert [(low.threshold, low.count) for low in stats.low_stock] == [(5, 1), (10, 2), (20, 2)]
+    assert [(top.name, top.value) for top in stats.top_by_value] == [("tea", 400), ("rice", 16)]
+
+
+# Columnar store Tests
+
+def test_columnar_store_compacts_dead_rows_keeping_order_and_indexes():
+    store = ColumnarInventory(items=[
+        Item(name=f"item{i:04d}", price=i % 7, amount=i % 3 + 1, category="dairy" if i % 2 else None,
+             tax=None if i % 5 == 0 else 12.5)
+        for i in range(3000)
+    ])
+    store.upsert(Item(name="item0002", price=2, amount=-1))  # A live row, whatever its amount
+    for i in range(0, 3000, 3):
+        store.delete(f"item{i:04d}")
+    for i in range(1, 3000, 3):
+        store.take(f"item{i:04d}", i % 3 + 1)  # Sold out, so removed too
+    assert len(store._names) < 2000  # Compacted once dead rows outnumbered the live ones
+
+    names = [f"item{i:04d}" for i in range(2, 3000, 3)]
+    assert [item.name for item in store] == names
+    assert store.get("item0005") == Item(name="item0005", price=5, amount=3, category="dairy", tax=None)
+    assert store.get("item0002").amount == -1
+    assert [item.name for item in store.query(ItemQuery(prefix="item29"))] == [n for n in names if n >= "item29"]
+    by_price = store.query(ItemQuery(min_price=3, max_price=3), limit=1000)
+    assert [item.name for item in by_price] == sorted(n for n in names if int(n[4:]) % 7 == 3)
+    assert list(store.stock_levels()) == [(item.amount, item.category) for item in store]
+
+
+# SQLite-related Tests
+
+def test_sqlite_batches_are_transactional_and_persisted(tmp_path):
+    path = str(tmp_path / "inventory.db")
+    store = SQLiteInventory(path)
+    results = store.add_many([make_item("apple", amount=3), make_item("pear", amount=2), make_item("apple", amount=1)])
+    assert [(item.name, created, amount) for item, created, amount in results] == \
+        [("apple", True, 3), ("pear", True, 2), ("apple", False, 4)]
+
+    with pytest.raises(BatchRejected) as rejected:
+        store.take_many([("apple", 1), ("pear", 5), ("plum", 1)])
+    assert sorted(rejected.value.errors) == [1, 2]
+    assert store.get("apple").amount == 4 and store.get("pear").amount == 2  # Nothing was taken
+
+    results = store.take_many([("apple", 1), ("pear", 2), ("apple", 1)])
+    assert [(item.name, remaining) for item, remaining in results] == [("apple", 3), ("pear", 0), ("apple", 2)]
+    store.close()
+
+    reopened = SQLiteInventory(path)
+    assert [(item.name, item.amount) for item in reopened] == [("apple", 2)]
+    reopened.close()
+
+
+def test_sqlite_version_follows_changes_of_other_processes(tmp_path):
+    path = str(tmp_path / "inventory.db")
+    reader, writer = SQLiteInventory(path), SQLiteInventory(path)  # E.g. two gunicorn workers
+    version = reader.version
+    writer.add(make_item("apple"))
+    assert reader.version != version
+    reader.close()
+    writer.close()
+
+
+def test_sqlite_queries_use_the_indexes(tmp_path):
+    from prom.main.utils.sqlite_store import _query_sql
+    store = SQLiteInventory(str(tmp_path / "inventory.db"))
+    with store.pool.connection() as connection:
+        for query, after in ((ItemQuery(prefix="ap"), ("apple",)), (ItemQuery(min_price=1, max_price=5), (2.0, "x"))):
+            sql, params = _query_sql(query, after, 10)
+            plan = " ".join(row[-1] for row in connection.execute("EXPLAIN QUERY PLAN " + sql, params))
+            assert "USING INDEX" in plan and "TEMP B-TREE" not in plan
+    store.close()
@@ -0,0 +1,333 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+from fastapi import FastAPI, Depends
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from prom.main import config
+from prom.main.crud import item as crud_item
+from prom.main.custom_metrics.basicMetrics import request_metrics
+from prom.main.routers.health import router as health_router
+from prom.main.routers.items import router
+from prom.main.schemas.item import Item
+from prom.main.utils.idempotency import IdempotencyCache
+from prom.main.utils.inventory_helper import get_inventory
+from prom.main.utils.listing import encode_cursor
+from prom.main.utils.storage import NotPersisted
+from prom.main.utils.warmup import warmup
+
+app = FastAPI()
+app.include_router(router, dependencies=[Depends(get_inventory)])
+request_metrics.instrument(app)
+
+
+@pytest.fixture(autouse=True)
+def fast_simulation(monkeypatch):
+    monkeypatch.setattr(config, "BUY_ITEM_DELAY_SECONDS", 0.3)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def request(method, url, **kwargs):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await client.request(method, url, **kwargs)
+
+
+# Purchase-related Tests
+
+def test_buy_item_updates_stock():
+    run(request("POST", "/add_item/", json={"name": "milk", "price": 6.5, "amount": 5}))
+    response = run(request("POST", "/buy_item/", json={"name": "milk", "amount": 2}))
+    assert response.status_code == 200
+    assert response.json()["remaining"] == 3
+
+    response = run(request("POST", "/buy_item/", json={"name": "milk", "amount": 10}))
+    assert response.status_code == 400
+    response = run(request("POST", "/buy_item/", json={"name": "no-such-item", "amount": 1}))
+    assert response.status_code == 404
+
+
+def test_buy_item_does_not_block_other_requests():
+    run(request("POST", "/add_item/", json={"name": "bread", "price": 8, "amount": 100}))
+
+    async def scenario():
+        start = time.perf_counter()
+        buys = [asyncio.create_task(request("POST", "/buy_item/", json={"name": "bread", "amount": 1}))
+                for _ in range(10)]
+        await asyncio.sleep(0.05)
+        get_start = time.perf_counter()
+        listing = await request("GET", "/")
+        get_latency = time.perf_counter() - get_start
+        responses = await asyncio.gather(*buys)
+        return listing, get_latency, responses, time.perf_counter() - start
+
+    listing, get_latency, responses, elapsed = run(scenario())
+    assert listing.status_code == 200
+    assert get_latency < config.BUY_ITEM_DELAY_SECONDS
+    assert all(response.status_code == 200 for response in responses)
+    # Ten purchases in parallel take about as long as one
+    assert elapsed < 3 * config.BUY_ITEM_DELAY_SECONDS
+
+
+# Listing-related Tests
+
+def test_listing_is_cached_and_served_conditionally():
+    first = run(request("GET", "/"))
+    etag = first.headers["etag"]
+    assert first.status_code == 200
+
+    unchanged = run(request("GET", "/", headers={"If-None-Match": etag}))
+    assert unchanged.status_code == 304 and unchanged.content == b""
+    assert unchanged.headers["etag"] == etag
+
+    run(request("POST", "/add_item/", json={"name": "jam", "price": 9, "amount": 2}))
+    changed = run(request("GET", "/", headers={"If-None-Match": etag}))
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert {"name": "jam", "amount": 2}.items() <= {item["name"]: item for item in changed.json()}["jam"].items()
+
+
+def test_listing_pages_filters_and_streams():
+    run(request("POST", "/add_items/", json=[
+        {"name": f"page-{i:02}", "price": 100 + i, "amount": 3 if i % 2 else 50} for i in range(7)
+    ]))
+    names, url = [], "/?prefix=page-&limit=3"
+    while url:
+        response = run(request("GET", url))
+        names += [item["name"] for item in response.json()]
+        link = response.headers.get("link")
+        url = link[link.index("<") + 1:link.index(">")].removeprefix("http://test") if link else None
+    assert names == [f"page-{i:02}" for i in range(7)]
+
+    response = run(request("GET", "/?prefix=page-&min_price=102&max_price=105&low_stock=true"))
+    assert [item["name"] for item in response.json()] == ["page-03", "page-05"]
+    assert run(request("GET", "/?cursor=not-a-cursor")).status_code == 400
+    # Cursors of the wrong shape for the listing's order are refused rather than compared with the index
+    for sort_key in (["x", "y"], ["page-01"], 5):
+        cursor = encode_cursor(sort_key)
+        assert run(request("GET", f"/?min_price=100&cursor={cursor}")).status_code == 400
+    assert run(request("GET", f"/?cursor={encode_cursor([5])}")).status_code == 400
+
+    response = run(request("GET", "/?prefix=page-", headers={"Accept": "application/x-ndjson"}))
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = response.text.splitlines()
+    assert len(lines) == 7 and Item.model_validate_json(lines[0]).name == "page-00"
+
+
+def test_inventory_stats_are_cached_until_the_inventory_changes():
+    first = run(request("GET", "/inventory/stats"))
+    assert first.status_code == 200
+    assert run(request("GET", "/inventory/stats")).content == first.content
+
+    run(request("POST", "/add_item/", json={"name": "saffron", "price": 1000, "amount": 50}))
+    stats = run(request("GET", "/inventory/stats")).json()
+    assert stats["version"] != first.json()["version"]
+    assert stats["items"] >= 1 and stats["top_by_value"][0]["value"] >= 1000 * 50
+    assert [low["threshold"] for low in stats["low_stock"]] == sorted({config.LOW_STOCK_THRESHOLD, *config.LOW_STOCK_THRESHOLDS})
+
+
+# Batch-related Tests
+
+def test_add_items_applies_every_line():
+    response = run(request("POST", "/add_items/", json=[
+        {"name": "rice", "price": 12, "amount": 4},
+        {"name": "beans", "price": 7, "amount": 2},
+        {"name": "rice", "price": 12, "amount": 1},
+    ]))
+    assert response.status_code == 200
+    assert [(r["name"], r["status"], r["amount"]) for r in response.json()["results"]] == [
+        ("rice", "added", 4), ("beans", "added", 2), ("rice", "updated", 5),
+    ]
+
+
+def test_buy_items_is_all_or_nothing():
+    run(request("POST", "/add_items/", json=[
+        {"name": "tea", "price": 15, "amount": 3},
+        {"name": "coffee", "price": 30, "amount": 1},
+    ]))
+    response = run(request("POST", "/buy_items/", json=[
+        {"name": "tea", "amount": 2},
+        {"name": "coffee", "amount": 5},
+        {"name": "cocoa", "amount": 1},
+    ]))
+    assert response.status_code == 400
+    assert [r["status"] for r in response.json()["detail"]["results"]] == [
+        "ok", "Not enough items in stock", "Item not found",
+    ]
+    # Nothing was bought
+    listing = {item["name"]: item["amount"] for item in run(request("GET", "/")).json()}
+    assert listing["tea"] == 3 and listing["coffee"] == 1
+
+    response = run(request("POST", "/buy_items/", json=[
+        {"name": "tea", "amount": 2},
+        {"name": "coffee", "amount": 1},
+        {"name": "tea", "amount": 1},
+    ]))
+    assert response.status_code == 200
+    assert [r["remaining"] for r in response.json()["results"]] == [1, 0, 0]
+    listing = {item["name"] for item in run(request("GET", "/")).json()}
+    assert "tea" not in listing and "coffee" not in listing
+
+
+def test_purchases_reject_non_positive_amounts_and_empty_batches():
+    response = run(request("POST", "/buy_items/", json=[{"name": "tea", "amount": 0}]))
+    assert response.status_code == 422
+    for amount in (0, -3):
+        response = run(request("POST", "/buy_item/", json={"name": "tea", "amount": amount}))
+        assert response.status_code == 422
+    for path in ("/buy_items/", "/add_items/"):
+        assert run(request("POST", path, json=[])).status_code == 422
+
+
+# Idempotency-related Tests
+
+def test_retried_purchase_with_an_idempotency_key_is_applied_once():
+    run(request("POST", "/add_item/", json={"name": "honey", "price": 30, "amount": 10}))
+    headers = {"Idempotency-Key": "order-42"}
+    waited_before = REGISTRY.get_sample_value("idempotency_lookups_total", {"result": "in_flight"})
+
+    async def scenario():
+        # The duplicate arrives while the original is still in its purchase delay
+        return await asyncio.gather(*(
+            request("POST", "/buy_item/", json={"name": "honey", "amount": 3}, headers=headers) for _ in range(2)
+        ))
+
+    first, duplicate = run(scenario())
+    retry = run(request("POST", "/buy_item/", json={"name": "honey", "amount": 3}, headers=headers))
+    assert first.json() == duplicate.json() == retry.json() and first.json()["remaining"] == 7
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert REGISTRY.get_sample_value("idempotency_lookups_total", {"result": "in_flight"}) == waited_before + 1
+    assert REGISTRY.get_sample_value("idempotency_cache_hit_ratio") > 0
+    assert {item["name"]: item["amount"] for item in run(request("GET", "/")).json()}["honey"] == 7
+
+    reused = run(request("POST", "/buy_item/", json={"name": "honey", "amount": 1}, headers=headers))
+    assert reused.status_code == 422
+    missing = [run(request("POST", "/buy_item/", json={"name": "no-honey", "amount": 1},
+                           headers={"Idempotency-Key": "order-43"})) for _ in range(2)]
+    assert [response.status_code for response in missing] == [404, 404]
+    assert missing[1].headers["idempotent-replayed"] == "true"
+
+
+def test_idempotency_key_matches_the_same_json_however_it_is_serialized():
+    run(request("POST", "/add_item/", json={"name": "marmalade", "price": 12, "amount": 10}))
+    headers = {"Idempotency-Key": "order-marmalade", "Content-Type": "application/json"}
+    first = run(request("POST", "/buy_item/", content=b'{"name":"marmalade","amount":2}', headers=headers))
+    retry = run(request("POST", "/buy_item/", content=b'{ "amount": 2,\n  "name": "marmalade" }', headers=headers))
+    assert first.status_code == retry.status_code == 200
+    assert retry.headers["idempotent-replayed"] == "true" and retry.json()["remaining"] == 8
+
+
+def test_purchase_that_failed_after_taking_the_stock_is_not_retried(monkeypatch):
+    run(request("POST", "/add_item/", json={"name": "salt", "price": 2, "amount": 10}))
+
+    async def disk_full(inventory):
+        raise NotPersisted("No space left on device")
+
+    monkeypatch.setattr(crud_item, "wait_until_durable", disk_full)
+    headers = {"Idempotency-Key": "order-salt"}
+    failed = run(request("POST", "/buy_item/", json={"name": "salt", "amount": 4}, headers=headers))
+    assert failed.status_code == 503
+
+    # The stock was taken before the failure, so the retry is refused instead of buying again
+    monkeypatch.undo()
+    retry = run(request("POST", "/buy_item/", json={"name": "salt", "amount": 4}, headers=headers))
+    assert retry.status_code == 409
+    assert {item["name"]: item["amount"] for item in run(request("GET", "/")).json()}["salt"] == 6
+
+
+def test_idempotency_cache_expires_and_evicts_least_recently_used():
+    now = [0.0]
+    cache = IdempotencyCache(ttl=60, max_entries=2, clock=lambda: now[0])
+    calls = []
+
+    async def store(key):
+        async def operation():
+            calls.append(key)
+            return {"key": key}
+        return await cache.run(key, b"body", operation)
+
+    async def scenario():
+        await store("a"), await store("b"), await store("a"), await store("c")  # "b" is the least recently used
+        await store("a"), await store("b")
+        now[0] = 61
+        await store("c")
+
+    run(scenario())
+    assert calls == ["a", "b", "c", "b", "c"]
+
+
+# Startup-related Tests
+
+def test_ready_once_the_background_warm_up_is_done():
+    release = threading.Event()
+
+    @asynccontextmanager
+    async def lifespan(app):
+        warmup.start({"slow": release.wait, "fast": lambda: None})
+        yield
+        await warmup.wait()
+
+    warming_app = FastAPI(lifespan=lifespan)
+    warming_app.include_router(health_router)
+    with TestClient(warming_app) as client:
+        # The app serves requests while it warms up
+        response = client.get("/ready")
+        assert response.status_code == 503 and response.json()["steps"]["slow"]["state"] == "pending"
+        release.set()
+        for _ in range(100):
+            if client.get("/ready").status_code == 200:
+                break
+            time.sleep(0.01)
+        assert client.get("/ready").json()["steps"]["slow"]["state"] == "done"
+
+
+def test_ready_does_not_wait_for_optional_warm_up_steps():
+    release = threading.Event()
+
+    @asynccontextmanager
+    async def lifespan(app):
+        warmup.start({"inventory": lambda: None, "tracing": release.wait}, required={"inventory"})
+        yield
+        await warmup.wait()
+
+    warming_app = FastAPI(lifespan=lifespan)
+    warming_app.include_router(health_router)
+    with TestClient(warming_app) as client:
+        for _ in range(100):
+            if client.get("/ready").status_code == 200:
+                break
+            time.sleep(0.01)
+        # Ready with the inventory loaded, while the slow trace collector is still being set up
+        response = client.get("/ready")
+        assert response.status_code == 200 and response.json()["steps"]["tracing"]["state"] == "pending"
+        release.set()
+    # Finished steps leave nothing behind for later starts to wait on
+    assert not warmup._tasks
+
+
+# Middleware-related Tests
+
+def requests_count(method, route, status):
+    labels = {"method": method, "route": route, "status": status}
+    return REGISTRY.get_sample_value("requests_total", labels) or 0
+
+
+def test_middleware_records_route_method_and_status():
+    before_missing = requests_count("post", "/buy_item/", "404")
+    before_listing = requests_count("get", "/", "200")
+    run(request("POST", "/buy_item/", json={"name": "nothing-here", "amount": 1}))
+    run(request("GET", "/"))
+    run(request("GET", "/no/such/path"))
+
+    assert requests_count("post", "/buy_item/", "404") == before_missing + 1
+    assert requests_count("get", "/", "200") == before_listing + 1
+    assert requests_count("get", "<unmatched>", "404") >= 1
+    # The simulated purchase delay is part of the measured duration
+    labels = {"method": "post", "route": "/buy_item/", "status": "404"}
+    assert REGISTRY.get_sample_value("request_duration_seconds_sum", labels) >= config.BUY_ITEM_DELAY_SECONDS
@@ -0,0 +1,439 @@
+import asyncio
+import gzip
+import multiprocessing
+import random
+import threading
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.trace import format_trace_id
+from prometheus_client import CollectorRegistry, Counter, Histogram
+from prometheus_client.openmetrics.exposition import generate_latest as generate_openmetrics
+
+from prom.main.custom_metrics.lowStockPercent import LowStockPercentage
+from prom.main.custom_metrics.multiprocess import multiprocess_registry
+from prom.main.custom_metrics.purchaseHistogram import PurchaseHistogram
+from prom.main.custom_metrics.purchaseSuccessRatio import PurchaseSuccessRatio
+from prom.main.instrumentation.admission import AdaptiveLimit, AdmissionControl, LaneSettings
+from prom.main.instrumentation.base import PrometheusMetricsBase, metric, timed
+from prom.main.instrumentation.requests import RequestMetrics
+from prom.main.schemas.item import Item
+from prom.main.utils.columnar_store import ColumnarInventory
+from prom.main.utils.exposition import OPENMETRICS, TEXT, CachedExposition, gzip_accepted, negotiate_format
+from prom.main.utils.inventory_store import InventoryStore, InsufficientStock
+from prom.main.utils.sqlite_store import SQLiteInventory
+from prom.main.utils.tracing import trace_exemplar
+from prom.main.utils.tracing_sdk import make_sampler
+
+
+def make_item(name, amount, category=None):
+    return Item(name=name, price=10, amount=amount, category=category)
+
+
+def recount(store, threshold):
+    items = list(store)
+    return (sum(item.amount < threshold for item in items) / len(items)) * 100 if items else 0.0
+
+
+# Low stock Tests
+
+def test_low_stock_counts_follow_store_changes():
+    store = InventoryStore(items=[make_item("a", 50), make_item("b", 3)])
+    metric = LowStockPercentage(low_stock_threshold=10, thresholds=[5, 20])
+    metric.update_inventory(store)
+    store.add_listener(metric.on_change)
+    assert metric.get_percentage() == 50.0
+
+    store.take("a", 45)  # 50 -> 5: crosses 20 and 10, not 5
+    assert metric.get_percentage() == 100.0
+    assert metric.get_percentage(5) == 50.0
+    assert metric.get_percentage(20) == 100.0
+
+    store.take("b", 3)  # Removed
+    store.add(make_item("c", 100))
+    assert metric.total_items == 2
+    assert metric.get_percentage() == 50.0
+
+
+def test_low_stock_incremental_matches_full_recount():
+    rng = random.Random(7)
+    store = InventoryStore(items=[make_item(f"sku{i}", rng.randint(1, 40)) for i in range(200)])
+    metric = LowStockPercentage(low_stock_threshold=10, thresholds=[1, 5, 25])
+    metric.update_inventory(store)
+    store.add_listener(metric.on_change)
+
+    for _ in range(2000):
+        name = f"sku{rng.randrange(250)}"
+        if rng.random() < 0.6:
+            try:
+                store.take(name, rng.randint(1, 8))
+            except (InsufficientStock, LookupError):
+                pass
+        else:
+            store.add(make_item(name, rng.randint(1, 15)))
+
+    for threshold in metric.thresholds:
+        assert metric.get_percentage(threshold) == recount(store, threshold)
+
+
+def test_low_stock_resync_after_threshold_change_and_categories():
+    store = InventoryStore(items=[
+        make_item("milk", 15, "dairy"), make_item("cheese", 30, "dairy"), make_item("bun", 3, "bakery"),
+    ])
+    metric = LowStockPercentage(low_stock_threshold=10, category_thresholds={"dairy": 20})
+    metric.update_inventory(store)
+    store.add_listener(metric.on_change)
+    assert metric.get_category_percentage("dairy") == 50.0
+
+    store.take("cheese", 15)
+    assert metric.get_category_percentage("dairy") == 100.0
+
+    metric.set_thresholds(store, low_stock_threshold=20)
+    assert metric.get_percentage() == 100.0
+    samples = {sample.name: sample for family in metric.collect() for sample in family.samples}
+    assert samples["low_stock_percentage"].value == 100.0
+
+
+@pytest.mark.parametrize("store_class", [InventoryStore, ColumnarInventory, SQLiteInventory])
+def test_low_stock_category_counts_follow_an_item_moved_to_another_category(store_class, tmp_path):
+    items = [make_item("milk", 5, "dairy"), make_item("cheese", 30, "dairy"), make_item("bun", 30, "bakery")]
+    if store_class is SQLiteInventory:
+        store = SQLiteInventory(str(tmp_path / "inventory.db"))
+        store.add_many(items)
+    else:
+        store = store_class(items=items)
+    metric = LowStockPercentage(low_stock_threshold=10, category_thresholds={"dairy": 20, "bakery": 20})
+    metric.update_inventory(store)
+    store.add_listener(metric.on_change)
+
+    store.upsert(make_item("milk", 5, "bakery"))  # Moved, still low
+    assert metric.get_category_percentage("dairy") == 0.0
+    assert metric.get_category_percentage("bakery") == 50.0
+    store.upsert(make_item("cheese", 8, "bakery"))  # Moved and now low
+    assert metric.get_category_percentage("dairy") == 0.0
+    assert metric.get_category_percentage("bakery") == (2 / 3) * 100
+    _, _, total, category_totals, category_low = metric._counts()
+    assert total == 3 and category_totals == {"dairy": 0, "bakery": 3} and category_low == {"dairy": 0, "bakery": 2}
+    store.close()
+
+
+def test_low_stock_threshold_changes_during_purchases_keep_the_counts_exact():
+    store = InventoryStore(items=[make_item(f"i{i}", 40, "dairy" if i % 2 else "bakery") for i in range(50)])
+    metric = LowStockPercentage(low_stock_threshold=10)
+    metric.update_inventory(store)
+    store.add_listener(metric.on_change)
+
+    def buyer(offset):
+        for round_ in range(30):
+            store.take(f"i{(offset + round_) % 50}", 1)
+
+    threads = [threading.Thread(target=buyer, args=(offset,)) for offset in range(8)]
+    for thread in threads:
+        thread.start()
+    # Every swap adds or drops a category while purchases move items across the thresholds
+    for round_ in range(50):
+        metric.set_thresholds(store, low_stock_threshold=30 + round_ % 10,
+                              category_thresholds={"dairy": 35} if round_ % 2 else {"bakery": 38})
+    for thread in threads:
+        thread.join()
+
+    expected = LowStockPercentage(metric.low_stock_threshold, metric.thresholds, metric.category_thresholds)
+    expected.update_inventory(store)
+    assert metric._counts() == expected._counts()
+
+
+# Purchase success ratio Tests
+
+def test_success_ratio_counts_every_thread():
+    ratio = PurchaseSuccessRatio()
+
+    def purchases():
+        for i in range(10000):
+            ratio.increment_attempts()
+            if i % 4:
+                ratio.increment_successes()
+
+    threads = [threading.Thread(target=purchases) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert ratio.total_purchase_attempts == 80000 and ratio.successful_purchases == 60000
+    samples = {sample.name: sample.value for family in ratio.collect() for sample in family.samples}
+    assert samples["purchase_attempts_total"] == 80000
+    assert samples["purchase_success_ratio"] == 0.75
+
+
+def test_windowed_success_ratio_forgets_old_purchases():
+    now = [0.0]
+    ratio = PurchaseSuccessRatio(window=300, resolution=30, clock=lambda: now[0])
+    ratio.increment_attempts(100)
+    ratio.increment_successes(100)
+    now[0] += 15
+    assert ratio.get_windowed_ratio() == 1.0
+    for _ in range(40):
+        now[0] += 10  # What the recording thread does every window / resolution seconds
+        ratio.record()
+    # Nothing was attempted within the window any more, though it was never read meanwhile
+    assert ratio.get_windowed_ratio() == 0.0
+    ratio.increment_attempts(10)
+    ratio.increment_successes(1)
+    now[0] += 10
+    ratio.record()
+    assert ratio.get_windowed_ratio() == 0.1
+    assert ratio.get_ratio() == 101 / 110
+
+
+# Purchase histogram Tests
+
+def test_purchase_histogram_buckets_by_price_band():
+    registry = CollectorRegistry()
+    histogram = PurchaseHistogram(price_bands=(5, 10, 100), value_buckets=(10, 100), units_buckets=(1, 5), registry=registry)
+    reference = Histogram('reference', 'Same observations through Histogram.observe', buckets=(10, 100), registry=registry)
+    assert [histogram.band(price) for price in (0.5, 5, 5.01, 100, 1e6)] == [
+        "0To5", "0To5", "5To10", "10To100", "100Above",
+    ]
+
+    purchases = [(2, 1), (2, 5), (5, 2), (7, 3), (50, 2), (50, 2), (500, 1)]
+    histogram.observe_many(purchases)
+    for price, amount in purchases:
+        reference.observe(price * amount)
+
+    def sample(name, **labels):
+        return registry.get_sample_value(name, labels) or 0
+
+    # Items priced at or below the first boundary are counted too
+    assert sample("purchase_units_count", price_band="0To5") == 3
+    assert sample("purchase_value_sum", price_band="0To5") == 2 + 10 + 10
+    assert sample("purchase_units_bucket", price_band="0To5", le="1.0") == 1
+    assert sample("purchase_units_bucket", price_band="0To5", le="5.0") == 3
+    for le in ("10.0", "100.0", "+Inf"):
+        assert sum(sample("purchase_value_bucket", price_band=band, le=le) for band in histogram.band_labels) == \
+            sample("reference_bucket", le=le)
+
+
+# Exposition Tests
+
+def test_cached_exposition_serves_within_ttl():
+    registry = CollectorRegistry()
+    counter = Counter("scrape_test", "Test counter", registry=registry)
+    exposition = CachedExposition(registry=registry, ttl=60)
+
+    first, encoding = exposition.get()
+    assert encoding is None and b"scrape_test_total 0.0" in first
+    counter.inc()
+    assert exposition.get()[0] is first  # Still cached
+
+    body, encoding = exposition.get(accept_gzip=True)
+    assert encoding == "gzip" and gzip.decompress(body) == first
+
+    exposition.ttl = 0
+    assert b"scrape_test_total 1.0" in exposition.get()[0]
+
+
+def test_gzip_accepted():
+    assert gzip_accepted("gzip, deflate, br")
+    assert gzip_accepted("deflate;q=1, gzip;q=0.5")
+    assert not gzip_accepted("identity")
+    assert not gzip_accepted(None)
+
+
+def test_openmetrics_is_negotiated_and_cached_separately():
+    assert negotiate_format("application/openmetrics-text; version=1.0.0,text/plain;version=0.0.4;q=0.5") is OPENMETRICS
+    assert negotiate_format("text/plain") is TEXT
+    assert negotiate_format(None) is TEXT
+
+    registry = CollectorRegistry()
+    Counter("format_test", "Test counter", registry=registry)
+    exposition = CachedExposition(registry=registry, ttl=60)
+    text, _ = exposition.get()
+    openmetrics, _ = exposition.get(exposition_format=OPENMETRICS)
+    assert not text.endswith(b"# EOF\n") and openmetrics.endswith(b"# EOF\n")
+    assert exposition.get(exposition_format=OPENMETRICS)[0] is openmetrics
+
+
+# Exemplar Tests
+
+def test_histograms_carry_the_trace_id_as_exemplar():
+    registry = CollectorRegistry()
+    request_metrics = RequestMetrics(registry=registry, exemplar=trace_exemplar)
+    db_duration = Histogram("db_test_seconds", "Test histogram", registry=registry)
+    query = timed(db_duration, exemplar=trace_exemplar)(lambda: None)
+    tracer = TracerProvider(sampler=make_sampler(1.0)).get_tracer(__name__)
+
+    scope = {"type": "http", "method": "GET", "route": None}
+    request_metrics.after_request(scope, 200, request_metrics.before_request(scope))  # No span: no exemplar
+    with tracer.start_as_current_span("request") as span:
+        request_metrics.after_request(scope, 200, request_metrics.before_request(scope))
+        query()
+    trace_id = format_trace_id(span.get_span_context().trace_id)
+
+    exposition = generate_openmetrics(registry).decode()
+    exemplar_lines = [line for line in exposition.splitlines() if " # {" in line]
+    assert len(exemplar_lines) == 2
+    assert all(f'trace_id="{trace_id}"' in line for line in exemplar_lines)
+    assert {line.split("_bucket")[0] for line in exemplar_lines} == {"request_duration_seconds", "db_test_seconds"}
+
+    # Unsampled traces only get exemplars for observations slow enough for the trace to be kept
+    tracer = TracerProvider(sampler=make_sampler(0.0)).get_tracer(__name__)
+    with tracer.start_as_current_span("request"):
+        assert trace_exemplar(0.01) is None
+        assert trace_exemplar(60) is not None
+
+
+# Multiprocess Tests
+
+def run_worker(attempts, successes, amounts, db_path, stock):
+    # Runs in a separate process with PROMETHEUS_MULTIPROC_DIR set, like a gunicorn/uvicorn worker
+    ratio = PurchaseSuccessRatio()
+    ratio.increment_attempts(attempts)
+    ratio.increment_successes(successes)
+    PurchaseHistogram(registry=None).observe_many((50, amount) for amount in amounts)
+    inventory = SQLiteInventory(db_path)
+    low_stock = LowStockPercentage(low_stock_threshold=10)
+    low_stock.update_inventory(inventory)
+    inventory.add_listener(low_stock.on_change)
+    for name, amount in stock:
+        inventory.add(make_item(name, amount))
+    inventory.close()
+
+
+def test_custom_collectors_aggregate_across_worker_processes(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    db_path = str(tmp_path / "data" / "inventory.db")  # Not among the metric files
+    # This process is a worker too: it counts the shared inventory before the others change it
+    inventory = SQLiteInventory(db_path)
+    low_stock = LowStockPercentage(10)
+    low_stock.update_inventory(inventory)
+    inventory.add_listener(low_stock.on_change)
+
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=run_worker, args=(10, 9, [1, 2], db_path, [("i0", 50), ("i1", 50)])),
+        context.Process(target=run_worker, args=(30, 3, [4], db_path, [("i2", 50)])),
+        context.Process(target=run_worker, args=(0, 0, [], db_path, [("i3", 1)])),
+    ]
+    for worker in workers:
+        worker.start()
+        worker.join()
+        assert worker.exitcode == 0
+    inventory.take("i0", 45)
+
+    registry = multiprocess_registry(PurchaseSuccessRatio(), low_stock)
+    samples = {sample.name: sample.value for family in registry.collect() for sample in family.samples
+               if sample.labels.get("price_band", "10To100") == "10To100"}
+    assert samples["purchase_attempts_total"] == 40
+    assert samples["purchase_success_ratio"] == 12 / 40
+    assert samples["purchase_units_sum"] == 7 and samples["purchase_units_count"] == 3
+    # Low stock covers the changes of every worker: i0 (5) and i3 (1) of the 4 items are low
+    assert samples["low_stock_percentage"] == 50.0
+    inventory.add(make_item("i4", 50))
+    assert low_stock.get_percentage() == 40.0
+    inventory.close()
+
+
+# Instrumentation Tests
+
+class HookRecorder(PrometheusMetricsBase):
+    hits = metric(Counter, 'hook_recorder_hits', 'Requests seen by the hooks', ['status'])
+    route_latency = metric(Histogram, 'hook_recorder_latency_seconds', 'Decorated route latency', ['route'])
+
+    def before_request(self, scope):
+        return scope["path"]
+
+    def after_request(self, scope, status_code, state):
+        assert state == scope["path"]
+        self.hits.labels(status=str(status_code)).inc()
+
+
+def test_instrumentation_calls_hooks_and_times_routes():
+    registry = CollectorRegistry()
+    app = FastAPI()
+    recorder = HookRecorder(app, registry=registry, metrics_path="/metrics")
+
+    @app.get("/hello")
+    @recorder.metric_decorator(recorder.route_latency.labels(route="/hello"))
+    async def hello():
+        return {"hello": "world"}
+
+    client = TestClient(app)
+    assert client.get("/hello").json() == {"hello": "world"}
+    assert client.get("/missing").status_code == 404
+    assert b"hook_recorder_hits_total" in client.get("/metrics").content
+
+    assert registry.get_sample_value("hook_recorder_hits_total", {"status": "200"}) == 2  # /hello and /metrics
+    assert registry.get_sample_value("hook_recorder_hits_total", {"status": "404"}) == 1
+    assert registry.get_sample_value("hook_recorder_latency_seconds_count", {"route": "/hello"}) == 1
+
+
+# Admission-control Tests
+
+def test_admission_sheds_excess_purchases_and_keeps_reads_flowing():
+    registry = CollectorRegistry()
+    app = FastAPI()
+    admission = AdmissionControl(
+        {"read": LaneSettings(10, 1, 10, 10, 1.0), "purchase": LaneSettings(1, 1, 1, 1, 0.1)},
+        lambda scope: None if scope["path"] == "/metrics" else "read" if scope["method"] == "GET" else "purchase",
+        registry=registry,
+    )
+    admission.instrument(app)
+
+    @app.post("/buy")
+    async def buy():
+        await asyncio.sleep(0.3)
+        return {"bought": True}
+
+    @app.get("/")
+    async def listing():
+        return []
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            buys = [asyncio.create_task(client.post("/buy")) for _ in range(3)]
+            await asyncio.sleep(0.05)
+            listing_response = await client.get("/")
+            return listing_response, await asyncio.gather(*buys)
+
+    listing_response, buys = asyncio.run(scenario())
+    assert listing_response.status_code == 200
+    # One purchase runs, one waits out its queue budget, one finds the queue full
+    assert sorted(response.status_code for response in buys) == [200, 503, 503]
+    shed = [response for response in buys if response.status_code == 503]
+    assert all(int(response.headers["retry-after"]) >= 1 for response in shed)
+    assert registry.get_sample_value("admission_shed_total", {"lane": "purchase", "reason": "queue_full"}) == 1
+    assert registry.get_sample_value("admission_shed_total", {"lane": "purchase", "reason": "queue_timeout"}) == 1
+    assert registry.get_sample_value("admission_in_flight", {"lane": "purchase"}) == 0
+    assert registry.get_sample_value("admission_queued", {"lane": "purchase"}) == 0
+
+
+def test_adaptive_limit_follows_latency():
+    limit = AdaptiveLimit(20, min_limit=2, max_limit=100)
+    for _ in range(50):
+        limit.on_sample(0.01, in_flight=20)
+    grown = limit.value
+    assert grown > 20
+
+    limit.on_sample(0.01, in_flight=1)  # Mostly idle: says nothing about the capacity
+    assert limit.value == grown
+
+    for _ in range(20):
+        limit.on_sample(0.2, in_flight=int(limit.value))
+    assert limit.value < grown / 2
+
+
+def test_adaptive_limit_averages_latency_with_its_smoothing_parameters():
+    limit = AdaptiveLimit(20, latency_smoothing=0.5, baseline_smoothing=0.25)
+    limit.on_sample(0.1, in_flight=0)
+    limit.on_sample(0.3, in_flight=0)
+    assert limit.current == pytest.approx(0.2) and limit.baseline == pytest.approx(0.15)
+
+
+def test_retry_after_spreads_shed_clients_over_the_estimate():
+    admission = AdmissionControl({"purchase": LaneSettings(1, 1, 1, 1, 0.5)}, lambda scope: "purchase",
+                                 registry=CollectorRegistry())
+    lane = admission.lanes["purchase"]
+    lane.limit.current = 1.5  # Two seconds to serve the request ahead
+    assert {lane.retry_after() for _ in range(500)} == set(range(2, 9))
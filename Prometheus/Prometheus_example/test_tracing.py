@@ -0,0 +1,103 @@
+import asyncio
+import threading
+import time
+
+import httpx
+from fastapi import FastAPI, HTTPException
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SpanExportResult
+from prometheus_client import REGISTRY
+
+from prom.main.utils.tracing_sdk import TailKeepingSpanProcessor, make_sampler
+
+
+class RecordingExporter:
+    def __init__(self, stall=None):
+        self.spans = []
+        self.stall = stall
+
+    def export(self, spans):
+        if self.stall is not None:
+            self.stall.wait()
+        self.spans.extend(spans)
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+def traced_app(ratio, exporter, **processor_options):
+    app = FastAPI()
+
+    @app.get("/ok")
+    async def ok():
+        return {"ok": True}
+
+    @app.get("/slow")
+    async def slow():
+        await asyncio.sleep(0.06)
+        return {"ok": True}
+
+    @app.get("/fail")
+    async def fail():
+        raise HTTPException(status_code=500)
+
+    @app.get("/metrics")
+    async def metrics():
+        return "metrics"
+
+    provider = TracerProvider(sampler=make_sampler(ratio, ["/metrics"]))
+    processor = TailKeepingSpanProcessor(exporter, schedule_delay=0.01, slow_threshold=0.05, **processor_options)
+    provider.add_span_processor(processor)
+    FastAPIInstrumentor.instrument_app(app, tracer_provider=provider, exclude_spans=["receive", "send"])
+    return app, processor
+
+
+async def get_all(app, paths):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return [await client.get(path) for path in paths]
+
+
+def traced_paths(exporter):
+    return {span.attributes.get("http.target") or span.attributes.get("url.path")
+            for span in exporter.spans if span.parent is None}
+
+
+def test_sampling_keeps_errors_and_slow_requests_and_skips_metrics():
+    exporter = RecordingExporter()
+    app, processor = traced_app(0.0, exporter)
+    asyncio.run(get_all(app, ["/ok", "/slow", "/fail", "/metrics"]))
+    processor.force_flush()
+    assert traced_paths(exporter) == {"/slow", "/fail"}
+
+    exporter = RecordingExporter()
+    app, processor = traced_app(1.0, exporter)
+    asyncio.run(get_all(app, ["/ok", "/metrics"]))
+    processor.force_flush()
+    assert traced_paths(exporter) == {"/ok"}
+
+
+def test_stalled_exporter_drops_spans_without_slowing_requests():
+    dropped_before = REGISTRY.get_sample_value('otel_spans_dropped_total', {'reason': 'queue_full'}) or 0
+    stall = threading.Event()
+    exporter = RecordingExporter(stall=stall)
+    app, processor = traced_app(1.0, exporter, max_queue_size=5, max_export_batch_size=5)
+
+    async def scenario():
+        latencies = []
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            for _ in range(50):
+                start = time.perf_counter()
+                await client.get("/ok")
+                latencies.append(time.perf_counter() - start)
+        return latencies
+
+    latencies = asyncio.run(scenario())
+    stall.set()
+    processor.shutdown()
+    # The collector never answered while the requests ran, yet none of them waited on it
+    assert max(latencies) < 0.5
+    dropped = REGISTRY.get_sample_value('otel_spans_dropped_total', {'reason': 'queue_full'}) - dropped_before
+    assert dropped > 0
+    assert len(exporter.spans) <= 10